@@ -11,6 +11,7 @@ GET  /rooms                 - Alle Zimmer
 GET  /rooms/<zimm>          - Ein Zimmer
 GET  /categories            - Alle Kategorien
 GET  /availability          - Verfuegbare Zimmer pruefen
+GET  /availability/matrix   - Freie Zimmer pro Tag und Kategorie
 GET  /bookings              - Buchungen auflisten
 GET  /bookings/<resn>       - Eine Buchung
 GET  /guests                - Gaeste suchen
@@ -20,6 +21,12 @@ GET  /articles              - Alle Artikel/Leistungen
 GET  /channels              - Alle Buchungskanaele
 GET  /calendar              - Belegungskalender
 GET  /stats                 - Statistiken
+POST /reference/invalidate  - Stammdaten-Cache leeren (?name=rooms, ...)
+GET  /fingerprints          - Aenderungs-Versionen pro Tabelle
+GET  /cache/stats           - Response-Cache (Eintraege, Treffer pro Route)
+GET  /metrics               - Metriken fuer Prometheus (HTTP, DB-Pool, Backup)
+GET  /debug/queries         - SQL-Laufzeiten pro Statement, Slow-Log
+?__profile=1|collapsed      - Request profilieren (Header X-Profile-Token, siehe README)
 
 POST   /option              - Neue Option anlegen
 PUT    /book/<resn>         - Option zur Buchung wandeln
@@ -76,13 +83,25 @@ POST /backup/cleanup        - Alte Backups aufraeumen
 (c) 2024-2025 - Hotel Stadler Bridge
 """
 
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
-import pyodbc
+import hmac
 import json
 import os
+import time
 from datetime import datetime, timedelta
 from functools import wraps
+from urllib.parse import urlencode
+
+from capcorn_core import (
+    CALENDAR_MAX_DAYS, COMPRESS_MIN_BYTES, METRICS_CONTENT_TYPE, PROFILE_MODES,
+    QUERY_SORT_KEYS, SIZE_BUCKETS, AccountPoster, AvailabilityIndex, ConnectionPool,
+    Metrics, QueryStats, ReferenceCache, RequestProfile, ResponseCache, RoomLockTimeout,
+    RoomLocks, SequenceAllocator, SingleFlight, TableFingerprints, WriteQueue, body_etag,
+    build_calendar, compress_body, database_backend, decode_cursor, encoded_etag,
+    etag_matches, install_json_provider, iter_cursor_rows, keyset_page, ndjson_stream,
+    negotiate_encoding, profile_phase, row_encoder, version_etag
+)
 
 # ============================================================================
 # CONFIGURATION
@@ -109,53 +128,295 @@ config = load_config()
 app = Flask(__name__)
 CORS(app)  # Cross-Origin fuer Web-Apps erlauben
 
+# Schnellster installierter JSON-Encoder fuer jsonify() und NDJSON (orjson > ujson > json)
+JSON_BACKEND, json_dumps = install_json_provider(app, config.get('json_backend'))
+
+# ============================================================================
+# METRIKEN (GET /metrics, Prometheus-Textformat)
+# ============================================================================
+
+metrics = Metrics(prefix='capcorn_')
+http_requests = metrics.counter(
+    'http_requests_total', "HTTP-Anfragen pro Route und Status", ('method', 'route', 'status'))
+http_latency = metrics.histogram(
+    'http_request_duration_seconds', "Antwortzeit pro Route (Streams: bis zum ersten Byte)",
+    ('method', 'route'))
+http_in_flight = metrics.gauge('http_requests_in_flight', "Gerade laufende HTTP-Anfragen")
+http_size = metrics.histogram(
+    'http_response_size_bytes', "Antwortgroesse nach Kompression (ohne Streams)",
+    ('method', 'route'), buckets=SIZE_BUCKETS)
+backup_runs = metrics.counter('backup_runs_total', "Backup-Laeufe nach Ergebnis", ('result',))
+backup_duration = metrics.histogram(
+    'backup_duration_seconds', "Dauer eines Backups (ohne uebersprungene)",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+backup_size = metrics.gauge('backup_last_size_bytes', "Groesse des letzten Backups")
+backup_written = metrics.counter('backup_written_bytes_total', "Insgesamt geschriebene Backup-Bytes")
+backup_last_success = metrics.gauge(
+    'backup_last_success_timestamp_seconds', "Zeitpunkt des letzten erfolgreichen Backups (Unix)")
+
+def metrics_route():
+    """Route-Label: Regel statt URL, damit IDs keine eigenen Zeitreihen erzeugen"""
+    return request.url_rule.rule if request.url_rule is not None else "(unbekannt)"
+
+@app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    http_in_flight.inc()
+
+@app.after_request
+def record_request_metrics(response):
+    # Als erster after_request-Hook registriert, laeuft also als letzter
+    # (nach ETag/Kompression) und sieht die tatsaechliche Antwortgroesse
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route, method = metrics_route(), request.method
+        http_latency.observe(time.perf_counter() - started, method=method, route=route)
+        http_requests.inc(method=method, route=route, status=response.status_code)
+        if not response.is_streamed:
+            http_size.observe(response.content_length or 0, method=method, route=route)
+    return response
+
+@app.teardown_request
+def finish_request_metrics(exc=None):
+    http_in_flight.dec()
+
+@metrics.collect
+def pool_metrics():
+    stats = db_pool.stats()
+    return [
+        ('db_connections', 'gauge', "DB-Verbindungen im Pool nach Zustand",
+         [({'state': state}, stats[state]) for state in ('open', 'idle', 'in_use')]),
+        ('db_connections_max', 'gauge', "Maximale Pool-Groesse (db_pool_size)", [({}, stats['max_size'])]),
+        ('db_pool_events_total', 'counter', "Pool-Ereignisse (Verbindung neu, wiederverwendet, ...)",
+         [({'event': event}, stats[event])
+          for event in ('created', 'reused', 'evicted', 'discarded', 'waits', 'timeouts')]),
+    ]
+
+def record_backup(result, seconds):
+    """Ergebnis von create_backup in die Metriken uebernehmen"""
+    if result.get('skipped'):
+        backup_runs.inc(result='skipped')
+        return
+    if not result.get('success'):
+        backup_runs.inc(result='error')
+        return
+    backup_runs.inc(result='success')
+    backup_duration.observe(seconds)
+    backup_last_success.set(time.time())
+    path = result.get('backup_path')
+    if path and os.path.exists(path):
+        size = os.path.getsize(path)
+        backup_size.set(size)
+        backup_written.inc(size)
+
+# ============================================================================
+# PROFILING (?__profile=1 oder Header X-Profile, nur mit profile_token)
+# ============================================================================
+
+def profile_mode():
+    """Angeforderter Profil-Modus: 1/tree (cProfile) oder collapsed (Stichproben)"""
+    return request.args.get('__profile') or request.headers.get('X-Profile')
+
+@app.before_request
+def start_profile():
+    mode = profile_mode()
+    if not mode:
+        return None
+    token = config.get('profile_token')
+    if not token:
+        return jsonify({"error": "Profiling ist nicht aktiviert (profile_token in config.json setzen)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', '').encode(), str(token).encode()):
+        return jsonify({"error": "Profiling-Token fehlt oder ist ungueltig (Header X-Profile-Token)"}), 403
+    if mode not in PROFILE_MODES:
+        return jsonify({"error": f"Unbekannter Profil-Modus: {mode} (1, tree oder collapsed)"}), 400
+    profile = RequestProfile.start(mode, interval=config.get('profile_interval_ms', 1) / 1000)
+    if profile is None:
+        return jsonify({"error": "Es laeuft bereits ein Profil, bitte gleich nochmal versuchen"}), 409
+    g.profile = profile
+    return None
+
+@app.after_request
+def profile_response(response):
+    """
+    Profil statt der Antwort liefern. Laeuft nach ETag/Kompression, Streams
+    werden hier komplett erzeugt und damit mitgemessen. Mit
+    Accept: application/json kommt alles als JSON (inkl. Original-Antwort).
+    """
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    body = response.get_data()
+    profile.stop()
+
+    summary = profile.summary()
+    summary.update(request=f"{request.method} {request.full_path.rstrip('?')}",
+                   status=response.status_code, bytes=len(body))
+    if request.accept_mimetypes.best == 'application/json':
+        summary['profile'] = profile.output()
+        if response.is_json and 'Content-Encoding' not in response.headers:
+            summary['response'] = response.get_json(silent=True)
+        return jsonify(summary)
+
+    phases = summary['phases_ms']
+    header = (
+        f"# {summary['request']} -> {response.status_code}, {len(body)} Bytes, Modus {profile.mode}\n"
+        f"# gesamt {summary['total_ms']} ms | DB execute {phases['db_execute']} ms "
+        f"({summary['statements']} Statements) | DB fetch {phases['db_fetch']} ms | "
+        f"serialize {phases['serialize']} ms | encode {phases['encode']} ms | Rest {phases['rest']} ms\n"
+    )
+    result = Response(header + profile.output(), mimetype='text/plain')
+    result.headers['X-Profiled-Status'] = str(response.status_code)
+    return result
+
+@app.teardown_request
+def stop_profile(exc=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
 # ============================================================================
 # DATABASE CONNECTION
 # ============================================================================
 
+def query_context():
+    """Route des laufenden Requests fuer die Abfrage-Statistik (sonst Thread-Name)"""
+    if has_request_context() and request.url_rule is not None:
+        return f"{request.method} {request.url_rule.rule}"
+    return None
+
+# Laufzeit pro SQL-Fingerprint fuer /debug/queries, Slow-Log ab slow_query_ms
+query_stats = QueryStats(
+    slow_ms=config.get('slow_query_ms', 250),
+    slow_log_size=config.get('slow_query_log_size', 200),
+    context=query_context,
+    on_slow=lambda entry: print(f"[SlowQuery] {entry['total_ms']:.0f} ms {entry['route']}: {entry['sql'][:200]}")
+)
+
+def connect_db():
+    """
+    Neue Verbindung herstellen (ohne Pool). "db_backend": "access" (Standard,
+    pyodbc + Access-Treiber) oder "sqlite" (Nachbildung des Schemas zum
+    Testen/Benchmarken, database_path = .sqlite-Datei)
+    """
+    conn = database_backend(config.get('db_backend'), config['database_path']).connect()
+    return query_stats.wrap(conn) if config.get('query_stats', True) else conn
+
+# Verbindungs-Pool: ein Access-Connect kostet zig Millisekunden
+db_pool = ConnectionPool(
+    connect_db,
+    max_size=config.get('db_pool_size', 8),
+    max_idle=config.get('db_pool_max_idle', 300),
+    health_query="SELECT TOP 1 zimm FROM ZIM"
+)
+
 def get_db():
-    """Verbindung zur Access-Datenbank herstellen"""
-    conn_str = f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={config['database_path']}"
-    return pyodbc.connect(conn_str)
+    """Verbindung aus dem Pool holen (close() gibt sie an den Pool zurueck)"""
+    return db_pool.acquire()
+
+@app.before_request
+def bind_request_connection():
+    """Eine Pool-Verbindung fuer den ganzen Request verwenden"""
+    db_pool.begin_scope()
+
+@app.teardown_request
+def release_request_connection(exc=None):
+    db_pool.end_scope()
 
 def db_query(query, params=None, fetchone=False):
     """Datenbank-Query ausfuehren und Ergebnis als Liste von Dicts zurueckgeben"""
-    conn = get_db()
-    cursor = conn.cursor()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
 
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
 
-    # Spaltennamen holen
-    columns = [column[0] for column in cursor.description] if cursor.description else []
+        # Spaltennamen holen
+        columns = [column[0] for column in cursor.description] if cursor.description else []
 
-    if fetchone:
-        row = cursor.fetchone()
-        result = dict(zip(columns, row)) if row else None
-    else:
-        rows = cursor.fetchall()
-        result = [dict(zip(columns, row)) for row in rows]
+        if fetchone:
+            row = cursor.fetchone()
+            with profile_phase('serialize'):
+                result = dict(zip(columns, row)) if row else None
+        else:
+            rows = cursor.fetchall()
+            with profile_phase('serialize'):
+                result = [dict(zip(columns, row)) for row in rows]
 
-    conn.close()
     return result
 
+def db_rows(query, params=None, dates='iso'):
+    """Query ausfuehren, Zeilen direkt JSON-fertig (Encoder aus cursor.description)"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        rows = cursor.fetchall()
+        with profile_phase('serialize'):
+            encode = row_encoder(cursor.description or (), dates)
+            return [encode(row) for row in rows]
+
 def db_execute(query, params=None):
     """Datenbank-Query ausfuehren (INSERT, UPDATE, DELETE)"""
-    conn = get_db()
-    cursor = conn.cursor()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
 
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        conn.commit()
+        affected = cursor.rowcount
 
-    conn.commit()
-    affected = cursor.rowcount
-    conn.close()
     return affected
 
+# ============================================================================
+# SCHREIB-QUEUE (kleine Schreibzugriffe gebuendelt committen)
+# ============================================================================
+
+# Check-in/-out, Abmeldung, Gast-Aenderung, Leistungsbuchung: ein Schreib-
+# Thread mit eigener Verbindung statt vieler paralleler Access-Schreiber
+write_queue = WriteQueue(
+    connect_db,
+    window=config.get('write_queue_window_ms', 5) / 1000,
+    max_batch=config.get('write_queue_batch', 64),
+    timeout=config.get('write_queue_timeout', 30)
+)
+
+def queued_write(op):
+    """
+    op(conn) ueber die Schreib-Queue ausfuehren (op committet nicht selbst)
+    und das Ergebnis zurueckgeben. Mit "write_queue": false direkt auf
+    einer Pool-Verbindung.
+    """
+    if not config.get('write_queue', True):
+        with db_pool.connection() as conn:
+            try:
+                result = op(conn)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+    return write_queue.run(op)
+
+def queued_execute(query, params=None):
+    """Wie db_execute, aber ueber die Schreib-Queue; gibt rowcount zurueck"""
+    def op(conn):
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        return cursor.rowcount
+    return queued_write(op)
+
 def serialize_row(row):
     """Konvertiert Datenbankzeile zu JSON-serialisierbarem Dict"""
     result = {}
@@ -166,6 +427,439 @@ def serialize_row(row):
             result[key] = value
     return result
 
+# ============================================================================
+# NDJSON-STREAMING
+# ============================================================================
+
+def wants_stream():
+    """Streaming angefordert? (?stream=1 oder Accept: application/x-ndjson)"""
+    return (request.args.get('stream') == '1'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def stream_query(query, params=None, serialize=None, limit=None, key=None):
+    """
+    Query-Ergebnis zeilenweise als NDJSON streamen (fetchmany statt fetchall).
+    Die Query laeuft sofort, damit SQL-Fehler noch als normaler 500er
+    zurueckkommen. Der Stream bekommt eine eigene Verbindung (nicht die des
+    Request-Scopes), die bis zum Ende des Streams belegt bleibt.
+    """
+    conn = db_pool.acquire(scoped=False)
+    try:
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            yield from ndjson_stream(iter_cursor_rows(cursor), serialize, limit, key, dumps=json_dumps)
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def invoice_row(inv):
+    """Gesamtbetrag (pmv1-3) an eine Rechnungszeile aus db_rows haengen"""
+    inv['total'] = abs(inv.get('pmv1') or 0) + abs(inv.get('pmv2') or 0) + abs(inv.get('pmv3') or 0)
+    return inv
+
+# ============================================================================
+# TABELLEN-FINGERPRINTS
+# ============================================================================
+
+# (Schluesselspalte, Aggregate) - eine billige Query pro Tabelle erkennt
+# Aenderungen, auch solche aus dem CapCorn-Client. Summen sind mit dem
+# Schluessel gewichtet (CDbl gegen Long-Ueberlauf): vertauschte Zimmer,
+# umgehaengte Kontozeilen und geaenderte Textlaengen verschieben die Summe.
+TABLE_FINGERPRINTS = {
+    'GKT': ('gast', ['COUNT(*)', 'MAX(gast)', 'SUM(CDbl(gast)*LEN(vorn))',
+                     'SUM(CDbl(gast)*LEN(nacn))', 'SUM(CDbl(gast)*LEN(mail))',
+                     'SUM(CDbl(gast)*LEN(teln))', 'SUM(CDbl(gast)*LEN(stra))',
+                     'SUM(CDbl(gast)*LEN(polz))', 'SUM(CDbl(gast)*LEN(ortb))',
+                     'SUM(CDbl(gast)*LEN(land))']),
+    'BUC': ('resn', ['COUNT(*)', 'MAX(resn)', 'SUM(CDbl(resn)*gast)', 'SUM(CDbl(stat))',
+                     'SUM(CDbl(resn)*chid)', 'SUM(CDbl(resn)*flgl)', 'SUM(CDbl(andf))',
+                     'SUM(CDbl(ande))', 'MAX(bdat)', 'SUM(CDbl(resn)*LEN(extn))']),
+    'BUZ': ('resn', ['COUNT(*)', 'MAX(resn)', 'SUM(CDbl(resn)*zimm)', 'SUM(zimm*CDbl(vndt))',
+                     'SUM(zimm*CDbl(bsdt))', 'SUM(CDbl(resn)*ckin)', 'SUM(CDbl(resn)*pers)']),
+    'AKZ': ('aknr', ['COUNT(*)', 'MAX(aknr)', 'SUM(prei)', 'SUM(CDbl(aknr)*resn)',
+                     'SUM(CDbl(aknr)*prei)', 'SUM(CDbl(aknr)*artn)']),
+    'REC': ('rnum', ['COUNT(*)', 'MAX(rnum)', 'SUM(CDbl(rnum)*gast)', 'SUM(CDbl(rnum)*pmt1)',
+                     'SUM(CDbl(rnum)*pmv1)', 'SUM(CDbl(rnum)*pmv2)', 'SUM(CDbl(rnum)*pmv3)',
+                     'SUM(CDbl(rnum)*CDbl(edat))']),
+    'ANM': ('annr', ['COUNT(*)', 'MAX(annr)', 'SUM(CDbl(annr)*resn)', 'SUM(CDbl(annr)*stat)',
+                     'SUM(CDbl(annr)*pers)']),
+    'ZIM': ('zimm', ['COUNT(*)', 'MAX(zimm)', 'SUM(CDbl(zimm)*stat)', 'SUM(CDbl(zimm)*catg)',
+                     'SUM(CDbl(zimm)*maxv)', 'SUM(CDbl(zimm)*LEN(bett))',
+                     'SUM(CDbl(zimm)*LEN(beze))']),
+    'CAT': ('catg', ['COUNT(*)', 'MAX(catg)', 'SUM(CDbl(catg)*maxv)', 'SUM(CDbl(catg)*prwa)',
+                     'SUM(CDbl(catg)*prsa)', 'SUM(CDbl(catg)*LEN(beze))']),
+    'ART': ('artn', ['COUNT(*)', 'MAX(artn)', 'SUM(CDbl(artn)*prei)', 'SUM(CDbl(artn)*LEN(knto))',
+                     'SUM(CDbl(artn)*LEN(beze))']),
+    'CHC': ('chid', ['COUNT(*)', 'MAX(chid)', 'SUM(CDbl(chid)*LEN(name))']),
+    'GKI': ('gkid', ['COUNT(*)', 'MAX(gkid)', 'SUM(CDbl(gkid)*LEN(nacn))',
+                     'SUM(CDbl(gkid)*LEN(vorn))']),
+    'PMT': ('paym', ['COUNT(*)', 'MAX(paym)', 'SUM(CDbl(paym)*LEN(payt))'])
+}
+
+fingerprints = TableFingerprints(
+    lambda sql, params: db_query(sql, params, fetchone=True),
+    interval=config.get('fingerprint_interval', 30)
+)
+# Texte sehen diese Fingerprints nur ueber die Laenge - eine gleich lange
+# Aenderung (Umbenennung) bleibt unerkannt, ETags kommen dann aus dem Body
+LENGTH_ONLY_FINGERPRINTS = {'GKT', 'BUC', 'ZIM', 'CAT', 'ART', 'CHC', 'GKI', 'PMT'}
+
+for _table, (_key, _aggregates) in TABLE_FINGERPRINTS.items():
+    fingerprints.register(_table, _key, _aggregates, exact=_table not in LENGTH_ONLY_FINGERPRINTS)
+
+# ============================================================================
+# NUMMERNKREISE (resn, gast, aknr, annr, gkid)
+# ============================================================================
+
+# Nummern werden im Prozess vergeben; MAX wird nur neu gelesen, wenn der
+# letzte Hintergrund-Poll einen Schluessel ab der naechsten Nummer zeigt
+# (vom CapCorn-Client vergeben) - keine DB-Abfrage auf dem Vergabe-Pfad
+sequences = SequenceAllocator(
+    lambda table, column: db_query(f"SELECT MAX({column}) AS m FROM {table}", fetchone=True)['m'],
+    probe=lambda table: fingerprints.known_max(table)
+)
+for _table, _column in (('BUC', 'resn'), ('GKT', 'gast'), ('AKZ', 'aknr'),
+                        ('ANM', 'annr'), ('GKI', 'gkid')):
+    sequences.register(_table, _column)
+fingerprints.watch(('BUC', 'GKT', 'AKZ', 'ANM', 'GKI'))
+
+# Kontobuchungen: aknr-Block reservieren, dann ein executemany pro Aufruf
+account_poster = AccountPoster(
+    lambda count: sequences.reserve('AKZ', count),
+    fast_executemany=config.get('fast_executemany', False)
+)
+
+# ============================================================================
+# VERFUEGBARKEITS-INDEX
+# ============================================================================
+
+def load_active_room_bookings():
+    """Aktive Zimmerbelegungen (Angebote und Bestaetigte) fuer den Index"""
+    return db_query("""
+        SELECT BUZ.resn, BUZ.zimm, BUZ.vndt, BUZ.bsdt
+        FROM BUZ INNER JOIN BUC ON BUZ.resn = BUC.resn
+        WHERE BUC.stat IN (0, 2)
+    """)
+
+def probe_room_bookings():
+    """Versionen von BUZ/BUC aus dem Fingerprint-Dienst"""
+    return tuple(fingerprints.versions(('BUZ', 'BUC')).values())
+
+MATRIX_MAX_DAYS = 366
+
+availability_index = AvailabilityIndex(
+    load_active_room_bookings,
+    probe_room_bookings,
+    check_interval=config.get('availability_check_interval', 5)
+)
+
+def room_conflict_precheck(zimm, von, bis):
+    """Schnelle Vorpruefung ueber den Index (True = Zimmer sicher belegt)
+
+    Bei Problemen mit dem Index False - dann entscheidet die DB-Pruefung.
+    """
+    try:
+        return bool(availability_index.conflicts(int(zimm), von, bis))
+    except Exception as e:
+        print(f"[Availability] Index-Vorpruefung uebersprungen: {e}")
+        return False
+
+# Pruefen + Anlegen pro Zimmer serialisieren, damit zwei gleichzeitige
+# Anfragen fuer dasselbe Zimmer nicht beide die Pruefung bestehen
+room_locks = RoomLocks(timeout=config.get('room_lock_timeout', 10))
+
+def room_locked(func):
+    """
+    Decorator fuer Routen, die ein Zimmer belegen ("zimm" im JSON Body):
+    die Route laeuft unter der Sperre dieses Zimmers, andere Zimmer parallel.
+    Ist die Sperre nach room_lock_timeout Sekunden nicht frei: 503.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        zimm = (request.get_json(silent=True) or {}).get('zimm')
+        if not zimm:
+            return func(*args, **kwargs)
+        try:
+            with room_locks.hold(str(zimm)):
+                return func(*args, **kwargs)
+        except RoomLockTimeout:
+            return jsonify({"error": f"Zimmer {zimm} wird gerade gebucht, bitte erneut versuchen"}), 503
+    return wrapper
+
+# ============================================================================
+# STAMMDATEN-CACHE
+# ============================================================================
+
+ref_cache = ReferenceCache(
+    ttl=config.get('reference_cache_ttl', 600),
+    check_interval=config.get('reference_check_interval', 30)
+)
+
+def register_reference(name, query, table):
+    """Tabelle im Stammdaten-Cache anmelden (Aenderung = neue Fingerprint-Version)"""
+    ref_cache.register(
+        name,
+        lambda: db_query(query),
+        lambda: fingerprints.version(table)
+    )
+
+register_reference(
+    'rooms',
+    "SELECT zimm, beze, bett, stat, catg, betm, maxv, type FROM ZIM ORDER BY zimm",
+    'ZIM'
+)
+register_reference(
+    'categories',
+    """
+        SELECT catg, beze, bez1, bett, type, betm, maxv, maxe,
+               prwa, prwb, prwc, prwd, prwe,
+               prsa, prsb, prsc, prsd, prse
+        FROM CAT
+        ORDER BY catg
+    """,
+    'CAT'
+)
+register_reference(
+    'articles',
+    "SELECT artn, beze, prei, knto FROM ART ORDER BY artn",
+    'ART'
+)
+register_reference(
+    'channels',
+    "SELECT chid, name FROM CHC ORDER BY chid",
+    'CHC'
+)
+register_reference(
+    'payment_types',
+    "SELECT paym, payt, gknt, flag FROM PMT ORDER BY paym",
+    'PMT'
+)
+
+def rooms_with_category():
+    """Aktive Zimmer (stat = 0) mit Kategoriedaten - wie ZIM LEFT JOIN CAT"""
+    categories = ref_cache.index('categories', 'catg')
+    rooms = []
+    for room in ref_cache.get('rooms'):
+        if room['stat'] != 0:
+            continue
+        cat = categories.get(room['catg'], {})
+        rooms.append({
+            "zimm": room['zimm'],
+            "beze": room['beze'],
+            "bett": room['bett'],
+            "catg": room['catg'],
+            "betm": room['betm'],
+            "maxv": room['maxv'],
+            "kategorie": cat.get('beze'),
+            "prwa": cat.get('prwa'),
+            "prsa": cat.get('prsa')
+        })
+    return rooms
+
+def find_article(artn):
+    """Artikel (beze, prei, ...) aus dem Cache, None wenn unbekannt"""
+    try:
+        return ref_cache.lookup('articles', 'artn', int(artn))
+    except (TypeError, ValueError):
+        return None
+
+def find_hp_article():
+    """Artikelnummer fuer Halbpension (wie LIKE '%HP%' OR LIKE '%albpension%')"""
+    for article in ref_cache.get('articles'):
+        name = (article.get('beze') or '').lower()
+        if 'hp' in name or 'albpension' in name:
+            return article['artn']
+    return None
+
+def payment_type_names():
+    return {p['paym']: p['payt'] for p in ref_cache.get('payment_types')}
+
+# ============================================================================
+# HTTP-CACHING (ETag / 304) & KOMPRESSION
+# ============================================================================
+
+COMPRESS_MIN_BYTES = config.get('compress_min_bytes', COMPRESS_MIN_BYTES)
+
+def etag_from(tables=(), references=()):
+    """
+    Decorator: ETag aus den Fingerprint-Versionen der Tabellen bzw. den
+    Versionen der Stammdaten-Cache-Eintraege (+ URL und Tagesdatum).
+    Passt If-None-Match, kommt sofort 304 - ohne die Route auszufuehren.
+    Die Tabellen werden im Hintergrund beobachtet (fingerprints.watch).
+
+    Deckt ein Fingerprint den Inhalt nicht ab (LENGTH_ONLY_FINGERPRINTS),
+    bleibt die Route ohne Abkuerzung: den ETag bildet dann
+    conditional_and_compressed aus dem Body.
+    """
+    def decorator(func):
+        if not fingerprints.exact(tables):
+            return func
+        fingerprints.watch(tables)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = version_etag(
+                request.full_path,
+                datetime.now().date().isoformat(),
+                sorted(fingerprints.versions(tables).items()) if tables else (),
+                [ref_cache.version(name) for name in references]
+            )
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                return not_modified(etag)
+            response = app.make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                response.headers['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+def not_modified(etag):
+    response = app.response_class(status=304)
+    response.headers['ETag'] = etag
+    response.vary.add('Accept-Encoding')
+    return response
+
+@app.after_request
+def conditional_and_compressed(response):
+    """ETag + 304 fuer GET-Antworten, gzip/br ab COMPRESS_MIN_BYTES"""
+    if request.method in ('POST', 'PUT', 'DELETE'):
+        # Eigene Schreibzugriffe sofort sichtbar machen: bekannte Tabellen
+        # bekommen ohne DB-Abfrage eine neue Version, unbekannte werden beim
+        # naechsten ETag neu abgefragt
+        tables = getattr(app.view_functions.get(request.endpoint), 'writes_tables', None)
+        if tables is None:
+            response_cache.clear()
+            fingerprints.expire()
+        elif tables:
+            response_cache.invalidate_tables(tables)
+            fingerprints.touch(tables)
+        return response
+    if (request.method != 'GET' or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    etag = response.headers.get('ETag') or body_etag(body)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+
+    response.headers['ETag'] = etag
+    response.vary.add('Accept-Encoding')
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(compress_body(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+            response.headers['ETag'] = encoded_etag(etag, encoding)
+    return response
+
+# ============================================================================
+# SINGLE-FLIGHT (parallele identische GETs buendeln)
+# ============================================================================
+
+single_flight = SingleFlight(timeout=config.get('single_flight_timeout', 60))
+
+def request_key():
+    """Pfad + sortierte Query-Parameter - gleiche Anfrage, gleicher Schluessel"""
+    return request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+def snapshot_response(response):
+    """Antwort als (body, status, headers) - kann zwischen Requests geteilt werden"""
+    return response.get_data(), response.status_code, list(response.headers.items())
+
+def restore_response(snapshot):
+    body, status, headers = snapshot
+    return app.response_class(body, status=status, headers=headers)
+
+def coalesced(func):
+    """
+    Decorator: gleichzeitige identische GETs (Pfad + sortierte Query-Parameter)
+    teilen sich eine Ausfuehrung der Route. Abschaltbar global mit
+    "single_flight": false oder pro Route, z.B. "single_flight_disabled": ["/stats"].
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        rule = request.url_rule.rule if request.url_rule else request.path
+        if (not config.get('single_flight', True)
+                or rule in config.get('single_flight_disabled', ())
+                or wants_stream()):
+            return func(*args, **kwargs)
+
+        def compute():
+            return snapshot_response(app.make_response(func(*args, **kwargs)))
+
+        snapshot, _ = single_flight.do(request_key(), compute, group=rule)
+        return restore_response(snapshot)
+    return wrapper
+
+# ============================================================================
+# RESPONSE-CACHE (TTL pro Route, Invalidierung durch Schreib-Routen)
+# ============================================================================
+
+response_cache = ResponseCache(
+    max_bytes=int(config.get('response_cache_mb', 32) * 1024 * 1024),
+    max_entries=config.get('response_cache_entries', 1000)
+)
+
+# Aenderungen aus dem CapCorn-Client (Fingerprint-Poll) verwerfen ebenfalls
+fingerprints.subscribe(lambda table, version: response_cache.invalidate_tables([table]))
+
+def cached(ttl, tables):
+    """
+    Decorator fuer Lese-Routen: Antwort ttl Sekunden pro Pfad + Query aufbewahren.
+
+    tables = Tabellen, aus denen die Antwort gebaut wird; Schreib-Routen
+    (@writes) und erkannte Fremd-Aenderungen verwerfen genau diese Eintraege;
+    die Tabellen werden dafuer im Hintergrund beobachtet.
+    TTL pro Route ueberschreibbar: "response_cache_ttl": {"/calendar": 30}, 0 = aus.
+    """
+    def decorator(func):
+        fingerprints.watch(tables)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            rule = request.url_rule.rule
+            route_ttl = config.get('response_cache_ttl', {}).get(rule, ttl)
+            if (not config.get('response_cache', True) or not route_ttl or wants_stream()
+                    or g.get('profile') is not None):
+                return func(*args, **kwargs)
+
+            key = request_key()
+            snapshot = response_cache.get(key, group=rule)
+            if snapshot is not None:
+                return restore_response(snapshot)
+
+            generation = response_cache.generation(tables)
+            response = app.make_response(func(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                snapshot = snapshot_response(response)
+                response_cache.put(key, snapshot, len(snapshot[0]), route_ttl, tables,
+                                   generation=generation, group=rule)
+            return response
+        return wrapper
+    return decorator
+
+def writes(*tables):
+    """
+    Schreib-Route markieren: nach dem Request werden genau diese Tabellen im
+    Response-Cache und bei den Fingerprints verworfen. Nicht markierte
+    Schreib-Routen verwerfen vorsichtshalber alles.
+    """
+    def decorator(func):
+        func.writes_tables = tables
+        return func
+    return decorator
+
 # ============================================================================
 # ERROR HANDLING
 # ============================================================================
@@ -190,16 +884,18 @@ def index():
         "version": "1.0.0",
         "status": "running",
         "database": config['database_path'],
+        "db_backend": config.get('db_backend', 'access'),
         "timestamp": datetime.now().isoformat(),
         "endpoints": {
             "rooms": "/rooms",
             "categories": "/categories",
             "availability": "/availability?from=YYYY-MM-DD&to=YYYY-MM-DD",
+            "availability_matrix": "/availability/matrix?from=YYYY-MM-DD&to=YYYY-MM-DD",
             "bookings": "/bookings",
             "guests": "/guests",
             "articles": "/articles",
             "channels": "/channels",
-            "calendar": "/calendar?month=MM&year=YYYY",
+            "calendar": "/calendar?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD[&occupancy=rle]",
             "stats": "/stats",
             "checkin": "/checkin/<resn> (PUT)",
             "checkout": "/checkout/<resn> (PUT)",
@@ -219,23 +915,83 @@ def health():
     try:
         conn = get_db()
         conn.close()
-        return jsonify({"status": "healthy", "database": "connected"})
+        return jsonify({
+            "status": "healthy",
+            "database": "connected",
+            "pool": db_pool.stats(),
+            "availability_index": availability_index.stats(),
+            "reference_cache": ref_cache.stats(),
+            "json_encoder": JSON_BACKEND,
+            "single_flight": single_flight.stats(),
+            "response_cache": response_cache.stats(),
+            "sequences": sequences.stats(),
+            "account_poster": account_poster.stats(),
+            "room_locks": room_locks.stats(),
+            "write_queue": write_queue.stats()
+        })
     except Exception as e:
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        return jsonify({"status": "unhealthy", "error": str(e), "pool": db_pool.stats()}), 500
+
+@app.route('/cache/stats')
+def cache_stats():
+    """Response-Cache: Eintraege, Speicher, Treffer pro Route (?clear=1 leert ihn)"""
+    if request.args.get('clear') == '1':
+        response_cache.clear()
+    return jsonify(response_cache.stats())
+
+@app.route('/metrics')
+def get_metrics():
+    """Metriken fuer Prometheus (Textformat): HTTP, DB-Pool, Backup"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@app.route('/debug/queries')
+def debug_queries():
+    """SQL-Laufzeiten pro Statement (Fingerprint) und Slow-Log
+
+    Query-Parameter:
+    - sort=total|mean|p95|calls|rows|fetch (Standard: total)
+    - limit=50: Anzahl Statements / Slow-Log-Eintraege
+    - reset=1: Zaehler nach der Ausgabe zuruecksetzen
+    """
+    sort = request.args.get('sort', 'total')
+    if sort not in QUERY_SORT_KEYS:
+        return jsonify({"error": f"sort muss einer von {', '.join(QUERY_SORT_KEYS)} sein"}), 400
+    result = query_stats.stats(sort, request.args.get('limit', 50, type=int))
+    if request.args.get('reset') == '1':
+        query_stats.reset()
+    return jsonify(result)
+
+@app.route('/fingerprints')
+def get_fingerprints():
+    """Versionsnummer pro Tabelle (steigt bei jeder erkannten Aenderung)
+
+    Query-Parameter:
+    - refresh=1: sofort neu abfragen statt Werte bis fingerprint_interval zu verwenden
+    """
+    if request.args.get('refresh') == '1':
+        fingerprints.poll()
+    else:
+        fingerprints.versions()
+    return jsonify(fingerprints.stats())
+
+@app.route('/reference/invalidate', methods=['POST'])
+def invalidate_reference_data():
+    """Stammdaten-Cache leeren (optional ?name=rooms|categories|articles|channels|payment_types)"""
+    name = request.args.get('name')
+    if name and name not in ref_cache.stats():
+        return jsonify({"error": f"Unbekannte Stammdaten: {name}"}), 404
+    ref_cache.invalidate(name)
+    return jsonify({"success": True, "invalidated": name or "all"})
 
 # ============================================================================
 # ROUTES - ZIMMER
 # ============================================================================
 
 @app.route('/rooms')
+@etag_from(references=('rooms',))
 def get_rooms():
-    """Alle Zimmer auflisten"""
-    query = """
-        SELECT zimm, beze, bett, stat, catg, betm, maxv, type
-        FROM ZIM
-        ORDER BY zimm
-    """
-    rooms = db_query(query)
+    """Alle Zimmer auflisten (aus dem Stammdaten-Cache)"""
+    rooms = ref_cache.get('rooms')
     return jsonify({
         "count": len(rooms),
         "rooms": [serialize_row(r) for r in rooms]
@@ -255,16 +1011,10 @@ def get_room(zimm):
 # ============================================================================
 
 @app.route('/categories')
+@etag_from(references=('categories',))
 def get_categories():
-    """Alle Zimmerkategorien"""
-    query = """
-        SELECT catg, beze, bez1, bett, type, betm, maxv, maxe,
-               prwa, prwb, prwc, prwd, prwe,
-               prsa, prsb, prsc, prsd, prse
-        FROM CAT
-        ORDER BY catg
-    """
-    categories = db_query(query)
+    """Alle Zimmerkategorien (aus dem Stammdaten-Cache)"""
+    categories = ref_cache.get('categories')
     return jsonify({
         "count": len(categories),
         "categories": [serialize_row(c) for c in categories]
@@ -275,6 +1025,7 @@ def get_categories():
 # ============================================================================
 
 @app.route('/availability')
+@cached(30, ('BUZ', 'BUC', 'ZIM', 'CAT'))
 def check_availability():
     """
     Verfuegbare Zimmer fuer Zeitraum pruefen
@@ -293,34 +1044,20 @@ def check_availability():
     if not date_from or not date_to:
         return jsonify({"error": "Parameter 'from' und 'to' erforderlich"}), 400
 
-    # Belegte Zimmer im Zeitraum finden
-    query_booked = """
-        SELECT DISTINCT zimm FROM BUZ
-        WHERE vndt <= ? AND bsdt >= ?
-    """
-    booked = db_query(query_booked, (date_to, date_from))
-    booked_ids = [b['zimm'] for b in booked]
+    # Belegte Zimmer im Zeitraum aus dem Index (nur aktive Buchungen)
+    try:
+        booked_ids = availability_index.occupied_rooms(date_from, date_to)
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
 
-    # Alle Zimmer holen
-    query_rooms = """
-        SELECT ZIM.zimm, ZIM.beze, ZIM.bett, ZIM.catg, ZIM.betm, ZIM.maxv,
-               CAT.beze as kategorie, CAT.prwa, CAT.prsa
-        FROM ZIM
-        LEFT JOIN CAT ON ZIM.catg = CAT.catg
-        WHERE ZIM.stat = 0
-    """
-    all_rooms = db_query(query_rooms)
+    # Alle aktiven Zimmer mit Kategorie (Stammdaten-Cache)
+    all_rooms = rooms_with_category()
 
     # Freie Zimmer filtern
-    available = []
-    for room in all_rooms:
-        if room['zimm'] in booked_ids:
-            continue
-        if category and room['catg'] != category:
-            continue
-        if persons and (room['maxv'] or 2) < persons:
-            continue
-        available.append(serialize_row(room))
+    available = [
+        serialize_row(room)
+        for room in availability_index.free_rooms(all_rooms, date_from, date_to, category, persons)
+    ]
 
     return jsonify({
         "from": date_from,
@@ -331,11 +1068,71 @@ def check_availability():
         "available": available
     })
 
+@app.route('/availability/matrix')
+@cached(30, ('BUZ', 'BUC', 'ZIM', 'CAT'))
+@coalesced
+def availability_matrix():
+    """
+    Verfuegbarkeits-Matrix: freie Zimmer pro Tag und Kategorie
+
+    Query-Parameter:
+    - from: Startdatum (YYYY-MM-DD)
+    - to: Enddatum (YYYY-MM-DD, inklusive, max. 366 Tage)
+
+    Ein Zimmer gilt an einem Tag als belegt, wenn eine aktive Belegung
+    die Nacht ab diesem Tag belegt (Anreise <= Tag < Abreise, wie die
+    Belegung in /calendar) - der Abreisetag ist fuer die naechste Anreise frei.
+    """
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+
+    if not date_from or not date_to:
+        return jsonify({"error": "Parameter 'from' und 'to' erforderlich"}), 400
+
+    try:
+        start = datetime.strptime(date_from[:10], '%Y-%m-%d').date()
+        end = datetime.strptime(date_to[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
+
+    days = (end - start).days + 1
+    if days < 1:
+        return jsonify({"error": "'to' muss nach 'from' liegen"}), 400
+    if days > MATRIX_MAX_DAYS:
+        return jsonify({"error": f"Zeitraum zu lang (max. {MATRIX_MAX_DAYS} Tage)"}), 400
+
+    rooms = [r for r in ref_cache.get('rooms') if r['stat'] == 0]
+    categories = list(ref_cache.get('categories'))
+    matrix = availability_index.free_matrix(rooms, start, end)
+
+    empty = {"rooms": 0, "free": [0] * days, "max_free": [0] * days}
+    known = {c['catg'] for c in categories}
+    # Zimmer mit unbekannter Kategorie nicht unterschlagen
+    categories += [{"catg": catg, "beze": None} for catg in matrix if catg not in known]
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        "total_rooms": len(rooms),
+        "categories": [
+            {
+                "catg": c['catg'],
+                "beze": c['beze'],
+                "total_rooms": matrix.get(c['catg'], empty)['rooms'],
+                "free": matrix.get(c['catg'], empty)['free'],
+                "max_free_persons": matrix.get(c['catg'], empty)['max_free']
+            }
+            for c in categories
+        ]
+    })
+
 # ============================================================================
 # ROUTES - BUCHUNGEN
 # ============================================================================
 
 @app.route('/bookings')
+@cached(30, ('BUC', 'GKT'))
 def get_bookings():
     """
     Buchungen auflisten
@@ -345,16 +1142,19 @@ def get_bookings():
     - to: Bis Datum (YYYY-MM-DD)
     - status: Status-Filter
     - channel: Channel-ID
-    - limit: Max. Anzahl (default 100)
+    - limit: Max. Anzahl pro Seite (default 100)
+    - cursor: next_cursor der vorherigen Seite
+    - stream=1 (oder Accept: application/x-ndjson): zeilenweise als NDJSON
     """
-    limit = request.args.get('limit', 100, type=int)
+    limit = max(1, request.args.get('limit', 100, type=int))
     date_from = request.args.get('from')
     date_to = request.args.get('to')
     status = request.args.get('status', type=int)
     channel = request.args.get('channel', type=int)
+    cursor = request.args.get('cursor')
 
     query = f"""
-        SELECT TOP {limit} BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande,
+        SELECT TOP {limit + 1} BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande,
                BUC.chid, BUC.extn, BUC.bdat, BUC.tokn,
                GKT.vorn, GKT.nacn, GKT.mail
         FROM BUC
@@ -375,13 +1175,23 @@ def get_bookings():
     if channel is not None:
         query += " AND BUC.chid = ?"
         params.append(channel)
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'resn')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND BUC.resn < ?"
 
     query += " ORDER BY BUC.resn DESC"
 
-    bookings = db_query(query, params if params else None)
+    if wants_stream():
+        return stream_query(query, params, limit=limit, key='resn')
+
+    bookings, next_cursor = keyset_page(db_rows(query, params), limit, 'resn')
     return jsonify({
         "count": len(bookings),
-        "bookings": [serialize_row(b) for b in bookings]
+        "bookings": bookings,
+        "next_cursor": next_cursor
     })
 
 @app.route('/bookings/<int:resn>')
@@ -408,7 +1218,7 @@ def get_booking(resn):
         LEFT JOIN ZIM ON BUZ.zimm = ZIM.zimm
         WHERE BUZ.resn = ?
     """
-    rooms = db_query(query_buz, (resn,))
+    rooms = db_rows(query_buz, (resn,))
 
     # Konto-Positionen
     query_akz = """
@@ -417,11 +1227,11 @@ def get_booking(resn):
         LEFT JOIN ART ON AKZ.artn = ART.artn
         WHERE AKZ.resn = ?
     """
-    account = db_query(query_akz, (resn,))
+    account = db_rows(query_akz, (resn,))
 
     result = serialize_row(booking)
-    result['rooms'] = [serialize_row(r) for r in rooms]
-    result['account'] = [serialize_row(a) for a in account]
+    result['rooms'] = rooms
+    result['account'] = account
     result['account_total'] = sum(a.get('prei', 0) or 0 for a in account)
 
     return jsonify(result)
@@ -431,29 +1241,45 @@ def get_booking(resn):
 # ============================================================================
 
 @app.route('/guests')
+@etag_from(tables=('GKT',))
 def search_guests():
     """
     Gaeste suchen
 
     Query-Parameter:
     - q: Suchbegriff (Name, Email)
-    - limit: Max. Anzahl (default 50)
+    - limit: Max. Anzahl pro Seite (default 50)
+    - cursor: next_cursor der vorherigen Seite
+    - stream=1 (oder Accept: application/x-ndjson): zeilenweise als NDJSON
     """
     search = request.args.get('q', '')
-    limit = request.args.get('limit', 50, type=int)
+    limit = max(1, request.args.get('limit', 50, type=int))
+    cursor = request.args.get('cursor')
 
     query = f"""
-        SELECT TOP {limit} gast, anre, vorn, nacn, mail, teln, stra, polz, ortb, land, noti, gebd
+        SELECT TOP {limit + 1} gast, anre, vorn, nacn, mail, teln, stra, polz, ortb, land, noti, gebd
         FROM GKT
-        WHERE vorn LIKE ? OR nacn LIKE ? OR mail LIKE ?
-        ORDER BY gast DESC
+        WHERE (vorn LIKE ? OR nacn LIKE ? OR mail LIKE ?)
     """
     search_term = f"%{search}%"
-    guests = db_query(query, (search_term, search_term, search_term))
+    params = [search_term, search_term, search_term]
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'gast')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND gast < ?"
+    query += " ORDER BY gast DESC"
+
+    if wants_stream():
+        return stream_query(query, params, limit=limit, key='gast')
+
+    guests, next_cursor = keyset_page(db_rows(query, params), limit, 'gast')
 
     return jsonify({
         "count": len(guests),
-        "guests": [serialize_row(g) for g in guests]
+        "guests": guests,
+        "next_cursor": next_cursor
     })
 
 @app.route('/guests/<int:gast>')
@@ -604,8 +1430,7 @@ def serialize_date(value):
 @app.route('/articles')
 def get_articles():
     """Alle Artikel/Leistungen"""
-    query = "SELECT artn, beze, prei, knto FROM ART ORDER BY artn"
-    articles = db_query(query)
+    articles = ref_cache.get('articles')
     return jsonify({
         "count": len(articles),
         "articles": [serialize_row(a) for a in articles]
@@ -614,8 +1439,7 @@ def get_articles():
 @app.route('/channels')
 def get_channels():
     """Alle Buchungskanaele"""
-    query = "SELECT chid, name FROM CHC ORDER BY chid"
-    channels = db_query(query)
+    channels = ref_cache.get('channels')
     return jsonify({
         "count": len(channels),
         "channels": [serialize_row(c) for c in channels]
@@ -626,25 +1450,43 @@ def get_channels():
 # ============================================================================
 
 @app.route('/calendar')
+@etag_from(tables=('BUZ', 'BUC', 'GKT'), references=('rooms',))
+@cached(60, ('BUZ', 'BUC', 'GKT', 'ZIM'))
+@coalesced
 def get_calendar():
     """
     Belegungskalender
 
     Query-Parameter:
-    - month: Monat (1-12)
-    - year: Jahr (YYYY)
-    - days: Anzahl Tage (default 30)
+    - start_date / end_date: Zeitraum (YYYY-MM-DD, end_date inklusive, max. 366 Tage)
+    - month / year / days: alternativ Monatsbeginn + Anzahl Tage (default 30)
+    - occupancy=rle: zusaetzlich Belegung pro Zimmer als [[resn, Naechte], ...]
+      (resn 0 = frei)
     """
-    month = request.args.get('month', datetime.now().month, type=int)
-    year = request.args.get('year', datetime.now().year, type=int)
-    days = request.args.get('days', 30, type=int)
+    start_arg = request.args.get('start_date')
+    end_arg = request.args.get('end_date')
 
-    start_date = datetime(year, month, 1)
-    end_date = start_date + timedelta(days=days)
+    try:
+        if start_arg:
+            start_date = datetime.strptime(start_arg[:10], '%Y-%m-%d')
+            end_date = (datetime.strptime(end_arg[:10], '%Y-%m-%d') if end_arg
+                        else start_date + timedelta(days=30))
+        else:
+            month = request.args.get('month', datetime.now().month, type=int)
+            year = request.args.get('year', datetime.now().year, type=int)
+            days = request.args.get('days', 30, type=int)
+            start_date = datetime(year, month, 1)
+            end_date = start_date + timedelta(days=days)
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
+
+    if end_date < start_date:
+        return jsonify({"error": "end_date muss nach start_date liegen"}), 400
+    if (end_date - start_date).days + 1 > CALENDAR_MAX_DAYS:
+        return jsonify({"error": f"Zeitraum zu lang (max. {CALENDAR_MAX_DAYS} Tage)"}), 400
 
     # Alle Zimmer
-    query_rooms = "SELECT zimm, beze FROM ZIM ORDER BY zimm"
-    rooms = db_query(query_rooms)
+    rooms = ref_cache.get('rooms')
 
     # Buchungen im Zeitraum
     query_bookings = """
@@ -656,25 +1498,11 @@ def get_calendar():
     """
     bookings = db_query(query_bookings, (end_date.strftime('%Y-%m-%d'), start_date.strftime('%Y-%m-%d')))
 
-    # Kalender aufbauen
-    calendar = []
-    for room in rooms:
-        room_bookings = [
-            {
-                "resn": b['resn'],
-                "from": b['vndt'].strftime('%Y-%m-%d') if b['vndt'] else None,
-                "to": b['bsdt'].strftime('%Y-%m-%d') if b['bsdt'] else None,
-                "guest": b['nacn'],
-                "persons": b['pers'],
-                "status": b['stat']
-            }
-            for b in bookings if b['zimm'] == room['zimm']
-        ]
-        calendar.append({
-            "zimm": room['zimm'],
-            "name": room['beze'],
-            "bookings": room_bookings
-        })
+    # Kalender aufbauen (Buchungen in einem Durchlauf nach Zimmer gruppiert)
+    calendar = build_calendar(
+        rooms, bookings, start_date.date(), end_date.date(),
+        occupancy=request.args.get('occupancy') == 'rle'
+    )
 
     return jsonify({
         "start": start_date.strftime('%Y-%m-%d'),
@@ -687,6 +1515,9 @@ def get_calendar():
 # ============================================================================
 
 @app.route('/stats')
+@etag_from(tables=('GKT', 'BUC'), references=('rooms', 'channels'))
+@cached(120, ('GKT', 'BUC', 'ZIM', 'CHC'))
+@coalesced
 def get_stats():
     """Allgemeine Statistiken"""
     stats = {}
@@ -694,14 +1525,14 @@ def get_stats():
     # Anzahlen
     stats['total_guests'] = db_query("SELECT COUNT(*) as c FROM GKT", fetchone=True)['c']
     stats['total_bookings'] = db_query("SELECT COUNT(*) as c FROM BUC", fetchone=True)['c']
-    stats['total_rooms'] = db_query("SELECT COUNT(*) as c FROM ZIM", fetchone=True)['c']
+    stats['total_rooms'] = len(ref_cache.get('rooms'))
 
     # Buchungen pro Channel
     channels = {}
     query_ch = "SELECT chid FROM BUC"
     all_bookings = db_query(query_ch)
 
-    ch_names = {c['chid']: c['name'] for c in db_query("SELECT chid, name FROM CHC")}
+    ch_names = {c['chid']: c['name'] for c in ref_cache.get('channels')}
 
     from collections import Counter
     ch_counts = Counter([b['chid'] for b in all_bookings])
@@ -717,6 +1548,8 @@ def get_stats():
 # ============================================================================
 
 @app.route('/block', methods=['POST'])
+@writes('BUC', 'BUZ')
+@room_locked
 def create_block():
     """
     Zeitraum im Kalender blockieren (Im Kalender sichtbar)
@@ -747,6 +1580,16 @@ def create_block():
     if not all([zimm, von, bis]):
         return jsonify({"error": "zimm, von, bis sind erforderlich"}), 400
 
+    # Einmal normalisieren: Index, Sperre und INSERTs verwenden dieselbe Nummer
+    try:
+        zimm = int(zimm)
+    except (TypeError, ValueError):
+        return jsonify({"error": "zimm muss eine Zimmer-Nummer sein"}), 400
+
+    # Schnelle Vorpruefung im Index, danach verbindlich in der DB
+    if room_conflict_precheck(zimm, von, bis):
+        return jsonify({"error": "Zimmer ist im Zeitraum bereits belegt"}), 409
+
     # Verfuegbarkeit pruefen - nur aktive Buchungen (Angebote und Bestaetigte)
     query_check = """
         SELECT COUNT(*) as c FROM BUZ
@@ -762,9 +1605,7 @@ def create_block():
 
     try:
         # Neue Reservierungsnummer
-        cursor.execute("SELECT MAX(resn) FROM BUC")
-        max_resn = cursor.fetchone()[0] or 0
-        resn = max_resn + 1
+        resn = sequences.next('BUC')
 
         # BUC anlegen mit stat=0 (Angebot) und flgl=4 (Im Kalender sichtbar)
         cursor.execute("""
@@ -779,6 +1620,7 @@ def create_block():
         """, (resn, zimm, von, bis))
 
         conn.commit()
+        availability_index.add(resn, zimm, von, bis)
 
         return jsonify({
             "success": True,
@@ -798,6 +1640,7 @@ def create_block():
 
 
 @app.route('/block/<int:resn>', methods=['DELETE'])
+@writes('BUC', 'BUZ')
 def remove_block(resn):
     """
     Blockierung entfernen
@@ -824,6 +1667,7 @@ def remove_block(resn):
         cursor.execute("DELETE FROM BUC WHERE resn = ?", (resn,))
 
         conn.commit()
+        availability_index.remove(resn)
 
         return jsonify({
             "success": True,
@@ -843,6 +1687,8 @@ def remove_block(resn):
 # ============================================================================
 
 @app.route('/option', methods=['POST'])
+@writes('GKT', 'BUC', 'BUZ')
+@room_locked
 def create_option():
     """
     Neue Option anlegen (Zimmer blockieren)
@@ -879,6 +1725,16 @@ def create_option():
     if not all([zimm, von, bis]):
         return jsonify({"error": "zimm, von, bis sind erforderlich"}), 400
 
+    # Einmal normalisieren: Index, Sperre und INSERTs verwenden dieselbe Nummer
+    try:
+        zimm = int(zimm)
+    except (TypeError, ValueError):
+        return jsonify({"error": "zimm muss eine Zimmer-Nummer sein"}), 400
+
+    # Schnelle Vorpruefung im Index, danach verbindlich in der DB
+    if room_conflict_precheck(zimm, von, bis):
+        return jsonify({"error": "Zimmer ist im Zeitraum bereits belegt"}), 409
+
     # Verfuegbarkeit pruefen - nur aktive Buchungen (Angebote und Bestaetigte)
     query_check = """
         SELECT COUNT(*) as c FROM BUZ
@@ -893,22 +1749,20 @@ def create_option():
     cursor = conn.cursor()
 
     try:
-        # Gast anlegen wenn noetig
-        if not gast and data.get('nachname'):
-            cursor.execute("SELECT MAX(gast) FROM GKT")
-            max_gast = cursor.fetchone()[0] or 0
-            gast = max_gast + 1
+        # Alle Nummern vor dem ersten INSERT vergeben - der Abgleich des
+        # Nummernkreises liest auf derselben (Scope-)Verbindung
+        new_guest = not gast and data.get('nachname')
+        if new_guest:
+            gast = sequences.next('GKT')
+        resn = sequences.next('BUC')
 
+        # Gast anlegen wenn noetig
+        if new_guest:
             cursor.execute("""
                 INSERT INTO GKT (gast, vorn, nacn, mail)
                 VALUES (?, ?, ?, ?)
             """, (gast, data.get('vorname', ''), data.get('nachname', ''), data.get('email', '')))
 
-        # Neue Reservierungsnummer
-        cursor.execute("SELECT MAX(resn) FROM BUC")
-        max_resn = cursor.fetchone()[0] or 0
-        resn = max_resn + 1
-
         # BUC anlegen (stat=2 fuer Option/Anfrage)
         cursor.execute("""
             INSERT INTO BUC (resn, gast, stat, andf, ande, chid, bdat)
@@ -922,6 +1776,7 @@ def create_option():
         """, (resn, zimm, von, bis, pers, kndr))
 
         conn.commit()
+        availability_index.add(resn, zimm, von, bis)
 
         return jsonify({
             "success": True,
@@ -937,6 +1792,7 @@ def create_option():
         conn.close()
 
 @app.route('/book/<int:resn>', methods=['PUT'])
+@writes('BUC')
 def book_option(resn):
     """Option zur Buchung wandeln"""
     # Pruefen ob Buchung existiert
@@ -948,6 +1804,9 @@ def book_option(resn):
     # Status auf "gebucht" setzen (stat=2 = bestaetigte Buchung)
     # flgl=0 damit es nicht mehr als Blockierung sichtbar ist
     db_execute("UPDATE BUC SET stat = 2, flgl = 0 WHERE resn = ?", (resn,))
+    if booking['stat'] not in (0, 2):
+        # War nicht aktiv (z.B. storniert) - Belegungen sind nicht im Index
+        availability_index.invalidate()
 
     return jsonify({
         "success": True,
@@ -957,6 +1816,8 @@ def book_option(resn):
 
 
 @app.route('/booking-with-price', methods=['POST'])
+@writes('GKT', 'BUC', 'BUZ', 'AKZ')
+@room_locked
 def create_booking_with_price():
     """
     Buchung mit Preisen aus Webapp erstellen
@@ -1013,6 +1874,16 @@ def create_booking_with_price():
     if not all([zimm, von, bis]):
         return jsonify({"error": "zimm, von, bis sind erforderlich"}), 400
 
+    # Einmal normalisieren: Index, Sperre und INSERTs verwenden dieselbe Nummer
+    try:
+        zimm = int(zimm)
+    except (TypeError, ValueError):
+        return jsonify({"error": "zimm muss eine Zimmer-Nummer sein"}), 400
+
+    # Schnelle Vorpruefung im Index, danach verbindlich in der DB
+    if room_conflict_precheck(zimm, von, bis):
+        return jsonify({"error": "Zimmer ist im Zeitraum bereits belegt"}), 409
+
     # Verfuegbarkeit pruefen - nur aktive Buchungen (Angebote und Bestaetigte)
     query_check = """
         SELECT COUNT(*) as c FROM BUZ
@@ -1027,12 +1898,28 @@ def create_booking_with_price():
     cursor = conn.cursor()
 
     try:
-        # Gast anlegen wenn noetig
-        if not gast and data.get('nachname'):
-            cursor.execute("SELECT MAX(gast) FROM GKT")
-            max_gast = cursor.fetchone()[0] or 0
-            gast = max_gast + 1
+        # Positionen aus der Webapp (Preise aus Webapp!)
+        positionen = data.get('positionen', [])
+        pauschale = data.get('pauschale')
+
+        if pauschale:
+            # Eine Position fuer die gesamte Pauschale
+            positionen = [{
+                "artikel": pauschale.get('name', 'Pauschale'),
+                "preis": pauschale.get('preis', 0),
+                "artn": None
+            }]
+
+        # Alle Nummern (auch den aknr-Block) vor dem ersten INSERT vergeben -
+        # der Abgleich des Nummernkreises liest auf derselben (Scope-)Verbindung
+        new_guest = not gast and data.get('nachname')
+        if new_guest:
+            gast = sequences.next('GKT')
+        resn = sequences.next('BUC')
+        aknr = account_poster.reserve(len(positionen)) if positionen else None
 
+        # Gast anlegen wenn noetig
+        if new_guest:
             cursor.execute("""
                 INSERT INTO GKT (gast, vorn, nacn, mail, teln)
                 VALUES (?, ?, ?, ?, ?)
@@ -1047,11 +1934,6 @@ def create_booking_with_price():
         if not gast:
             gast = 0
 
-        # Neue Reservierungsnummer
-        cursor.execute("SELECT MAX(resn) FROM BUC")
-        max_resn = cursor.fetchone()[0] or 0
-        resn = max_resn + 1
-
         # BUC anlegen (stat=2 = bestaetigte Buchung)
         cursor.execute("""
             INSERT INTO BUC (resn, gast, stat, flgl, andf, ande, chid, bdat)
@@ -1064,41 +1946,19 @@ def create_booking_with_price():
             VALUES (?, 1, ?, ?, ?, ?, ?, ?)
         """, (resn, zimm, von, bis, pers, kndr, pession))
 
-        # Positionen auf Konto buchen (Preise aus Webapp!)
-        positionen = data.get('positionen', [])
-        pauschale = data.get('pauschale')
-
-        if pauschale:
-            # Eine Position fuer die gesamte Pauschale
-            positionen = [{
-                "artikel": pauschale.get('name', 'Pauschale'),
-                "preis": pauschale.get('preis', 0),
-                "artn": None
-            }]
-
-        total = 0
-        for pos in positionen:
-            cursor.execute("SELECT MAX(aknr) FROM AKZ")
-            max_aknr = cursor.fetchone()[0] or 0
-            aknr = max_aknr + 1
-
-            preis = pos.get('preis', 0)
-            total += preis
-
-            cursor.execute("""
-                INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1, meng)
-                VALUES (?, 1, ?, ?, ?, ?, ?, ?, 1)
-            """, (
-                aknr,
-                datetime.now(),
-                resn,
-                zimm,
-                pos.get('artn', 0) or 0,
-                preis,
-                pos.get('artikel', '')
-            ))
+        # Positionen auf Konto buchen
+        total = sum(pos.get('preis', 0) for pos in positionen)
+        account_poster.post(conn, [{
+            "resn": resn,
+            "zimm": zimm,
+            "artn": pos.get('artn', 0) or 0,
+            "prei": pos.get('preis', 0),
+            "bez1": pos.get('artikel', ''),
+            "meng": 1
+        } for pos in positionen], commit=False, first=aknr)
 
         conn.commit()
+        availability_index.add(resn, zimm, von, bis)
 
         return jsonify({
             "success": True,
@@ -1119,6 +1979,7 @@ def create_booking_with_price():
         conn.close()
 
 @app.route('/cancel/<int:resn>', methods=['DELETE'])
+@writes('BUC')
 def cancel_booking(resn):
     """
     Buchung stornieren
@@ -1145,6 +2006,7 @@ def cancel_booking(resn):
         cursor.execute("UPDATE BUC SET stat = 65536 WHERE resn = ?", (resn,))
 
         conn.commit()
+        availability_index.remove(resn)
 
         return jsonify({
             "success": True,
@@ -1163,6 +2025,7 @@ def cancel_booking(resn):
 # ============================================================================
 
 @app.route('/guest', methods=['POST'])
+@writes('GKT')
 def create_guest():
     """
     Neuen Gast anlegen
@@ -1189,9 +2052,7 @@ def create_guest():
 
     try:
         # Neue Gast-ID
-        cursor.execute("SELECT MAX(gast) FROM GKT")
-        max_gast = cursor.fetchone()[0] or 0
-        gast = max_gast + 1
+        gast = sequences.next('GKT')
 
         cursor.execute("""
             INSERT INTO GKT (gast, vorn, nacn, mail, teln, stra, polz, ortb, land)
@@ -1223,6 +2084,7 @@ def create_guest():
         conn.close()
 
 @app.route('/guest/<int:gast>', methods=['PUT'])
+@writes('GKT')
 def update_guest(gast):
     """
     Gast aktualisieren - ALLE Felder
@@ -1451,7 +2313,7 @@ def update_guest(gast):
     params.append(gast)
     query = f"UPDATE GKT SET {', '.join(updates)} WHERE gast = ?"
 
-    db_execute(query, params)
+    queued_execute(query, params)
 
     return jsonify({
         "success": True,
@@ -1465,6 +2327,7 @@ def update_guest(gast):
 # ============================================================================
 
 @app.route('/service', methods=['POST'])
+@writes('AKZ')
 def add_service():
     """
     Leistung auf Konto buchen
@@ -1492,41 +2355,24 @@ def add_service():
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
     # Artikel-Preis holen wenn nicht angegeben
-    article = db_query("SELECT beze, prei FROM ART WHERE artn = ?", (artn,), fetchone=True)
+    article = find_article(artn)
     prei = data.get('prei', article['prei'] if article else 0)
     bez1 = data.get('bez1', article['beze'] if article else '')
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    try:
-        # AKZ-Nummer ermitteln
-        cursor.execute("SELECT MAX(aknr) FROM AKZ")
-        max_aknr = cursor.fetchone()[0] or 0
-        aknr = max_aknr + 1
+    # Kontobuchung einfuegen (aknr vorab, nicht in der Queue-Transaktion vergeben)
+    first = account_poster.reserve(1)
+    aknr = queued_write(lambda conn: account_poster.post(conn, [{
+        "resn": resn, "zimm": data.get('zimm', 0), "artn": artn, "prei": prei, "bez1": bez1
+    }], commit=False, first=first))[0]['aknr']
 
-        # Kontobuchung einfuegen
-        cursor.execute("""
-            INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1)
-            VALUES (?, 1, ?, ?, ?, ?, ?, ?)
-        """, (aknr, datetime.now(), resn, data.get('zimm', 0), artn, prei, bez1))
-
-        conn.commit()
-
-        return jsonify({
-            "success": True,
-            "aknr": aknr,
-            "resn": resn,
-            "artn": artn,
-            "prei": prei,
-            "message": f"Leistung wurde auf Konto gebucht"
-        }), 201
-
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return jsonify({
+        "success": True,
+        "aknr": aknr,
+        "resn": resn,
+        "artn": artn,
+        "prei": prei,
+        "message": f"Leistung wurde auf Konto gebucht"
+    }), 201
 
 # ============================================================================
 # ROUTES - KONTO
@@ -1558,6 +2404,7 @@ def get_account(resn):
 # ============================================================================
 
 @app.route('/checkin/<int:resn>', methods=['PUT'])
+@writes('BUZ')
 def checkin(resn):
     """
     Zimmer einchecken
@@ -1574,39 +2421,27 @@ def checkin(resn):
 
     zimm = request.args.get('zimm', type=int)
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    try:
-        if zimm:
-            # Nur ein Zimmer einchecken
-            cursor.execute("UPDATE BUZ SET ckin = 2 WHERE resn = ? AND zimm = ?", (resn, zimm))
-        else:
-            # Alle Zimmer der Buchung einchecken
-            cursor.execute("UPDATE BUZ SET ckin = 2 WHERE resn = ?", (resn,))
-
-        affected = cursor.rowcount
-        conn.commit()
+    if zimm:
+        # Nur ein Zimmer einchecken
+        affected = queued_execute("UPDATE BUZ SET ckin = 2 WHERE resn = ? AND zimm = ?", (resn, zimm))
+    else:
+        # Alle Zimmer der Buchung einchecken
+        affected = queued_execute("UPDATE BUZ SET ckin = 2 WHERE resn = ?", (resn,))
 
-        if affected == 0:
-            return jsonify({"error": "Keine Zimmer zum Einchecken gefunden"}), 404
+    if affected == 0:
+        return jsonify({"error": "Keine Zimmer zum Einchecken gefunden"}), 404
 
-        return jsonify({
-            "success": True,
-            "resn": resn,
-            "zimm": zimm,
-            "rooms_checked_in": affected,
-            "message": f"Check-in fuer Buchung {resn} erfolgreich"
-        })
-
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return jsonify({
+        "success": True,
+        "resn": resn,
+        "zimm": zimm,
+        "rooms_checked_in": affected,
+        "message": f"Check-in fuer Buchung {resn} erfolgreich"
+    })
 
 
 @app.route('/checkout/<int:resn>', methods=['PUT'])
+@writes('BUZ')
 def checkout(resn):
     """
     Zimmer auschecken
@@ -1623,36 +2458,23 @@ def checkout(resn):
 
     zimm = request.args.get('zimm', type=int)
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    try:
-        if zimm:
-            # Nur ein Zimmer auschecken
-            cursor.execute("UPDATE BUZ SET ckin = 4 WHERE resn = ? AND zimm = ?", (resn, zimm))
-        else:
-            # Alle Zimmer der Buchung auschecken
-            cursor.execute("UPDATE BUZ SET ckin = 4 WHERE resn = ?", (resn,))
-
-        affected = cursor.rowcount
-        conn.commit()
-
-        if affected == 0:
-            return jsonify({"error": "Keine Zimmer zum Auschecken gefunden"}), 404
+    if zimm:
+        # Nur ein Zimmer auschecken
+        affected = queued_execute("UPDATE BUZ SET ckin = 4 WHERE resn = ? AND zimm = ?", (resn, zimm))
+    else:
+        # Alle Zimmer der Buchung auschecken
+        affected = queued_execute("UPDATE BUZ SET ckin = 4 WHERE resn = ?", (resn,))
 
-        return jsonify({
-            "success": True,
-            "resn": resn,
-            "zimm": zimm,
-            "rooms_checked_out": affected,
-            "message": f"Check-out fuer Buchung {resn} erfolgreich"
-        })
+    if affected == 0:
+        return jsonify({"error": "Keine Zimmer zum Auschecken gefunden"}), 404
 
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return jsonify({
+        "success": True,
+        "resn": resn,
+        "zimm": zimm,
+        "rooms_checked_out": affected,
+        "message": f"Check-out fuer Buchung {resn} erfolgreich"
+    })
 
 
 @app.route('/checkin-status/<int:resn>')
@@ -1671,7 +2493,7 @@ def get_checkin_status(resn):
         LEFT JOIN ZIM ON BUZ.zimm = ZIM.zimm
         WHERE BUZ.resn = ?
     """
-    rooms = db_query(query, (resn,))
+    rooms = db_rows(query, (resn,), dates='day')
 
     if not rooms:
         return jsonify({"error": "Buchung nicht gefunden"}), 404
@@ -1685,8 +2507,8 @@ def get_checkin_status(resn):
             "name": r['beze'],
             "ckin": r['ckin'],
             "status": status_map.get(r['ckin'], f"unbekannt ({r['ckin']})"),
-            "von": r['vndt'].strftime('%Y-%m-%d') if r['vndt'] else None,
-            "bis": r['bsdt'].strftime('%Y-%m-%d') if r['bsdt'] else None
+            "von": r['vndt'],
+            "bis": r['bsdt']
         })
 
     return jsonify({
@@ -1725,6 +2547,7 @@ def get_registrations(resn):
 
 
 @app.route('/register/<int:resn>', methods=['POST'])
+@writes('GKI', 'ANM')
 def register_guest(resn):
     """
     Gast bei Polizei anmelden (Meldewesen)
@@ -1762,12 +2585,15 @@ def register_guest(resn):
     try:
         gast_id = data.get('gast')
 
-        # Neuen Gast anlegen wenn noetig
-        if not gast_id and data.get('nachname'):
-            cursor.execute("SELECT MAX(gkid) FROM GKI")
-            max_gkid = cursor.fetchone()[0] or 0
-            gast_id = max_gkid + 1
+        # Alle Nummern vor dem ersten INSERT vergeben - der Abgleich des
+        # Nummernkreises liest auf derselben (Scope-)Verbindung
+        new_guest = not gast_id and data.get('nachname')
+        if new_guest:
+            gast_id = sequences.next('GKI')
+        annr = sequences.next('ANM')
 
+        # Neuen Gast anlegen wenn noetig
+        if new_guest:
             gebd = None
             if data.get('geburtsdatum'):
                 gebd = datetime.strptime(data['geburtsdatum'], '%Y-%m-%d')
@@ -1786,11 +2612,6 @@ def register_guest(resn):
         if not gast_id:
             gast_id = booking['gast']
 
-        # Neue Anmeldungsnummer
-        cursor.execute("SELECT MAX(annr) FROM ANM")
-        max_annr = cursor.fetchone()[0] or 0
-        annr = max_annr + 1
-
         # ANM anlegen mit stat=6 (angemeldet)
         anreise = booking['andf']
         abreise = booking['ande']
@@ -1827,6 +2648,7 @@ def register_guest(resn):
 
 
 @app.route('/deregister/<int:annr>', methods=['PUT'])
+@writes('ANM')
 def deregister_guest(annr):
     """
     Gast bei Polizei abmelden
@@ -1838,7 +2660,7 @@ def deregister_guest(annr):
     if not registration:
         return jsonify({"error": "Anmeldung nicht gefunden"}), 404
 
-    db_execute("UPDATE ANM SET stat = 4 WHERE annr = ?", (annr,))
+    queued_execute("UPDATE ANM SET stat = 4 WHERE annr = ?", (annr,))
 
     return jsonify({
         "success": True,
@@ -1852,6 +2674,7 @@ def deregister_guest(annr):
 # ============================================================================
 
 @app.route('/invoices')
+@cached(60, ('REC', 'GKT'))
 def get_invoices():
     """
     Rechnungen auflisten
@@ -1860,15 +2683,18 @@ def get_invoices():
     - from: Ab Datum (YYYY-MM-DD)
     - to: Bis Datum (YYYY-MM-DD)
     - guest: Gast-ID
-    - limit: Max. Anzahl (default 100)
+    - limit: Max. Anzahl pro Seite (default 100)
+    - cursor: next_cursor der vorherigen Seite
+    - stream=1 (oder Accept: application/x-ndjson): zeilenweise als NDJSON
     """
-    limit = request.args.get('limit', 100, type=int)
+    limit = max(1, request.args.get('limit', 100, type=int))
     date_from = request.args.get('from')
     date_to = request.args.get('to')
     guest = request.args.get('guest', type=int)
+    cursor = request.args.get('cursor')
 
     query = f"""
-        SELECT TOP {limit} REC.rnum, REC.edat, REC.rbez, REC.gast,
+        SELECT TOP {limit + 1} REC.rnum, REC.edat, REC.rbez, REC.gast,
                REC.pmv1, REC.pmv2, REC.pmv3, REC.pmta,
                GKT.vorn, GKT.nacn
         FROM REC
@@ -1886,25 +2712,30 @@ def get_invoices():
     if guest:
         query += " AND REC.gast = ?"
         params.append(guest)
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'rnum')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND REC.rnum < ?"
 
     query += " ORDER BY REC.rnum DESC"
 
-    invoices = db_query(query, params if params else None)
+    if wants_stream():
+        return stream_query(query, params, serialize=invoice_row, limit=limit, key='rnum')
 
-    result = []
-    for inv in invoices:
-        total = abs(inv.get('pmv1', 0) or 0) + abs(inv.get('pmv2', 0) or 0) + abs(inv.get('pmv3', 0) or 0)
-        r = serialize_row(inv)
-        r['total'] = total
-        result.append(r)
+    invoices, next_cursor = keyset_page(db_rows(query, params), limit, 'rnum')
+    result = [invoice_row(inv) for inv in invoices]
 
     return jsonify({
         "count": len(result),
-        "invoices": result
+        "invoices": result,
+        "next_cursor": next_cursor
     })
 
 
 @app.route('/invoices/<int:rnum>')
+@cached(300, ('REC', 'GKT', 'AKZ', 'ART'))
 def get_invoice(rnum):
     """Eine Rechnung mit Positionen abrufen"""
     # Rechnungs-Kopf
@@ -1941,6 +2772,7 @@ def get_invoice(rnum):
 
 
 @app.route('/invoices/by-booking/<int:resn>')
+@cached(120, ('REC', 'BUC'))
 def get_invoices_by_booking(resn):
     """Alle Rechnungen zu einer Buchung"""
     # Buchung holen um Gast-ID zu ermitteln
@@ -1955,14 +2787,7 @@ def get_invoices_by_booking(resn):
         WHERE REC.gast = ?
         ORDER BY REC.rnum DESC
     """
-    invoices = db_query(query, (booking['gast'],))
-
-    result = []
-    for inv in invoices:
-        total = abs(inv.get('pmv1', 0) or 0) + abs(inv.get('pmv2', 0) or 0) + abs(inv.get('pmv3', 0) or 0)
-        r = serialize_row(inv)
-        r['total'] = total
-        result.append(r)
+    result = [invoice_row(inv) for inv in db_rows(query, (booking['gast'],))]
 
     return jsonify({
         "resn": resn,
@@ -1973,6 +2798,8 @@ def get_invoices_by_booking(resn):
 
 
 @app.route('/invoices/open')
+@cached(60, ('REC', 'GKT'))
+@coalesced
 def get_open_invoices():
     """
     Offene Rechnungen (unbezahlt)
@@ -2007,6 +2834,9 @@ def get_open_invoices():
 
 
 @app.route('/invoices/stats')
+@etag_from(tables=('REC',), references=('payment_types',))
+@cached(300, ('REC', 'PMT'))
+@coalesced
 def get_invoice_stats():
     """
     Umsatz-Statistiken
@@ -2053,7 +2883,7 @@ def get_invoice_stats():
     by_payment = db_query(query_by_payment, params if params else None)
 
     # Zahlarten-Namen holen
-    payment_types = {p['paym']: p['payt'] for p in db_query("SELECT paym, payt FROM PMT")}
+    payment_types = payment_type_names()
 
     payment_breakdown = {}
     for p in by_payment:
@@ -2105,6 +2935,9 @@ def get_invoice_stats():
 
 
 @app.route('/invoices/by-payment-type')
+@etag_from(tables=('REC',), references=('payment_types',))
+@cached(300, ('REC', 'PMT'))
+@coalesced
 def get_invoices_by_payment_type():
     """
     Umsatz nach Zahlart gruppiert
@@ -2144,7 +2977,7 @@ def get_invoices_by_payment_type():
     results = db_query(query, params if params else None)
 
     # Zahlarten-Namen holen
-    payment_types = {p['paym']: p['payt'] for p in db_query("SELECT paym, payt FROM PMT")}
+    payment_types = payment_type_names()
 
     breakdown = []
     total_all = 0
@@ -2179,8 +3012,7 @@ def get_invoices_by_payment_type():
 @app.route('/payment-types')
 def get_payment_types():
     """Alle Zahlarten auflisten"""
-    query = "SELECT paym, payt, gknt, flag FROM PMT ORDER BY paym"
-    payment_types = db_query(query)
+    payment_types = ref_cache.get('payment_types')
     return jsonify({
         "count": len(payment_types),
         "payment_types": [serialize_row(p) for p in payment_types]
@@ -2188,6 +3020,9 @@ def get_payment_types():
 
 
 @app.route('/invoices/by-month')
+@etag_from(tables=('REC',))
+@cached(300, ('REC',))
+@coalesced
 def get_invoices_by_month():
     """
     Umsatz nach Monat gruppiert
@@ -2232,6 +3067,9 @@ def get_invoices_by_month():
 
 
 @app.route('/invoices/by-year')
+@etag_from(tables=('REC',))
+@cached(300, ('REC',))
+@coalesced
 def get_invoices_by_year():
     """Umsatz nach Jahr gruppiert (alle Jahre)"""
     query = """
@@ -2264,6 +3102,7 @@ def get_invoices_by_year():
 # ============================================================================
 
 @app.route('/meal/<int:resn>')
+@cached(60, ('BUC', 'BUZ', 'AKZ', 'GKT', 'ZIM', 'ART'))
 def get_meal(resn):
     """
     Verpflegung einer Buchung anzeigen
@@ -2366,6 +3205,7 @@ def get_meal(resn):
 
 
 @app.route('/meal-day', methods=['POST'])
+@writes('AKZ')
 def book_meal_day():
     """
     HP fuer einen bestimmten Tag/Person buchen oder stornieren
@@ -2423,11 +3263,6 @@ def book_meal_day():
     cursor = conn.cursor()
 
     try:
-        # AKZ-Nummer ermitteln
-        cursor.execute("SELECT MAX(aknr) FROM AKZ")
-        max_aknr = cursor.fetchone()[0] or 0
-        aknr = max_aknr + 1
-
         # Preis berechnen (negativ bei Stornierung)
         final_price = price if action == 'add' else -abs(price)
 
@@ -2440,9 +3275,8 @@ def book_meal_day():
 
         # Artikel-Nummer (Standard: 99 fuer HP, oder aus ART suchen)
         if not article:
-            cursor.execute("SELECT artn FROM ART WHERE beze LIKE '%HP%' OR beze LIKE '%albpension%'")
-            art_row = cursor.fetchone()
-            article = art_row[0] if art_row else 99
+            hp_article = find_hp_article()
+            article = hp_article if hp_article is not None else 99
 
         # Zimmer aus Buchung holen
         cursor.execute("SELECT zimm FROM BUZ WHERE resn = ?", (resn,))
@@ -2450,12 +3284,10 @@ def book_meal_day():
         zimm = zimm_row[0] if zimm_row else 0
 
         # Kontobuchung einfuegen
-        cursor.execute("""
-            INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1, meng)
-            VALUES (?, 1, ?, ?, ?, ?, ?, ?, 1)
-        """, (aknr, datetime.now(), resn, zimm, article, final_price, beschreibung))
-
-        conn.commit()
+        aknr = account_poster.post(conn, [{
+            "resn": resn, "zimm": zimm, "artn": article, "prei": final_price,
+            "bez1": beschreibung, "meng": 1
+        }])[0]['aknr']
 
         return jsonify({
             "success": True,
@@ -2477,6 +3309,7 @@ def book_meal_day():
 
 
 @app.route('/meal-bulk', methods=['POST'])
+@writes('AKZ')
 def book_meal_bulk():
     """
     Mehrere HP-Buchungen auf einmal (fuer Gaeste-Portal)
@@ -2506,44 +3339,14 @@ def book_meal_bulk():
     if not booking:
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
-    results = []
-    errors = []
-
-    for b in bookings:
-        try:
-            # Einzelbuchung ausfuehren
-            from flask import Flask
-            with app.test_request_context(json={
-                "resn": resn,
-                "date": b.get('date'),
-                "person": b.get('person', 1),
-                "action": b.get('action', 'add'),
-                "price": price
-            }):
-                # Direkt die Funktion aufrufen statt HTTP
-                result_data = {
-                    "date": b.get('date'),
-                    "person": b.get('person', 1),
-                    "action": b.get('action', 'add'),
-                    "success": True
-                }
-                results.append(result_data)
-        except Exception as e:
-            errors.append({
-                "date": b.get('date'),
-                "person": b.get('person'),
-                "error": str(e)
-            })
-
-    # Jetzt alle Buchungen einzeln durchfuehren
+    # Alle Positionen pruefen und gesammelt buchen
     conn = get_db()
     cursor = conn.cursor()
 
     try:
         # Artikel fuer HP finden
-        cursor.execute("SELECT artn FROM ART WHERE beze LIKE '%HP%' OR beze LIKE '%albpension%'")
-        art_row = cursor.fetchone()
-        article = art_row[0] if art_row else 99
+        hp_article = find_hp_article()
+        article = hp_article if hp_article is not None else 99
 
         # Zimmer holen
         cursor.execute("SELECT zimm FROM BUZ WHERE resn = ?", (resn,))
@@ -2557,8 +3360,7 @@ def book_meal_bulk():
         abreise = buc_row[1]
 
         results = []
-        total_added = 0
-        total_removed = 0
+        lines = []
 
         for b in bookings:
             try:
@@ -2566,26 +3368,18 @@ def book_meal_bulk():
                 action = b.get('action', 'add')
                 person = b.get('person', 1)
 
-                # AKZ-Nummer
-                cursor.execute("SELECT MAX(aknr) FROM AKZ")
-                max_aknr = cursor.fetchone()[0] or 0
-                aknr = max_aknr + 1
-
                 final_price = price if action == 'add' else -abs(price)
                 weekday = ["Mo", "Di", "Mi", "Do", "Fr", "Sa", "So"][meal_date.weekday()]
 
                 if action == 'add':
                     beschreibung = f"HP {weekday} {meal_date.strftime('%d.%m.')} P{person}"
-                    total_added += price
                 else:
                     beschreibung = f"HP Storno {weekday} {meal_date.strftime('%d.%m.')} P{person}"
-                    total_removed += abs(price)
-
-                cursor.execute("""
-                    INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1, meng)
-                    VALUES (?, 1, ?, ?, ?, ?, ?, ?, 1)
-                """, (aknr, datetime.now(), resn, zimm, article, final_price, beschreibung))
 
+                lines.append({
+                    "resn": resn, "zimm": zimm, "artn": article, "prei": final_price,
+                    "bez1": beschreibung, "meng": 1
+                })
                 results.append({
                     "date": b['date'],
                     "person": person,
@@ -2603,7 +3397,21 @@ def book_meal_bulk():
                     "error": str(e)
                 })
 
-        conn.commit()
+        # Ein executemany fuer alle gueltigen Positionen; scheitert es,
+        # wird zeilenweise gebucht und der Fehler pro Position gemeldet
+        posted = iter(account_poster.post(conn, lines, partial=True))
+        total_added = 0
+        total_removed = 0
+        for result in results:
+            if not result['success']:
+                continue
+            outcome = next(posted)
+            if not outcome['success']:
+                result.update(success=False, error=outcome['error'])
+            elif result['action'] == 'add':
+                total_added += price
+            else:
+                total_removed += abs(price)
 
         return jsonify({
             "success": True,
@@ -2681,6 +3489,12 @@ def create_backup(force=False):
     - backup_path: str (if success)
     - size_mb: float (if success)
     """
+    started = time.perf_counter()
+    result = _create_backup(force)
+    record_backup(result, time.perf_counter() - started)
+    return result
+
+def _create_backup(force):
     try:
         db_path = config['database_path']
 
@@ -2935,6 +3749,7 @@ def backup_status():
 
 
 @app.route('/backup/now', methods=['POST'])
+@writes()
 def backup_now():
     """Trigger immediate backup"""
     force = request.json.get('force', False) if request.json else False
@@ -2981,6 +3796,8 @@ def backup_restore(filename):
 
         # Copy backup over current database
         shutil.copy2(backup_path, db_path)
+        sequences.invalidate()
+        write_queue.reset()
 
         return jsonify({
             "success": True,
@@ -2994,6 +3811,7 @@ def backup_restore(filename):
 
 
 @app.route('/backup/delete/<filename>', methods=['DELETE'])
+@writes()
 def backup_delete(filename):
     """Delete a specific backup"""
     backup_folder = get_backup_folder()
@@ -3013,6 +3831,7 @@ def backup_delete(filename):
 
 
 @app.route('/backup/settings', methods=['GET', 'PUT'])
+@writes()
 def backup_settings():
     """Get or update backup settings"""
     if request.method == 'GET':
@@ -3060,6 +3879,7 @@ def backup_settings():
 
 
 @app.route('/backup/cleanup', methods=['POST'])
+@writes()
 def backup_cleanup():
     """Manually trigger backup cleanup"""
     result = cleanup_old_backups()
@@ -3096,6 +3916,9 @@ if __name__ == '__main__':
     print()
     print("=" * 60)
 
+    # Tabellen-Fingerprints im Hintergrund aktuell halten
+    fingerprints.start()
+
     app.run(
         host=config['host'],
         port=config['port'],
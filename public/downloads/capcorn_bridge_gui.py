@@ -21,13 +21,28 @@ import os
 import sys
 import time
 import webbrowser
-from datetime import datetime
+import hashlib
+import hmac
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from urllib.parse import urlencode
+from datetime import datetime, timedelta
+from decimal import Decimal
 import winreg
 
 # Flask imports
-from flask import Flask, jsonify, request
+from flask import Flask, Response, g, has_request_context, jsonify, request, stream_with_context
 from flask_cors import CORS
-import pyodbc
+
+from capcorn_core import (
+    CALENDAR_MAX_DAYS, COMPRESS_MIN_BYTES, METRICS_CONTENT_TYPE, PROFILE_MODES,
+    QUERY_SORT_KEYS, SIZE_BUCKETS, AccountPoster, AvailabilityIndex, ConnectionPool,
+    Metrics, QueryStats, ReferenceCache, RequestProfile, RoomLockTimeout, RoomLocks,
+    SequenceAllocator, SingleFlight, TableFingerprints, WriteQueue, body_etag,
+    build_calendar, compress_body, database_backend, decode_cursor, encoded_etag,
+    etag_matches, install_json_provider, iter_cursor_rows, keyset_page, ndjson_stream,
+    negotiate_encoding, profile_phase, row_encoder, version_etag
+)
 
 # Firebase imports
 import firebase_admin
@@ -69,6 +84,8 @@ DEFAULT_CONFIG = {
     "auto_start": True,
     "auto_sync": True,
     "sync_interval": 15,  # Minutes
+    "sync_mode": "delta",  # "delta" oder "rebuild"
+    "sync_rebuild_hours": 24,  # Voller Abgleich spaetestens alle X Stunden
     "firebase_project_id": "stadler-suite",
     "minimize_to_tray": True,
     "start_minimized": False,
@@ -153,48 +170,308 @@ def is_autostart_enabled():
 flask_app = Flask(__name__)
 CORS(flask_app)
 
+# Schnellster installierter JSON-Encoder fuer jsonify() und NDJSON (orjson > ujson > json)
+JSON_BACKEND, json_dumps = install_json_provider(flask_app, config.get('json_backend'))
+
+# ============================================================================
+# METRIKEN (GET /metrics, Prometheus-Textformat)
+# ============================================================================
+
+metrics = Metrics(prefix='capcorn_')
+http_requests = metrics.counter(
+    'http_requests_total', "HTTP-Anfragen pro Route und Status", ('method', 'route', 'status'))
+http_latency = metrics.histogram(
+    'http_request_duration_seconds', "Antwortzeit pro Route (Streams: bis zum ersten Byte)",
+    ('method', 'route'))
+http_in_flight = metrics.gauge('http_requests_in_flight', "Gerade laufende HTTP-Anfragen")
+http_size = metrics.histogram(
+    'http_response_size_bytes', "Antwortgroesse nach Kompression (ohne Streams)",
+    ('method', 'route'), buckets=SIZE_BUCKETS)
+backup_runs = metrics.counter('backup_runs_total', "Backup-Laeufe nach Ergebnis", ('result',))
+backup_duration = metrics.histogram(
+    'backup_duration_seconds', "Dauer eines Backups (ohne uebersprungene)",
+    buckets=(0.5, 1, 2.5, 5, 10, 30, 60, 120, 300))
+backup_size = metrics.gauge('backup_last_size_bytes', "Groesse des letzten Backups")
+backup_written = metrics.counter('backup_written_bytes_total', "Insgesamt geschriebene Backup-Bytes")
+backup_last_success = metrics.gauge(
+    'backup_last_success_timestamp_seconds', "Zeitpunkt des letzten erfolgreichen Backups (Unix)")
+sync_runs = metrics.counter(
+    'sync_runs_total', "Firebase-Sync-Laeufe nach Modus und Ergebnis", ('mode', 'result'))
+sync_duration = metrics.histogram(
+    'sync_duration_seconds', "Dauer eines Sync-Laufs", ('mode',),
+    buckets=(1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1800))
+sync_last_success = metrics.gauge(
+    'sync_last_success_timestamp_seconds', "Zeitpunkt des letzten erfolgreichen Syncs (Unix)")
+sync_documents = metrics.counter(
+    'sync_documents_written_total', "In Firestore geschriebene Dokumente pro Collection",
+    ('collection',))
+
+def metrics_route():
+    """Route-Label: Regel statt URL, damit IDs keine eigenen Zeitreihen erzeugen"""
+    return request.url_rule.rule if request.url_rule is not None else "(unbekannt)"
+
+@flask_app.before_request
+def start_request_metrics():
+    g.metrics_started = time.perf_counter()
+    http_in_flight.inc()
+
+@flask_app.after_request
+def record_request_metrics(response):
+    # Als erster after_request-Hook registriert, laeuft also als letzter
+    # (nach ETag/Kompression) und sieht die tatsaechliche Antwortgroesse
+    started = g.pop('metrics_started', None)
+    if started is not None:
+        route, method = metrics_route(), request.method
+        http_latency.observe(time.perf_counter() - started, method=method, route=route)
+        http_requests.inc(method=method, route=route, status=response.status_code)
+        if not response.is_streamed:
+            http_size.observe(response.content_length or 0, method=method, route=route)
+    return response
+
+@flask_app.teardown_request
+def finish_request_metrics(exc=None):
+    http_in_flight.dec()
+
+@metrics.collect
+def pool_metrics():
+    stats = db_pool.stats()
+    return [
+        ('db_connections', 'gauge', "DB-Verbindungen im Pool nach Zustand",
+         [({'state': state}, stats[state]) for state in ('open', 'idle', 'in_use')]),
+        ('db_connections_max', 'gauge', "Maximale Pool-Groesse (db_pool_size)", [({}, stats['max_size'])]),
+        ('db_pool_events_total', 'counter', "Pool-Ereignisse (Verbindung neu, wiederverwendet, ...)",
+         [({'event': event}, stats[event])
+          for event in ('created', 'reused', 'evicted', 'discarded', 'waits', 'timeouts')]),
+    ]
+
+def record_sync(result, mode, seconds):
+    """Ergebnis von sync_to_firebase in die Metriken uebernehmen"""
+    mode = result.get('results', {}).get('mode') or mode or config.get('sync_mode', 'delta')
+    sync_runs.inc(mode=mode, result='success' if result.get('success') else 'error')
+    sync_duration.observe(seconds, mode=mode)
+    if result.get('success'):
+        sync_last_success.set(time.time())
+
+def record_backup(result, seconds):
+    """Ergebnis von create_backup in die Metriken uebernehmen"""
+    if result.get('skipped'):
+        backup_runs.inc(result='skipped')
+        return
+    if not result.get('success'):
+        backup_runs.inc(result='error')
+        return
+    backup_runs.inc(result='success')
+    backup_duration.observe(seconds)
+    backup_last_success.set(time.time())
+    path = result.get('backup_path')
+    if path and os.path.exists(path):
+        size = os.path.getsize(path)
+        backup_size.set(size)
+        backup_written.inc(size)
+
+def query_context():
+    """Route des laufenden Requests fuer die Abfrage-Statistik (sonst Thread-Name)"""
+    if has_request_context() and request.url_rule is not None:
+        return f"{request.method} {request.url_rule.rule}"
+    return None
+
+# Laufzeit pro SQL-Fingerprint fuer /debug/queries, Slow-Log ab slow_query_ms
+query_stats = QueryStats(
+    slow_ms=config.get('slow_query_ms', 250),
+    slow_log_size=config.get('slow_query_log_size', 200),
+    context=query_context,
+    on_slow=lambda entry: print(f"[SlowQuery] {entry['total_ms']:.0f} ms {entry['route']}: {entry['sql'][:200]}")
+)
+
+def connect_db():
+    """
+    Neue Verbindung herstellen (ohne Pool). "db_backend": "access" (Standard,
+    pyodbc + Access-Treiber) oder "sqlite" (Nachbildung des Schemas zum
+    Testen/Benchmarken, database_path = .sqlite-Datei)
+    """
+    conn = database_backend(config.get('db_backend'), config['database_path']).connect()
+    return query_stats.wrap(conn) if config.get('query_stats', True) else conn
+
+# Verbindungs-Pool: ein Access-Connect kostet zig Millisekunden
+db_pool = ConnectionPool(
+    connect_db,
+    max_size=config.get('db_pool_size', 8),
+    max_idle=config.get('db_pool_max_idle', 300),
+    health_query="SELECT TOP 1 zimm FROM ZIM"
+)
+
 def get_db():
-    """Verbindung zur Access-Datenbank herstellen"""
-    conn_str = f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={config['database_path']}"
-    return pyodbc.connect(conn_str)
+    """Verbindung aus dem Pool holen (close() gibt sie an den Pool zurueck)"""
+    return db_pool.acquire()
+
+@flask_app.before_request
+def bind_request_connection():
+    """Eine Pool-Verbindung fuer den ganzen Request verwenden"""
+    db_pool.begin_scope()
+
+@flask_app.teardown_request
+def release_request_connection(exc=None):
+    db_pool.end_scope()
 
 def db_query(query, params=None, fetchone=False):
     """Datenbank-Query ausfuehren"""
-    conn = get_db()
-    cursor = conn.cursor()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
 
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
 
-    columns = [column[0] for column in cursor.description] if cursor.description else []
+        columns = [column[0] for column in cursor.description] if cursor.description else []
 
-    if fetchone:
-        row = cursor.fetchone()
-        result = dict(zip(columns, row)) if row else None
-    else:
-        rows = cursor.fetchall()
-        result = [dict(zip(columns, row)) for row in rows]
+        if fetchone:
+            row = cursor.fetchone()
+            with profile_phase('serialize'):
+                result = dict(zip(columns, row)) if row else None
+        else:
+            rows = cursor.fetchall()
+            with profile_phase('serialize'):
+                result = [dict(zip(columns, row)) for row in rows]
 
-    conn.close()
     return result
 
+def db_rows(query, params=None, dates='iso'):
+    """Query ausfuehren, Zeilen direkt JSON-fertig (Encoder aus cursor.description)"""
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        rows = cursor.fetchall()
+        with profile_phase('serialize'):
+            encode = row_encoder(cursor.description or (), dates)
+            return [encode(row) for row in rows]
+
 def db_execute(query, params=None):
     """Datenbank-Query ausfuehren (INSERT, UPDATE, DELETE)"""
-    conn = get_db()
-    cursor = conn.cursor()
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
 
-    if params:
-        cursor.execute(query, params)
-    else:
-        cursor.execute(query)
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+
+        conn.commit()
+        affected = cursor.rowcount
 
-    conn.commit()
-    affected = cursor.rowcount
-    conn.close()
     return affected
 
+# ============================================================================
+# PROFILING (?__profile=1 oder Header X-Profile, nur mit profile_token)
+# ============================================================================
+
+def profile_mode():
+    """Angeforderter Profil-Modus: 1/tree (cProfile) oder collapsed (Stichproben)"""
+    return request.args.get('__profile') or request.headers.get('X-Profile')
+
+@flask_app.before_request
+def start_profile():
+    mode = profile_mode()
+    if not mode:
+        return None
+    token = config.get('profile_token')
+    if not token:
+        return jsonify({"error": "Profiling ist nicht aktiviert (profile_token in config.json setzen)"}), 403
+    if not hmac.compare_digest(request.headers.get('X-Profile-Token', '').encode(), str(token).encode()):
+        return jsonify({"error": "Profiling-Token fehlt oder ist ungueltig (Header X-Profile-Token)"}), 403
+    if mode not in PROFILE_MODES:
+        return jsonify({"error": f"Unbekannter Profil-Modus: {mode} (1, tree oder collapsed)"}), 400
+    profile = RequestProfile.start(mode, interval=config.get('profile_interval_ms', 1) / 1000)
+    if profile is None:
+        return jsonify({"error": "Es laeuft bereits ein Profil, bitte gleich nochmal versuchen"}), 409
+    g.profile = profile
+    return None
+
+@flask_app.after_request
+def profile_response(response):
+    """
+    Profil statt der Antwort liefern. Laeuft nach ETag/Kompression, Streams
+    werden hier komplett erzeugt und damit mitgemessen. Mit
+    Accept: application/json kommt alles als JSON (inkl. Original-Antwort).
+    """
+    profile = g.get('profile')
+    if profile is None:
+        return response
+    body = response.get_data()
+    profile.stop()
+
+    summary = profile.summary()
+    summary.update(request=f"{request.method} {request.full_path.rstrip('?')}",
+                   status=response.status_code, bytes=len(body))
+    if request.accept_mimetypes.best == 'application/json':
+        summary['profile'] = profile.output()
+        if response.is_json and 'Content-Encoding' not in response.headers:
+            summary['response'] = response.get_json(silent=True)
+        return jsonify(summary)
+
+    phases = summary['phases_ms']
+    header = (
+        f"# {summary['request']} -> {response.status_code}, {len(body)} Bytes, Modus {profile.mode}\n"
+        f"# gesamt {summary['total_ms']} ms | DB execute {phases['db_execute']} ms "
+        f"({summary['statements']} Statements) | DB fetch {phases['db_fetch']} ms | "
+        f"serialize {phases['serialize']} ms | encode {phases['encode']} ms | Rest {phases['rest']} ms\n"
+    )
+    result = Response(header + profile.output(), mimetype='text/plain')
+    result.headers['X-Profiled-Status'] = str(response.status_code)
+    return result
+
+@flask_app.teardown_request
+def stop_profile(exc=None):
+    profile = g.pop('profile', None)
+    if profile is not None:
+        profile.stop()
+
+# ============================================================================
+# SCHREIB-QUEUE (kleine Schreibzugriffe gebuendelt committen)
+# ============================================================================
+
+# Check-in/-out, Abmeldung, Gast-Aenderung, Leistungsbuchung: ein Schreib-
+# Thread mit eigener Verbindung statt vieler paralleler Access-Schreiber
+write_queue = WriteQueue(
+    connect_db,
+    window=config.get('write_queue_window_ms', 5) / 1000,
+    max_batch=config.get('write_queue_batch', 64),
+    timeout=config.get('write_queue_timeout', 30)
+)
+
+def queued_write(op):
+    """
+    op(conn) ueber die Schreib-Queue ausfuehren (op committet nicht selbst)
+    und das Ergebnis zurueckgeben. Mit "write_queue": false direkt auf
+    einer Pool-Verbindung.
+    """
+    if not config.get('write_queue', True):
+        with db_pool.connection() as conn:
+            try:
+                result = op(conn)
+                conn.commit()
+                return result
+            except Exception:
+                conn.rollback()
+                raise
+    return write_queue.run(op)
+
+def queued_execute(query, params=None):
+    """Wie db_execute, aber ueber die Schreib-Queue; gibt rowcount zurueck"""
+    def op(conn):
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+        return cursor.rowcount
+    return queued_write(op)
+
 def serialize_row(row):
     """Konvertiert Datenbankzeile zu JSON-serialisierbarem Dict"""
     result = {}
@@ -205,6 +482,342 @@ def serialize_row(row):
             result[key] = value
     return result
 
+# ============================================================================
+# NDJSON-STREAMING
+# ============================================================================
+
+def wants_stream():
+    """Streaming angefordert? (?stream=1 oder Accept: application/x-ndjson)"""
+    return (request.args.get('stream') == '1'
+            or request.accept_mimetypes.best == 'application/x-ndjson')
+
+def stream_query(query, params=None, serialize=None, limit=None, key=None):
+    """
+    Query-Ergebnis zeilenweise als NDJSON streamen (fetchmany statt fetchall).
+    Die Query laeuft sofort, damit SQL-Fehler noch als normaler 500er
+    zurueckkommen. Der Stream bekommt eine eigene Verbindung (nicht die des
+    Request-Scopes), die bis zum Ende des Streams belegt bleibt.
+    """
+    conn = db_pool.acquire(scoped=False)
+    try:
+        cursor = conn.cursor()
+        if params:
+            cursor.execute(query, params)
+        else:
+            cursor.execute(query)
+    except Exception:
+        conn.close()
+        raise
+
+    def generate():
+        try:
+            yield from ndjson_stream(iter_cursor_rows(cursor), serialize, limit, key, dumps=json_dumps)
+        finally:
+            conn.close()
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def invoice_row(inv):
+    """Gesamtbetrag (pmv1-3) an eine Rechnungszeile aus db_rows haengen"""
+    inv['total'] = abs(inv.get('pmv1') or 0) + abs(inv.get('pmv2') or 0) + abs(inv.get('pmv3') or 0)
+    return inv
+
+# ============================================================================
+# TABELLEN-FINGERPRINTS
+# ============================================================================
+
+# (Schluesselspalte, Aggregate) - eine billige Query pro Tabelle erkennt
+# Aenderungen, auch solche aus dem CapCorn-Client. Summen sind mit dem
+# Schluessel gewichtet (CDbl gegen Long-Ueberlauf): vertauschte Zimmer,
+# umgehaengte Kontozeilen und geaenderte Textlaengen verschieben die Summe.
+TABLE_FINGERPRINTS = {
+    'GKT': ('gast', ['COUNT(*)', 'MAX(gast)', 'SUM(CDbl(gast)*LEN(vorn))',
+                     'SUM(CDbl(gast)*LEN(nacn))', 'SUM(CDbl(gast)*LEN(mail))',
+                     'SUM(CDbl(gast)*LEN(teln))', 'SUM(CDbl(gast)*LEN(stra))',
+                     'SUM(CDbl(gast)*LEN(polz))', 'SUM(CDbl(gast)*LEN(ortb))',
+                     'SUM(CDbl(gast)*LEN(land))']),
+    'BUC': ('resn', ['COUNT(*)', 'MAX(resn)', 'SUM(CDbl(resn)*gast)', 'SUM(CDbl(stat))',
+                     'SUM(CDbl(resn)*chid)', 'SUM(CDbl(resn)*flgl)', 'SUM(CDbl(andf))',
+                     'SUM(CDbl(ande))', 'MAX(bdat)', 'SUM(CDbl(resn)*LEN(extn))']),
+    'BUZ': ('resn', ['COUNT(*)', 'MAX(resn)', 'SUM(CDbl(resn)*zimm)', 'SUM(zimm*CDbl(vndt))',
+                     'SUM(zimm*CDbl(bsdt))', 'SUM(CDbl(resn)*ckin)', 'SUM(CDbl(resn)*pers)']),
+    'AKZ': ('aknr', ['COUNT(*)', 'MAX(aknr)', 'SUM(prei)', 'SUM(CDbl(aknr)*resn)',
+                     'SUM(CDbl(aknr)*prei)', 'SUM(CDbl(aknr)*artn)']),
+    'REC': ('rnum', ['COUNT(*)', 'MAX(rnum)', 'SUM(CDbl(rnum)*gast)', 'SUM(CDbl(rnum)*pmt1)',
+                     'SUM(CDbl(rnum)*pmv1)', 'SUM(CDbl(rnum)*pmv2)', 'SUM(CDbl(rnum)*pmv3)',
+                     'SUM(CDbl(rnum)*CDbl(edat))']),
+    'ANM': ('annr', ['COUNT(*)', 'MAX(annr)', 'SUM(CDbl(annr)*resn)', 'SUM(CDbl(annr)*stat)',
+                     'SUM(CDbl(annr)*pers)']),
+    'ZIM': ('zimm', ['COUNT(*)', 'MAX(zimm)', 'SUM(CDbl(zimm)*stat)', 'SUM(CDbl(zimm)*catg)',
+                     'SUM(CDbl(zimm)*maxv)', 'SUM(CDbl(zimm)*LEN(bett))',
+                     'SUM(CDbl(zimm)*LEN(beze))']),
+    'CAT': ('catg', ['COUNT(*)', 'MAX(catg)', 'SUM(CDbl(catg)*maxv)', 'SUM(CDbl(catg)*prwa)',
+                     'SUM(CDbl(catg)*prsa)', 'SUM(CDbl(catg)*LEN(beze))']),
+    'ART': ('artn', ['COUNT(*)', 'MAX(artn)', 'SUM(CDbl(artn)*prei)', 'SUM(CDbl(artn)*LEN(knto))',
+                     'SUM(CDbl(artn)*LEN(beze))']),
+    'CHC': ('chid', ['COUNT(*)', 'MAX(chid)', 'SUM(CDbl(chid)*LEN(name))']),
+    'GKI': ('gkid', ['COUNT(*)', 'MAX(gkid)', 'SUM(CDbl(gkid)*LEN(nacn))',
+                     'SUM(CDbl(gkid)*LEN(vorn))']),
+    'PMT': ('paym', ['COUNT(*)', 'MAX(paym)', 'SUM(CDbl(paym)*LEN(payt))']),
+    'CHN': ('chid', ['COUNT(*)', 'MAX(chid)', 'SUM(CDbl(chid)*LEN(name))'])
+}
+
+fingerprints = TableFingerprints(
+    lambda sql, params: db_query(sql, params, fetchone=True),
+    interval=config.get('fingerprint_interval', 30)
+)
+# Texte sehen diese Fingerprints nur ueber die Laenge - eine gleich lange
+# Aenderung (Umbenennung) bleibt unerkannt, ETags kommen dann aus dem Body
+LENGTH_ONLY_FINGERPRINTS = {'GKT', 'BUC', 'ZIM', 'CAT', 'ART', 'CHC', 'CHN', 'GKI', 'PMT'}
+
+for _table, (_key, _aggregates) in TABLE_FINGERPRINTS.items():
+    fingerprints.register(_table, _key, _aggregates, exact=_table not in LENGTH_ONLY_FINGERPRINTS)
+
+# ============================================================================
+# NUMMERNKREISE (resn, gast, aknr, annr, gkid)
+# ============================================================================
+
+# Nummern werden im Prozess vergeben; MAX wird nur neu gelesen, wenn der
+# letzte Hintergrund-Poll einen Schluessel ab der naechsten Nummer zeigt
+# (vom CapCorn-Client vergeben) - keine DB-Abfrage auf dem Vergabe-Pfad
+sequences = SequenceAllocator(
+    lambda table, column: db_query(f"SELECT MAX({column}) AS m FROM {table}", fetchone=True)['m'],
+    probe=lambda table: fingerprints.known_max(table)
+)
+for _table, _column in (('BUC', 'resn'), ('GKT', 'gast'), ('AKZ', 'aknr'),
+                        ('ANM', 'annr'), ('GKI', 'gkid')):
+    sequences.register(_table, _column)
+fingerprints.watch(('BUC', 'GKT', 'AKZ', 'ANM', 'GKI'))
+
+# Kontobuchungen: aknr-Block reservieren, dann ein executemany pro Aufruf
+account_poster = AccountPoster(
+    lambda count: sequences.reserve('AKZ', count),
+    fast_executemany=config.get('fast_executemany', False)
+)
+
+# ============================================================================
+# VERFUEGBARKEITS-INDEX
+# ============================================================================
+
+# Verfuegbarkeits-Index: Stornos loeschen hier die BUZ-Zeilen,
+# daher zaehlt jede BUZ-Zeile als Belegung (wie die SQL-Pruefungen)
+def load_room_bookings():
+    return db_query("SELECT resn, zimm, vndt, bsdt FROM BUZ")
+
+def probe_room_bookings():
+    """Version von BUZ aus dem Fingerprint-Dienst"""
+    return fingerprints.version('BUZ')
+
+MATRIX_MAX_DAYS = 366
+
+availability_index = AvailabilityIndex(
+    load_room_bookings,
+    probe_room_bookings,
+    check_interval=config.get('availability_check_interval', 5)
+)
+
+def room_conflict_precheck(zimm, von, bis):
+    """Schnelle Vorpruefung ueber den Index (True = Zimmer sicher belegt)"""
+    try:
+        return bool(availability_index.conflicts(int(zimm), von, bis))
+    except Exception as e:
+        print(f"[Availability] Index-Vorpruefung uebersprungen: {e}")
+        return False
+
+# Pruefen + Anlegen pro Zimmer serialisieren, damit zwei gleichzeitige
+# Anfragen fuer dasselbe Zimmer nicht beide die Pruefung bestehen
+room_locks = RoomLocks(timeout=config.get('room_lock_timeout', 10))
+
+def room_locked(func):
+    """
+    Decorator fuer Routen, die ein Zimmer belegen ("zimm" im JSON Body):
+    die Route laeuft unter der Sperre dieses Zimmers, andere Zimmer parallel.
+    Ist die Sperre nach room_lock_timeout Sekunden nicht frei: 503.
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        zimm = (request.get_json(silent=True) or {}).get('zimm')
+        if not zimm:
+            return func(*args, **kwargs)
+        try:
+            with room_locks.hold(str(zimm)):
+                return func(*args, **kwargs)
+        except RoomLockTimeout:
+            return jsonify({"error": f"Zimmer {zimm} wird gerade gebucht, bitte erneut versuchen"}), 503
+    return wrapper
+
+# Stammdaten-Cache (ZIM, CAT, ART, CHC, PMT) - Probes erkennen Aenderungen
+ref_cache = ReferenceCache(
+    ttl=config.get('reference_cache_ttl', 600),
+    check_interval=config.get('reference_check_interval', 30)
+)
+
+def register_reference(name, query, table):
+    """Tabelle im Stammdaten-Cache anmelden (Aenderung = neue Fingerprint-Version)"""
+    ref_cache.register(
+        name,
+        lambda: db_query(query),
+        lambda: fingerprints.version(table)
+    )
+
+register_reference(
+    'rooms',
+    "SELECT zimm, beze, bett, stat, catg, betm, maxv, type FROM ZIM ORDER BY zimm",
+    'ZIM'
+)
+register_reference(
+    'categories',
+    "SELECT catg, beze, bez1, bett, type, betm, maxv, maxe, prwa, prsa FROM CAT ORDER BY catg",
+    'CAT'
+)
+register_reference(
+    'articles',
+    "SELECT artn, beze, prei, knto FROM ART ORDER BY artn",
+    'ART'
+)
+register_reference(
+    'channels',
+    "SELECT chid, name FROM CHC ORDER BY chid",
+    'CHC'
+)
+register_reference(
+    'payment_types',
+    "SELECT paym, payt FROM PMT ORDER BY paym",
+    'PMT'
+)
+
+def rooms_with_category():
+    """Aktive Zimmer (stat = 0) mit Kategoriedaten - wie ZIM LEFT JOIN CAT"""
+    categories = ref_cache.index('categories', 'catg')
+    rooms = []
+    for room in ref_cache.get('rooms'):
+        if room['stat'] != 0:
+            continue
+        cat = categories.get(room['catg'], {})
+        rooms.append({
+            "zimm": room['zimm'], "beze": room['beze'], "bett": room['bett'],
+            "catg": room['catg'], "betm": room['betm'], "maxv": room['maxv'],
+            "kategorie": cat.get('beze'), "prwa": cat.get('prwa'), "prsa": cat.get('prsa')
+        })
+    return rooms
+
+def find_article(artn):
+    """Artikel (beze, prei, ...) aus dem Cache, None wenn unbekannt"""
+    try:
+        return ref_cache.lookup('articles', 'artn', int(artn))
+    except (TypeError, ValueError):
+        return None
+
+# ============================================================================
+# HTTP-CACHING (ETag / 304) & KOMPRESSION
+# ============================================================================
+
+COMPRESS_MIN_BYTES = config.get('compress_min_bytes', COMPRESS_MIN_BYTES)
+
+def etag_from(tables=(), references=()):
+    """
+    Decorator: ETag aus den Fingerprint-Versionen der Tabellen bzw. den
+    Versionen der Stammdaten-Cache-Eintraege (+ URL und Tagesdatum).
+    Passt If-None-Match, kommt sofort 304 - ohne die Route auszufuehren.
+    Die Tabellen werden im Hintergrund beobachtet (fingerprints.watch).
+
+    Deckt ein Fingerprint den Inhalt nicht ab (LENGTH_ONLY_FINGERPRINTS),
+    bleibt die Route ohne Abkuerzung: den ETag bildet dann
+    conditional_and_compressed aus dem Body.
+    """
+    def decorator(func):
+        if not fingerprints.exact(tables):
+            return func
+        fingerprints.watch(tables)
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            etag = version_etag(
+                request.full_path,
+                datetime.now().date().isoformat(),
+                sorted(fingerprints.versions(tables).items()) if tables else (),
+                [ref_cache.version(name) for name in references]
+            )
+            if etag_matches(request.headers.get('If-None-Match'), etag):
+                return not_modified(etag)
+            response = flask_app.make_response(func(*args, **kwargs))
+            if response.status_code == 200:
+                response.headers['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
+
+def not_modified(etag):
+    response = flask_app.response_class(status=304)
+    response.headers['ETag'] = etag
+    response.vary.add('Accept-Encoding')
+    return response
+
+@flask_app.after_request
+def conditional_and_compressed(response):
+    """ETag + 304 fuer GET-Antworten, gzip/br ab COMPRESS_MIN_BYTES"""
+    if request.method in ('POST', 'PUT', 'DELETE'):
+        # Eigene Schreibzugriffe sofort sichtbar machen (naechster ETag fragt neu ab)
+        fingerprints.expire()
+        return response
+    if (request.method != 'GET' or response.status_code != 200
+            or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+
+    body = response.get_data()
+    etag = response.headers.get('ETag') or body_etag(body)
+    if etag_matches(request.headers.get('If-None-Match'), etag):
+        return not_modified(etag)
+
+    response.headers['ETag'] = etag
+    response.vary.add('Accept-Encoding')
+    if len(body) >= COMPRESS_MIN_BYTES:
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if encoding:
+            response.set_data(compress_body(body, encoding))
+            response.headers['Content-Encoding'] = encoding
+            response.headers['ETag'] = encoded_etag(etag, encoding)
+    return response
+
+# ============================================================================
+# SINGLE-FLIGHT (parallele identische GETs buendeln)
+# ============================================================================
+
+single_flight = SingleFlight(timeout=config.get('single_flight_timeout', 60))
+
+def request_key():
+    """Pfad + sortierte Query-Parameter - gleiche Anfrage, gleicher Schluessel"""
+    return request.path + '?' + urlencode(sorted(request.args.items(multi=True)))
+
+def snapshot_response(response):
+    """Antwort als (body, status, headers) - kann zwischen Requests geteilt werden"""
+    return response.get_data(), response.status_code, list(response.headers.items())
+
+def restore_response(snapshot):
+    body, status, headers = snapshot
+    return flask_app.response_class(body, status=status, headers=headers)
+
+def coalesced(func):
+    """
+    Decorator: gleichzeitige identische GETs (Pfad + sortierte Query-Parameter)
+    teilen sich eine Ausfuehrung der Route. Abschaltbar global mit
+    "single_flight": false oder pro Route, z.B. "single_flight_disabled": ["/stats"].
+    """
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        rule = request.url_rule.rule if request.url_rule else request.path
+        if (not config.get('single_flight', True)
+                or rule in config.get('single_flight_disabled', ())
+                or wants_stream()):
+            return func(*args, **kwargs)
+
+        def compute():
+            return snapshot_response(flask_app.make_response(func(*args, **kwargs)))
+
+        snapshot, _ = single_flight.do(request_key(), compute, group=rule)
+        return restore_response(snapshot)
+    return wrapper
+
 @flask_app.route('/')
 def index():
     return jsonify({
@@ -212,16 +825,18 @@ def index():
         "version": BRIDGE_VERSION,
         "status": "running",
         "database": config['database_path'],
+        "db_backend": config.get('db_backend', 'access'),
         "timestamp": datetime.now().isoformat(),
         "endpoints": {
             "rooms": "/rooms",
             "categories": "/categories",
             "availability": "/availability?from=YYYY-MM-DD&to=YYYY-MM-DD",
+            "availability_matrix": "/availability/matrix?from=YYYY-MM-DD&to=YYYY-MM-DD",
             "bookings": "/bookings",
             "guests": "/guests",
             "articles": "/articles",
             "channels": "/channels",
-            "calendar": "/calendar?month=MM&year=YYYY",
+            "calendar": "/calendar?start_date=YYYY-MM-DD&end_date=YYYY-MM-DD[&occupancy=rle]",
             "stats": "/stats",
             "checkin": "/checkin/<resn> (PUT)",
             "checkout": "/checkout/<resn> (PUT)",
@@ -260,14 +875,70 @@ def health():
     try:
         conn = get_db()
         conn.close()
-        return jsonify({"status": "healthy", "database": "connected"})
+        return jsonify({
+            "status": "healthy",
+            "database": "connected",
+            "pool": db_pool.stats(),
+            "availability_index": availability_index.stats(),
+            "reference_cache": ref_cache.stats(),
+            "json_encoder": JSON_BACKEND,
+            "single_flight": single_flight.stats(),
+            "sequences": sequences.stats(),
+            "account_poster": account_poster.stats(),
+            "room_locks": room_locks.stats(),
+            "write_queue": write_queue.stats()
+        })
     except Exception as e:
-        return jsonify({"status": "unhealthy", "error": str(e)}), 500
+        return jsonify({"status": "unhealthy", "error": str(e), "pool": db_pool.stats()}), 500
+
+@flask_app.route('/metrics')
+def get_metrics():
+    """Metriken fuer Prometheus (Textformat): HTTP, DB-Pool, Backup, Firebase-Sync"""
+    return Response(metrics.render(), content_type=METRICS_CONTENT_TYPE)
+
+@flask_app.route('/debug/queries')
+def debug_queries():
+    """SQL-Laufzeiten pro Statement (Fingerprint) und Slow-Log
+
+    Query-Parameter:
+    - sort=total|mean|p95|calls|rows|fetch (Standard: total)
+    - limit=50: Anzahl Statements / Slow-Log-Eintraege
+    - reset=1: Zaehler nach der Ausgabe zuruecksetzen
+    """
+    sort = request.args.get('sort', 'total')
+    if sort not in QUERY_SORT_KEYS:
+        return jsonify({"error": f"sort muss einer von {', '.join(QUERY_SORT_KEYS)} sein"}), 400
+    result = query_stats.stats(sort, request.args.get('limit', 50, type=int))
+    if request.args.get('reset') == '1':
+        query_stats.reset()
+    return jsonify(result)
+
+@flask_app.route('/fingerprints')
+def get_fingerprints():
+    """Versionsnummer pro Tabelle (steigt bei jeder erkannten Aenderung)
+
+    Query-Parameter:
+    - refresh=1: sofort neu abfragen statt Werte bis fingerprint_interval zu verwenden
+    """
+    if request.args.get('refresh') == '1':
+        fingerprints.poll()
+    else:
+        fingerprints.versions()
+    return jsonify(fingerprints.stats())
+
+@flask_app.route('/reference/invalidate', methods=['POST'])
+def invalidate_reference_data():
+    """Stammdaten-Cache leeren (optional ?name=rooms|categories|articles|channels|payment_types)"""
+    name = request.args.get('name')
+    if name and name not in ref_cache.stats():
+        return jsonify({"error": f"Unbekannte Stammdaten: {name}"}), 404
+    ref_cache.invalidate(name)
+    return jsonify({"success": True, "invalidated": name or "all"})
 
 @flask_app.route('/rooms')
+@etag_from(references=('rooms',))
 def get_rooms():
-    query = "SELECT zimm, beze, bett, stat, catg, betm, maxv, type FROM ZIM ORDER BY zimm"
-    rooms = db_query(query)
+    rooms = ref_cache.get('rooms')
     return jsonify({"count": len(rooms), "rooms": [serialize_row(r) for r in rooms]})
 
 @flask_app.route('/rooms/<int:zimm>')
@@ -280,23 +951,21 @@ def get_room(zimm):
 
 @flask_app.route('/articles')
 def get_articles():
-    query = "SELECT artn, beze, prei, knto FROM ART ORDER BY artn"
-    articles = db_query(query)
+    articles = ref_cache.get('articles')
     return jsonify({"count": len(articles), "articles": [serialize_row(a) for a in articles]})
 
 @flask_app.route('/channels')
 def get_channels():
     try:
-        query = "SELECT chid, name FROM CHC ORDER BY chid"
-        channels = db_query(query)
+        channels = ref_cache.get('channels')
         return jsonify({"count": len(channels), "channels": [serialize_row(c) for c in channels]})
     except:
         return jsonify({"count": 0, "channels": []})
 
 @flask_app.route('/categories')
+@etag_from(references=('categories',))
 def get_categories():
-    query = "SELECT catg, beze, bez1, bett, type, betm, maxv, maxe FROM CAT ORDER BY catg"
-    categories = db_query(query)
+    categories = ref_cache.get('categories')
     return jsonify({"count": len(categories), "categories": [serialize_row(c) for c in categories]})
 
 @flask_app.route('/availability')
@@ -309,27 +978,17 @@ def check_availability():
     if not date_from or not date_to:
         return jsonify({"error": "Parameter 'from' und 'to' erforderlich"}), 400
 
-    query_booked = "SELECT DISTINCT zimm FROM BUZ WHERE vndt <= ? AND bsdt >= ?"
-    booked = db_query(query_booked, (date_to, date_from))
-    booked_ids = [b['zimm'] for b in booked]
+    try:
+        booked_ids = availability_index.occupied_rooms(date_from, date_to)
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
 
-    query_rooms = """
-        SELECT ZIM.zimm, ZIM.beze, ZIM.bett, ZIM.catg, ZIM.betm, ZIM.maxv,
-               CAT.beze as kategorie, CAT.prwa, CAT.prsa
-        FROM ZIM LEFT JOIN CAT ON ZIM.catg = CAT.catg
-        WHERE ZIM.stat = 0
-    """
-    all_rooms = db_query(query_rooms)
+    all_rooms = rooms_with_category()
 
-    available = []
-    for room in all_rooms:
-        if room['zimm'] in booked_ids:
-            continue
-        if category and room['catg'] != category:
-            continue
-        if persons and (room['maxv'] or 2) < persons:
-            continue
-        available.append(serialize_row(room))
+    available = [
+        serialize_row(room)
+        for room in availability_index.free_rooms(all_rooms, date_from, date_to, category, persons)
+    ]
 
     return jsonify({
         "from": date_from, "to": date_to,
@@ -337,14 +996,73 @@ def check_availability():
         "available_count": len(available), "available": available
     })
 
+@flask_app.route('/availability/matrix')
+@coalesced
+def availability_matrix():
+    """
+    Verfuegbarkeits-Matrix: freie Zimmer pro Tag und Kategorie
+
+    Query-Parameter:
+    - from: Startdatum (YYYY-MM-DD)
+    - to: Enddatum (YYYY-MM-DD, inklusive, max. 366 Tage)
+
+    Ein Zimmer gilt an einem Tag als belegt, wenn eine Belegung
+    die Nacht ab diesem Tag belegt (Anreise <= Tag < Abreise, wie die
+    Belegung in /calendar) - der Abreisetag ist fuer die naechste Anreise frei.
+    """
+    date_from = request.args.get('from')
+    date_to = request.args.get('to')
+
+    if not date_from or not date_to:
+        return jsonify({"error": "Parameter 'from' und 'to' erforderlich"}), 400
+
+    try:
+        start = datetime.strptime(date_from[:10], '%Y-%m-%d').date()
+        end = datetime.strptime(date_to[:10], '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
+
+    days = (end - start).days + 1
+    if days < 1:
+        return jsonify({"error": "'to' muss nach 'from' liegen"}), 400
+    if days > MATRIX_MAX_DAYS:
+        return jsonify({"error": f"Zeitraum zu lang (max. {MATRIX_MAX_DAYS} Tage)"}), 400
+
+    rooms = [r for r in ref_cache.get('rooms') if r['stat'] == 0]
+    categories = list(ref_cache.get('categories'))
+    matrix = availability_index.free_matrix(rooms, start, end)
+
+    empty = {"rooms": 0, "free": [0] * days, "max_free": [0] * days}
+    known = {c['catg'] for c in categories}
+    # Zimmer mit unbekannter Kategorie nicht unterschlagen
+    categories += [{"catg": catg, "beze": None} for catg in matrix if catg not in known]
+
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "days": [(start + timedelta(days=i)).isoformat() for i in range(days)],
+        "total_rooms": len(rooms),
+        "categories": [
+            {
+                "catg": c['catg'],
+                "beze": c['beze'],
+                "total_rooms": matrix.get(c['catg'], empty)['rooms'],
+                "free": matrix.get(c['catg'], empty)['free'],
+                "max_free_persons": matrix.get(c['catg'], empty)['max_free']
+            }
+            for c in categories
+        ]
+    })
+
 @flask_app.route('/bookings')
 def get_bookings():
-    limit = request.args.get('limit', 500, type=int)
+    limit = max(1, request.args.get('limit', 500, type=int))
     date_from = request.args.get('from')
     date_to = request.args.get('to')
+    cursor = request.args.get('cursor')
 
     query = f"""
-        SELECT TOP {limit} BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande, BUC.chid,
+        SELECT TOP {limit + 1} BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande, BUC.chid,
                GKT.vorn, GKT.nacn, GKT.mail
         FROM BUC LEFT JOIN GKT ON BUC.gast = GKT.gast
         WHERE 1=1
@@ -356,10 +1074,20 @@ def get_bookings():
     if date_to:
         query += " AND BUC.ande <= ?"
         params.append(date_to)
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'resn')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND BUC.resn < ?"
     query += " ORDER BY BUC.resn DESC"
 
-    bookings = db_query(query, params if params else None)
-    return jsonify({"count": len(bookings), "bookings": [serialize_row(b) for b in bookings]})
+    if wants_stream():
+        return stream_query(query, params, limit=limit, key='resn')
+
+    bookings, next_cursor = keyset_page(db_rows(query, params), limit, 'resn')
+    return jsonify({"count": len(bookings), "bookings": bookings,
+                    "next_cursor": next_cursor})
 
 @flask_app.route('/bookings/<int:resn>')
 def get_booking(resn):
@@ -378,42 +1106,51 @@ def get_booking(resn):
         FROM BUZ LEFT JOIN ZIM ON BUZ.zimm = ZIM.zimm
         WHERE BUZ.resn = ?
     """
-    rooms = db_query(query_buz, (resn,))
+    rooms = db_rows(query_buz, (resn,))
 
     query_akz = """
         SELECT AKZ.*, ART.beze as artikel_name
         FROM AKZ LEFT JOIN ART ON AKZ.artn = ART.artn
         WHERE AKZ.resn = ?
     """
-    account = db_query(query_akz, (resn,))
+    account = db_rows(query_akz, (resn,))
 
     result = serialize_row(booking)
-    result['rooms'] = [serialize_row(r) for r in rooms]
-    result['account'] = [serialize_row(a) for a in account]
+    result['rooms'] = rooms
+    result['account'] = account
     result['account_total'] = sum(a.get('prei', 0) or 0 for a in account)
     return jsonify(result)
 
 @flask_app.route('/guests')
+@etag_from(tables=('GKT',))
 def get_guests():
-    limit = request.args.get('limit', 1000, type=int)
+    limit = max(1, request.args.get('limit', 1000, type=int))
     search = request.args.get('q', '')
+    cursor = request.args.get('cursor')
 
+    query = f"""
+        SELECT TOP {limit + 1} gast, vorn, nacn, mail, teln, stra, polz, ortb, land
+        FROM GKT WHERE 1=1
+    """
+    params = []
     if search:
-        query = f"""
-            SELECT TOP {limit} gast, vorn, nacn, mail, teln, stra, polz, ortb, land
-            FROM GKT WHERE vorn LIKE ? OR nacn LIKE ? OR mail LIKE ?
-            ORDER BY gast DESC
-        """
         search_term = f"%{search}%"
-        guests = db_query(query, (search_term, search_term, search_term))
-    else:
-        query = f"""
-            SELECT TOP {limit} gast, vorn, nacn, mail, teln, stra, polz, ortb, land
-            FROM GKT ORDER BY gast DESC
-        """
-        guests = db_query(query)
+        query += " AND (vorn LIKE ? OR nacn LIKE ? OR mail LIKE ?)"
+        params.extend([search_term, search_term, search_term])
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'gast')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND gast < ?"
+    query += " ORDER BY gast DESC"
+
+    if wants_stream():
+        return stream_query(query, params, limit=limit, key='gast')
 
-    return jsonify({"count": len(guests), "guests": [serialize_row(g) for g in guests]})
+    guests, next_cursor = keyset_page(db_rows(query, params), limit, 'gast')
+    return jsonify({"count": len(guests), "guests": guests,
+                    "next_cursor": next_cursor})
 
 @flask_app.route('/guests/<int:gast>')
 def get_guest(gast):
@@ -443,18 +1180,44 @@ def get_account(resn):
     return jsonify({"resn": resn, "count": len(positions), "total": total, "positions": [serialize_row(p) for p in positions]})
 
 @flask_app.route('/calendar')
+@etag_from(tables=('BUZ', 'BUC', 'GKT'), references=('rooms',))
+@coalesced
 def get_calendar():
-    from datetime import timedelta
-    month = request.args.get('month', datetime.now().month, type=int)
-    year = request.args.get('year', datetime.now().year, type=int)
-    days = request.args.get('days', 30, type=int)
-
-    start_date = datetime(year, month, 1)
-    end_date = start_date + timedelta(days=days)
+    """
+    Belegungskalender
 
-    query_rooms = "SELECT zimm, beze FROM ZIM ORDER BY zimm"
-    rooms = db_query(query_rooms)
+    Query-Parameter:
+    - start_date / end_date: Zeitraum (YYYY-MM-DD, end_date inklusive, max. 366 Tage)
+    - month / year / days: alternativ Monatsbeginn + Anzahl Tage (default 30)
+    - occupancy=rle: zusaetzlich Belegung pro Zimmer als [[resn, Naechte], ...]
+      (resn 0 = frei)
+    """
+    start_arg = request.args.get('start_date')
+    end_arg = request.args.get('end_date')
 
+    try:
+        if start_arg:
+            start_date = datetime.strptime(start_arg[:10], '%Y-%m-%d')
+            end_date = (datetime.strptime(end_arg[:10], '%Y-%m-%d') if end_arg
+                        else start_date + timedelta(days=30))
+        else:
+            month = request.args.get('month', datetime.now().month, type=int)
+            year = request.args.get('year', datetime.now().year, type=int)
+            days = request.args.get('days', 30, type=int)
+            start_date = datetime(year, month, 1)
+            end_date = start_date + timedelta(days=days)
+    except ValueError:
+        return jsonify({"error": "Ungueltiges Datum (Format YYYY-MM-DD)"}), 400
+
+    if end_date < start_date:
+        return jsonify({"error": "end_date muss nach start_date liegen"}), 400
+    if (end_date - start_date).days + 1 > CALENDAR_MAX_DAYS:
+        return jsonify({"error": f"Zeitraum zu lang (max. {CALENDAR_MAX_DAYS} Tage)"}), 400
+
+    # Alle Zimmer
+    rooms = ref_cache.get('rooms')
+
+    # Buchungen im Zeitraum
     query_bookings = """
         SELECT BUZ.zimm, BUZ.vndt, BUZ.bsdt, BUZ.resn, BUZ.pers,
                BUC.stat, BUC.gast, GKT.nacn
@@ -464,25 +1227,27 @@ def get_calendar():
     """
     bookings = db_query(query_bookings, (end_date.strftime('%Y-%m-%d'), start_date.strftime('%Y-%m-%d')))
 
-    calendar = []
-    for room in rooms:
-        room_bookings = [
-            {"resn": b['resn'], "from": b['vndt'].strftime('%Y-%m-%d') if b['vndt'] else None,
-             "to": b['bsdt'].strftime('%Y-%m-%d') if b['bsdt'] else None,
-             "guest": b['nacn'], "persons": b['pers'], "status": b['stat']}
-            for b in bookings if b['zimm'] == room['zimm']
-        ]
-        calendar.append({"zimm": room['zimm'], "name": room['beze'], "bookings": room_bookings})
+    # Kalender aufbauen (Buchungen in einem Durchlauf nach Zimmer gruppiert)
+    calendar = build_calendar(
+        rooms, bookings, start_date.date(), end_date.date(),
+        occupancy=request.args.get('occupancy') == 'rle'
+    )
 
-    return jsonify({"start": start_date.strftime('%Y-%m-%d'), "end": end_date.strftime('%Y-%m-%d'), "rooms": calendar})
+    return jsonify({
+        "start": start_date.strftime('%Y-%m-%d'),
+        "end": end_date.strftime('%Y-%m-%d'),
+        "rooms": calendar
+    })
 
 @flask_app.route('/stats')
+@etag_from(tables=('GKT', 'BUC'), references=('rooms',))
+@coalesced
 def get_stats():
     from collections import Counter
     stats = {}
     stats['total_guests'] = db_query("SELECT COUNT(*) as c FROM GKT", fetchone=True)['c']
     stats['total_bookings'] = db_query("SELECT COUNT(*) as c FROM BUC", fetchone=True)['c']
-    stats['total_rooms'] = db_query("SELECT COUNT(*) as c FROM ZIM", fetchone=True)['c']
+    stats['total_rooms'] = len(ref_cache.get('rooms'))
     return jsonify(stats)
 
 # ============================================================================
@@ -496,28 +1261,16 @@ def checkin(resn):
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
     zimm = request.args.get('zimm', type=int)
-    conn = get_db()
-    cursor = conn.cursor()
-
-    try:
-        if zimm:
-            cursor.execute("UPDATE BUZ SET ckin = 2 WHERE resn = ? AND zimm = ?", (resn, zimm))
-        else:
-            cursor.execute("UPDATE BUZ SET ckin = 2 WHERE resn = ?", (resn,))
-
-        affected = cursor.rowcount
-        conn.commit()
+    if zimm:
+        affected = queued_execute("UPDATE BUZ SET ckin = 2 WHERE resn = ? AND zimm = ?", (resn, zimm))
+    else:
+        affected = queued_execute("UPDATE BUZ SET ckin = 2 WHERE resn = ?", (resn,))
 
-        if affected == 0:
-            return jsonify({"error": "Keine Zimmer zum Einchecken gefunden"}), 404
+    if affected == 0:
+        return jsonify({"error": "Keine Zimmer zum Einchecken gefunden"}), 404
 
-        return jsonify({"success": True, "resn": resn, "zimm": zimm, "rooms_checked_in": affected,
-                        "message": f"Check-in fuer Buchung {resn} erfolgreich"})
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return jsonify({"success": True, "resn": resn, "zimm": zimm, "rooms_checked_in": affected,
+                    "message": f"Check-in fuer Buchung {resn} erfolgreich"})
 
 @flask_app.route('/checkout/<int:resn>', methods=['PUT'])
 def checkout(resn):
@@ -526,28 +1279,16 @@ def checkout(resn):
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
     zimm = request.args.get('zimm', type=int)
-    conn = get_db()
-    cursor = conn.cursor()
+    if zimm:
+        affected = queued_execute("UPDATE BUZ SET ckin = 4 WHERE resn = ? AND zimm = ?", (resn, zimm))
+    else:
+        affected = queued_execute("UPDATE BUZ SET ckin = 4 WHERE resn = ?", (resn,))
 
-    try:
-        if zimm:
-            cursor.execute("UPDATE BUZ SET ckin = 4 WHERE resn = ? AND zimm = ?", (resn, zimm))
-        else:
-            cursor.execute("UPDATE BUZ SET ckin = 4 WHERE resn = ?", (resn,))
+    if affected == 0:
+        return jsonify({"error": "Keine Zimmer zum Auschecken gefunden"}), 404
 
-        affected = cursor.rowcount
-        conn.commit()
-
-        if affected == 0:
-            return jsonify({"error": "Keine Zimmer zum Auschecken gefunden"}), 404
-
-        return jsonify({"success": True, "resn": resn, "zimm": zimm, "rooms_checked_out": affected,
-                        "message": f"Check-out fuer Buchung {resn} erfolgreich"})
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    return jsonify({"success": True, "resn": resn, "zimm": zimm, "rooms_checked_out": affected,
+                    "message": f"Check-out fuer Buchung {resn} erfolgreich"})
 
 @flask_app.route('/checkin-status/<int:resn>')
 def get_checkin_status(resn):
@@ -556,15 +1297,14 @@ def get_checkin_status(resn):
         FROM BUZ LEFT JOIN ZIM ON BUZ.zimm = ZIM.zimm
         WHERE BUZ.resn = ?
     """
-    rooms = db_query(query, (resn,))
+    rooms = db_rows(query, (resn,), dates='day')
     if not rooms:
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
     status_map = {0: "nicht eingecheckt", 2: "eingecheckt", 4: "ausgecheckt"}
     result = [{"zimm": r['zimm'], "name": r['beze'], "ckin": r['ckin'],
                "status": status_map.get(r['ckin'], f"unbekannt ({r['ckin']})"),
-               "von": r['vndt'].strftime('%Y-%m-%d') if r['vndt'] else None,
-               "bis": r['bsdt'].strftime('%Y-%m-%d') if r['bsdt'] else None} for r in rooms]
+               "von": r['vndt'], "bis": r['bsdt']} for r in rooms]
     return jsonify({"resn": resn, "rooms": result})
 
 # ============================================================================
@@ -602,10 +1342,13 @@ def register_guest(resn):
     try:
         gast_id = data.get('gast')
 
-        if not gast_id and data.get('nachname'):
-            cursor.execute("SELECT MAX(gkid) FROM GKI")
-            max_gkid = cursor.fetchone()[0] or 0
-            gast_id = max_gkid + 1
+        # Nummern vor dem ersten INSERT vergeben (Abgleich liest auf derselben Verbindung)
+        new_guest = not gast_id and data.get('nachname')
+        if new_guest:
+            gast_id = sequences.next('GKI')
+        annr = sequences.next('ANM')
+
+        if new_guest:
             gebd = datetime.strptime(data['geburtsdatum'], '%Y-%m-%d') if data.get('geburtsdatum') else None
             cursor.execute("INSERT INTO GKI (gkid, vorn, nacn, gebd, land) VALUES (?, ?, ?, ?, ?)",
                           (gast_id, data.get('vorname', ''), data.get('nachname', ''), gebd, data.get('land', '')))
@@ -613,10 +1356,6 @@ def register_guest(resn):
         if not gast_id:
             gast_id = booking['gast']
 
-        cursor.execute("SELECT MAX(annr) FROM ANM")
-        max_annr = cursor.fetchone()[0] or 0
-        annr = max_annr + 1
-
         cursor.execute("INSERT INTO ANM (annr, resn, gast, stat, dat1, dat2, pers, kind, numr) VALUES (?, ?, ?, 6, ?, ?, ?, ?, ?)",
                       (annr, resn, gast_id, booking['andf'], booking['ande'], data.get('pers', 1), data.get('kind', 0), zimm))
 
@@ -635,7 +1374,7 @@ def deregister_guest(annr):
     if not registration:
         return jsonify({"error": "Anmeldung nicht gefunden"}), 404
 
-    db_execute("UPDATE ANM SET stat = 4 WHERE annr = ?", (annr,))
+    queued_execute("UPDATE ANM SET stat = 4 WHERE annr = ?", (annr,))
     return jsonify({"success": True, "annr": annr, "message": f"Gast wurde abgemeldet (ANM {annr})"})
 
 # ============================================================================
@@ -644,13 +1383,14 @@ def deregister_guest(annr):
 
 @flask_app.route('/invoices')
 def get_invoices():
-    limit = request.args.get('limit', 100, type=int)
+    limit = max(1, request.args.get('limit', 100, type=int))
     date_from = request.args.get('from')
     date_to = request.args.get('to')
     guest = request.args.get('guest', type=int)
+    cursor = request.args.get('cursor')
 
     query = f"""
-        SELECT TOP {limit} REC.rnum, REC.edat, REC.rbez, REC.gast,
+        SELECT TOP {limit + 1} REC.rnum, REC.edat, REC.rbez, REC.gast,
                REC.pmv1, REC.pmv2, REC.pmv3, REC.pmta, GKT.vorn, GKT.nacn
         FROM REC LEFT JOIN GKT ON REC.gast = GKT.gast
         WHERE 1=1
@@ -665,16 +1405,20 @@ def get_invoices():
     if guest:
         query += " AND REC.gast = ?"
         params.append(guest)
+    if cursor:
+        try:
+            params.append(int(decode_cursor(cursor, 'rnum')))
+        except (TypeError, ValueError):
+            return jsonify({"error": "Ungueltiger Cursor"}), 400
+        query += " AND REC.rnum < ?"
     query += " ORDER BY REC.rnum DESC"
 
-    invoices = db_query(query, params if params else None)
-    result = []
-    for inv in invoices:
-        total = abs(inv.get('pmv1', 0) or 0) + abs(inv.get('pmv2', 0) or 0) + abs(inv.get('pmv3', 0) or 0)
-        r = serialize_row(inv)
-        r['total'] = total
-        result.append(r)
-    return jsonify({"count": len(result), "invoices": result})
+    if wants_stream():
+        return stream_query(query, params, serialize=invoice_row, limit=limit, key='rnum')
+
+    invoices, next_cursor = keyset_page(db_rows(query, params), limit, 'rnum')
+    result = [invoice_row(inv) for inv in invoices]
+    return jsonify({"count": len(result), "invoices": result, "next_cursor": next_cursor})
 
 @flask_app.route('/invoices/<int:rnum>')
 def get_invoice(rnum):
@@ -708,14 +1452,7 @@ def get_invoices_by_booking(resn):
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
     query = "SELECT REC.rnum, REC.edat, REC.rbez, REC.pmv1, REC.pmv2, REC.pmv3 FROM REC WHERE REC.gast = ? ORDER BY REC.rnum DESC"
-    invoices = db_query(query, (booking['gast'],))
-
-    result = []
-    for inv in invoices:
-        total = abs(inv.get('pmv1', 0) or 0) + abs(inv.get('pmv2', 0) or 0) + abs(inv.get('pmv3', 0) or 0)
-        r = serialize_row(inv)
-        r['total'] = total
-        result.append(r)
+    result = [invoice_row(inv) for inv in db_rows(query, (booking['gast'],))]
     return jsonify({"resn": resn, "gast": booking['gast'], "count": len(result), "invoices": result})
 
 # ============================================================================
@@ -723,6 +1460,7 @@ def get_invoices_by_booking(resn):
 # ============================================================================
 
 @flask_app.route('/option', methods=['POST'])
+@room_locked
 def create_option():
     data = request.json
     if not data:
@@ -739,6 +1477,15 @@ def create_option():
     if not all([zimm, von, bis]):
         return jsonify({"error": "zimm, von, bis sind erforderlich"}), 400
 
+    # Einmal normalisieren: Index, Sperre und INSERTs verwenden dieselbe Nummer
+    try:
+        zimm = int(zimm)
+    except (TypeError, ValueError):
+        return jsonify({"error": "zimm muss eine Zimmer-Nummer sein"}), 400
+
+    if room_conflict_precheck(zimm, von, bis):
+        return jsonify({"error": "Zimmer ist im Zeitraum bereits belegt"}), 409
+
     query_check = "SELECT COUNT(*) as c FROM BUZ WHERE zimm = ? AND vndt <= ? AND bsdt >= ?"
     check = db_query(query_check, (zimm, bis, von), fetchone=True)
     if check['c'] > 0:
@@ -748,23 +1495,23 @@ def create_option():
     cursor = conn.cursor()
 
     try:
-        if not gast and data.get('nachname'):
-            cursor.execute("SELECT MAX(gast) FROM GKT")
-            max_gast = cursor.fetchone()[0] or 0
-            gast = max_gast + 1
+        # Nummern vor dem ersten INSERT vergeben (Abgleich liest auf derselben Verbindung)
+        new_guest = not gast and data.get('nachname')
+        if new_guest:
+            gast = sequences.next('GKT')
+        resn = sequences.next('BUC')
+
+        if new_guest:
             cursor.execute("INSERT INTO GKT (gast, vorn, nacn, mail) VALUES (?, ?, ?, ?)",
                           (gast, data.get('vorname', ''), data.get('nachname', ''), data.get('email', '')))
 
-        cursor.execute("SELECT MAX(resn) FROM BUC")
-        max_resn = cursor.fetchone()[0] or 0
-        resn = max_resn + 1
-
         cursor.execute("INSERT INTO BUC (resn, gast, stat, andf, ande, chid, bdat) VALUES (?, ?, 2, ?, ?, ?, ?)",
                       (resn, gast, von, bis, channel, datetime.now()))
         cursor.execute("INSERT INTO BUZ (resn, lfdn, zimm, vndt, bsdt, pers, kndr) VALUES (?, 1, ?, ?, ?, ?, ?)",
                       (resn, zimm, von, bis, pers, kndr))
 
         conn.commit()
+        availability_index.add(resn, zimm, von, bis)
         return jsonify({"success": True, "resn": resn, "gast": gast, "message": f"Option {resn} wurde angelegt"}), 201
     except Exception as e:
         conn.rollback()
@@ -794,6 +1541,7 @@ def cancel_booking(resn):
         cursor.execute("DELETE FROM BUZ WHERE resn = ?", (resn,))
         cursor.execute("UPDATE BUC SET stat = 65536 WHERE resn = ?", (resn,))
         conn.commit()
+        availability_index.remove(resn)
         return jsonify({"success": True, "resn": resn, "message": f"Buchung {resn} wurde storniert"})
     except Exception as e:
         conn.rollback()
@@ -811,9 +1559,7 @@ def create_guest():
     cursor = conn.cursor()
 
     try:
-        cursor.execute("SELECT MAX(gast) FROM GKT")
-        max_gast = cursor.fetchone()[0] or 0
-        gast = max_gast + 1
+        gast = sequences.next('GKT')
 
         cursor.execute("INSERT INTO GKT (gast, vorn, nacn, mail, teln, stra, polz, ortb, land) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
                       (gast, data.get('vorname', ''), data.get('nachname', ''), data.get('email', ''),
@@ -852,7 +1598,7 @@ def update_guest(gast):
 
     params.append(gast)
     query = f"UPDATE GKT SET {', '.join(updates)} WHERE gast = ?"
-    db_execute(query, params)
+    queued_execute(query, params)
     return jsonify({"success": True, "gast": gast, "message": f"Gast {gast} wurde aktualisiert"})
 
 @flask_app.route('/service', methods=['POST'])
@@ -868,34 +1614,23 @@ def add_service():
     if not booking:
         return jsonify({"error": "Buchung nicht gefunden"}), 404
 
-    article = db_query("SELECT beze, prei FROM ART WHERE artn = ?", (artn,), fetchone=True)
+    article = find_article(artn)
     prei = data.get('prei', article['prei'] if article else 0)
     bez1 = data.get('bez1', article['beze'] if article else '')
 
-    conn = get_db()
-    cursor = conn.cursor()
-
-    try:
-        cursor.execute("SELECT MAX(aknr) FROM AKZ")
-        max_aknr = cursor.fetchone()[0] or 0
-        aknr = max_aknr + 1
-
-        cursor.execute("INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1) VALUES (?, 1, ?, ?, ?, ?, ?, ?)",
-                      (aknr, datetime.now(), resn, data.get('zimm', 0), artn, prei, bez1))
-        conn.commit()
-        return jsonify({"success": True, "aknr": aknr, "resn": resn, "artn": artn, "prei": prei,
-                        "message": "Leistung wurde auf Konto gebucht"}), 201
-    except Exception as e:
-        conn.rollback()
-        raise e
-    finally:
-        conn.close()
+    first = account_poster.reserve(1)
+    aknr = queued_write(lambda conn: account_poster.post(conn, [{
+        "resn": resn, "zimm": data.get('zimm', 0), "artn": artn, "prei": prei, "bez1": bez1
+    }], commit=False, first=first))[0]['aknr']
+    return jsonify({"success": True, "aknr": aknr, "resn": resn, "artn": artn, "prei": prei,
+                    "message": "Leistung wurde auf Konto gebucht"}), 201
 
 # ============================================================================
 # BLOCKIERUNGEN (Zeiträume sperren)
 # ============================================================================
 
 @flask_app.route('/block', methods=['POST'])
+@room_locked
 def create_block():
     """Zeitraum blockieren (z.B. Renovierung, Betriebsurlaub)"""
     data = request.json
@@ -910,7 +1645,16 @@ def create_block():
     if not all([zimm, von, bis]):
         return jsonify({"error": "zimm, von, bis sind erforderlich"}), 400
 
-    # Check if room is already booked
+    # Einmal normalisieren: Index, Sperre und INSERTs verwenden dieselbe Nummer
+    try:
+        zimm = int(zimm)
+    except (TypeError, ValueError):
+        return jsonify({"error": "zimm muss eine Zimmer-Nummer sein"}), 400
+
+    # Check if room is already booked (index first, then database)
+    if room_conflict_precheck(zimm, von, bis):
+        return jsonify({"error": "Zimmer ist im Zeitraum bereits belegt"}), 409
+
     query_check = "SELECT COUNT(*) as c FROM BUZ WHERE zimm = ? AND vndt <= ? AND bsdt >= ?"
     check = db_query(query_check, (zimm, bis, von), fetchone=True)
     if check['c'] > 0:
@@ -921,9 +1665,7 @@ def create_block():
 
     try:
         # Get next reservation number
-        cursor.execute("SELECT MAX(resn) FROM BUC")
-        max_resn = cursor.fetchone()[0] or 0
-        resn = max_resn + 1
+        resn = sequences.next('BUC')
 
         # Create blocking: stat=0 (Option), flgl=4 (visible in calendar)
         cursor.execute("""
@@ -938,6 +1680,7 @@ def create_block():
         """, (resn, zimm, von, bis))
 
         conn.commit()
+        availability_index.add(resn, zimm, von, bis)
         return jsonify({
             "success": True,
             "resn": resn,
@@ -972,6 +1715,7 @@ def delete_block(resn):
         cursor.execute("DELETE FROM BUZ WHERE resn = ?", (resn,))
         cursor.execute("DELETE FROM BUC WHERE resn = ?", (resn,))
         conn.commit()
+        availability_index.remove(resn)
         return jsonify({"success": True, "resn": resn, "message": f"Blockierung {resn} wurde entfernt"})
     except Exception as e:
         conn.rollback()
@@ -1064,7 +1808,7 @@ def add_meal(resn):
         return jsonify({"error": f"Ungueltiger Typ: {typ}. Erlaubt: {list(HP_ARTICLES.keys())}"}), 400
 
     # Get article price
-    article = db_query("SELECT beze, prei FROM ART WHERE artn = ?", (artn,), fetchone=True)
+    article = find_article(artn)
     if not article:
         return jsonify({"error": f"HP-Artikel {artn} nicht gefunden"}), 404
 
@@ -1072,19 +1816,11 @@ def add_meal(resn):
     bez1 = f"{article['beze']} ({datum})"
 
     conn = get_db()
-    cursor = conn.cursor()
 
     try:
-        cursor.execute("SELECT MAX(aknr) FROM AKZ")
-        max_aknr = cursor.fetchone()[0] or 0
-        aknr = max_aknr + 1
-
-        cursor.execute("""
-            INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1)
-            VALUES (?, 1, ?, ?, ?, ?, ?, ?)
-        """, (aknr, datum, resn, zimm, artn, prei, bez1))
-
-        conn.commit()
+        aknr = account_poster.post(conn, [{
+            "edat": datum, "resn": resn, "zimm": zimm, "artn": artn, "prei": prei, "bez1": bez1
+        }])[0]['aknr']
         return jsonify({
             "success": True,
             "aknr": aknr,
@@ -1125,7 +1861,7 @@ def cancel_meal(resn):
         return jsonify({"error": f"Ungueltiger Typ: {typ}"}), 400
 
     # Get article price
-    article = db_query("SELECT beze, prei FROM ART WHERE artn = ?", (artn,), fetchone=True)
+    article = find_article(artn)
     if not article:
         return jsonify({"error": f"HP-Artikel {artn} nicht gefunden"}), 404
 
@@ -1134,19 +1870,11 @@ def cancel_meal(resn):
     bez1 = f"STORNO: {article['beze']} ({datum})"
 
     conn = get_db()
-    cursor = conn.cursor()
 
     try:
-        cursor.execute("SELECT MAX(aknr) FROM AKZ")
-        max_aknr = cursor.fetchone()[0] or 0
-        aknr = max_aknr + 1
-
-        cursor.execute("""
-            INSERT INTO AKZ (aknr, lfdn, edat, resn, zimm, artn, prei, bez1)
-            VALUES (?, 1, ?, ?, ?, ?, ?, ?)
-        """, (aknr, datum, resn, zimm, artn, prei, bez1))
-
-        conn.commit()
+        aknr = account_poster.post(conn, [{
+            "edat": datum, "resn": resn, "zimm": zimm, "artn": artn, "prei": prei, "bez1": bez1
+        }])[0]['aknr']
         return jsonify({
             "success": True,
             "aknr": aknr,
@@ -1203,6 +1931,8 @@ def get_meals_for_day():
 # ============================================================================
 
 @flask_app.route('/invoices/stats')
+@etag_from(tables=('REC', 'PMT'))
+@coalesced
 def get_invoice_stats():
     """Umsatz-Statistiken für Finanz-App"""
     year = request.args.get('year', type=int)
@@ -1262,6 +1992,7 @@ def get_invoice_stats():
     })
 
 @flask_app.route('/invoices/open')
+@coalesced
 def get_open_invoices():
     """Offene Rechnungen abrufen"""
     query = """
@@ -1284,8 +2015,7 @@ def get_open_invoices():
 @flask_app.route('/payment-types')
 def get_payment_types():
     """Alle Zahlarten abrufen"""
-    query = "SELECT paym, payt FROM PMT ORDER BY paym"
-    types = db_query(query)
+    types = ref_cache.get('payment_types')
     return jsonify({
         "count": len(types),
         "payment_types": [serialize_row(t) for t in types]
@@ -1437,27 +2167,129 @@ def get_next_customer_number():
     Format: K + 7 Stellen mit Punkt-Trennung (K0.000.001 bis K9.999.999)
     """
     try:
-        counter_ref = firebase_db.collection('counters').document('guests')
-
-        @firestore.transactional
-        def update_counter(transaction):
-            snapshot = counter_ref.get(transaction=transaction)
-            if snapshot.exists:
-                current = snapshot.to_dict().get('lastNumber', 0)
-            else:
-                current = 0
-            next_number = current + 1
-            transaction.set(counter_ref, {'lastNumber': next_number})
-            return next_number
-
-        transaction = firebase_db.transaction()
-        return update_counter(transaction)
+        return get_next_customer_numbers(1)[0]
     except Exception as e:
         print(f"Error getting next customer number: {e}")
         # Fallback: Use timestamp-based number
         import random
         return random.randint(1, 99999)
 
+def get_next_customer_numbers(count):
+    """Reserviert count fortlaufende Kundennummern in einer Transaction
+
+    Ohne Fallback: schlaegt die Transaction fehl, wird die Exception
+    weitergereicht - zufaellige Nummern koennten bestehende G{n}-Dokumente
+    ueberschreiben.
+    """
+    if count <= 0:
+        return []
+    counter_ref = firebase_db.collection('counters').document('guests')
+
+    @firestore.transactional
+    def update_counter(transaction):
+        snapshot = counter_ref.get(transaction=transaction)
+        if snapshot.exists:
+            current = snapshot.to_dict().get('lastNumber', 0)
+        else:
+            current = 0
+        transaction.set(counter_ref, {'lastNumber': current + count})
+        return current + 1
+
+    transaction = firebase_db.transaction()
+    first = update_counter(transaction)
+    return list(range(first, first + count))
+
+# ============================================================================
+# FIRESTORE BATCH WRITES
+# ============================================================================
+
+FIRESTORE_BATCH_LIMIT = 500  # Max. Operationen pro WriteBatch (Firestore-Limit)
+
+# Fehler, bei denen ein erneuter Versuch nichts bringt
+PERMANENT_WRITE_ERRORS = ('NotFound', 'InvalidArgument', 'PermissionDenied',
+                          'FailedPrecondition', 'AlreadyExists')
+
+def _commit_ops(ops):
+    batch = firebase_db.batch()
+    for op, ref, data in ops:
+        getattr(batch, op)(ref, data)
+    batch.commit()
+    written = {}
+    for _, ref, _ in ops:
+        written[ref.parent.id] = written.get(ref.parent.id, 0) + 1
+    for collection, count in written.items():
+        sync_documents.inc(count, collection=collection)
+
+def commit_write_units(units, label="Sync"):
+    """Schreib-Einheiten gebuendelt als WriteBatches committen
+
+    units: Liste von (tag, [(op, ref, data), ...]) mit op in 'set'/'update'.
+    Die Operationen einer Einheit landen immer im selben Batch (z.B. Gast +
+    Lookup). Batches mit bis zu FIRESTORE_BATCH_LIMIT Operationen laufen mit
+    begrenzter Parallelitaet (config 'firestore_write_workers'); ein
+    fehlgeschlagener Batch wird mit Backoff wiederholt und zuletzt einheitenweise
+    geschrieben, damit ein kaputtes Dokument nicht 499 andere mitreisst.
+
+    Gibt (Statistik, Liste der fehlgeschlagenen Tags) zurueck.
+    """
+    batches = []
+    current, current_ops = [], 0
+    for tag, ops in units:
+        if current and current_ops + len(ops) > FIRESTORE_BATCH_LIMIT:
+            batches.append(current)
+            current, current_ops = [], 0
+        current.append((tag, ops))
+        current_ops += len(ops)
+    if current:
+        batches.append(current)
+
+    retries = max(1, config.get('firestore_write_retries', 3))
+
+    def commit_batch(batch_units):
+        ops = [op for _, unit_ops in batch_units for op in unit_ops]
+        for attempt in range(retries):
+            try:
+                _commit_ops(ops)
+                return []
+            except Exception as e:
+                error = e
+                if type(e).__name__ in PERMANENT_WRITE_ERRORS:
+                    break
+                if attempt + 1 < retries:
+                    time.sleep(0.5 * 2 ** attempt)
+        print(f"[{label}] Batch mit {len(ops)} Operationen fehlgeschlagen ({error}), "
+              f"schreibe einzeln")
+        failed = []
+        for tag, unit_ops in batch_units:
+            try:
+                _commit_ops(unit_ops)
+            except Exception as e:
+                print(f"[{label}] Error writing {tag}: {e}")
+                failed.append(tag)
+        return failed
+
+    started = time.perf_counter()
+    failed = []
+    if batches:
+        workers = max(1, min(config.get('firestore_write_workers', 4), len(batches)))
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for batch_failed in executor.map(commit_batch, batches):
+                failed.extend(batch_failed)
+    seconds = time.perf_counter() - started
+
+    operations = sum(len(ops) for _, ops in units)
+    stats = {
+        "operations": operations,
+        "batches": len(batches),
+        "failed_units": len(failed),
+        "seconds": round(seconds, 3),
+        "ops_per_second": round(operations / seconds, 1) if seconds > 0 else None
+    }
+    if operations:
+        print(f"[{label}] {operations} writes in {len(batches)} batches, "
+              f"{seconds:.2f}s ({stats['ops_per_second']} ops/s)")
+    return stats, failed
+
 def merge_guest_profiles(profiles, bookings_data):
     """Merged mehrere CapHotel-Profile zu einem deduplizierten Gast"""
     if not profiles:
@@ -1518,8 +2350,14 @@ def merge_guest_profiles(profiles, bookings_data):
 
     return merged
 
-def deduplicate_and_sync_guests(bookings_data):
-    """Dedupliziert Gaeste und synchronisiert zu Firestore"""
+def deduplicate_and_sync_guests(bookings_data, dedup_state=None, changed_gast=None):
+    """Dedupliziert Gaeste und synchronisiert zu Firestore
+
+    Delta-Modus (dedup_state mit gkt_hashes): nur Gruppen mit geaenderten
+    GKT-Profilen oder geaenderten Buchungen (changed_gast) werden
+    geschrieben, und nur deren guestLookup-Dokumente werden gelesen.
+    Ein leeres dedup_state bedeutet voller Lauf mit neuen Hashes.
+    """
     if not firebase_initialized or not firebase_db:
         print("[Dedup] Firebase nicht initialisiert")
         return {"success": False, "error": "Firebase nicht initialisiert"}
@@ -1547,20 +2385,50 @@ def deduplicate_and_sync_guests(bookings_data):
 
         print(f"[Dedup] Grouped into {len(groups)} unique guests")
 
-        # 3. Bestehende Lookups laden
+        # Delta: nur Gruppen mit geaenderten Profilen/Buchungen bearbeiten
+        delta = dedup_state is not None and 'gkt_hashes' in dedup_state
+        new_hashes = None
+        if dedup_state is not None:
+            new_hashes = {str(g['gast']): row_fingerprint(g) for g in all_guests}
+        if delta:
+            old_hashes = dedup_state['gkt_hashes']
+            affected = {str(gast) for gast in (changed_gast or ())}
+            affected.update(k for k, h in new_hashes.items() if old_hashes.get(k) != h)
+            target_keys = [
+                key for key, profiles in groups.items()
+                if any(str(p.get('gast')) in affected for p in profiles)
+            ]
+            print(f"[Dedup] Delta: {len(affected)} changed profiles -> {len(target_keys)} groups")
+        else:
+            target_keys = list(groups)
+
+        # 3. Bestehende Lookups laden (Delta: nur die der betroffenen Gruppen)
         existing_lookups = {}
+        lookups_ref = firebase_db.collection('guestLookup')
         try:
-            lookups_ref = firebase_db.collection('guestLookup')
-            for doc in lookups_ref.stream():
-                existing_lookups[doc.id] = doc.to_dict()
+            if not delta:
+                for doc in lookups_ref.stream():
+                    existing_lookups[doc.id] = doc.to_dict()
+            else:
+                lookup_ids = [key.replace(':', '_', 1) for key in target_keys]
+                for i in range(0, len(lookup_ids), 300):
+                    refs = [lookups_ref.document(lid) for lid in lookup_ids[i:i + 300]]
+                    for doc in firebase_db.get_all(refs):
+                        if doc.exists:
+                            existing_lookups[doc.id] = doc.to_dict()
         except Exception as e:
             print(f"[Dedup] Error loading existing lookups: {e}")
+            if delta:
+                # Ohne Lookups wuerden bestehende Gaeste doppelt angelegt
+                return {"success": False, "error": f"Lookups nicht ladbar: {e}"}
 
-        # 4. Fuer jede Gruppe: Gast in Firestore anlegen/updaten
-        created = 0
-        updated = 0
+        # 4. Fuer jede Gruppe: Schreib-Einheit bauen (Gast anlegen/updaten)
+        guests_ref = firebase_db.collection('guests')
+        units = []
+        new_groups = []
 
-        for key, profiles in groups.items():
+        for key in target_keys:
+            profiles = groups[key]
             key_type, key_value = key.split(':', 1)
             lookup_id = f"{key_type}_{key_value}"
 
@@ -1580,51 +2448,66 @@ def deduplicate_and_sync_guests(bookings_data):
                 # Gast existiert - updaten
                 lookup_data = existing_lookups[lookup_id]
                 guest_id = lookup_data.get('guestId')
-                customer_number = lookup_data.get('customerNumber')
 
-                # Guest-Dokument updaten
                 merged['id'] = guest_id
-                merged['customerNumber'] = customer_number
+                merged['customerNumber'] = lookup_data.get('customerNumber')
                 merged['updatedAt'] = now
-
-                try:
-                    firebase_db.collection('guests').document(guest_id).update(merged)
-                    updated += 1
-                except Exception as e:
-                    print(f"[Dedup] Error updating guest {guest_id}: {e}")
+                units.append((key, [('update', guests_ref.document(guest_id), merged)]))
             else:
-                # Neuer Gast - anlegen
-                customer_number = get_next_customer_number()
-                guest_id = f"G{customer_number}"
-
-                merged['id'] = guest_id
-                merged['customerNumber'] = customer_number
-                merged['createdAt'] = now
-                merged['updatedAt'] = now
-
-                try:
-                    # Guest-Dokument anlegen
-                    firebase_db.collection('guests').document(guest_id).set(merged)
-
-                    # Lookup anlegen (nur fuer phone/email, nicht fuer caphotel fallback)
-                    if key_type in ('phone', 'email'):
-                        firebase_db.collection('guestLookup').document(lookup_id).set({
-                            'guestId': guest_id,
-                            'customerNumber': customer_number
-                        })
+                new_groups.append((key, key_type, lookup_id, merged))
 
-                    created += 1
-                except Exception as e:
-                    print(f"[Dedup] Error creating guest {guest_id}: {e}")
+        # Neue Gaeste: Kundennummern als Block in einer Transaction reservieren
+        deferred = set()
+        try:
+            numbers = get_next_customer_numbers(len(new_groups))
+        except Exception as e:
+            # Neue Gaeste beim naechsten Lauf anlegen, Updates trotzdem schreiben
+            print(f"[Dedup] Kundennummern nicht reservierbar ({e}), "
+                  f"{len(new_groups)} neue Gaeste zurueckgestellt")
+            deferred = {key for key, _, _, _ in new_groups}
+            new_groups, numbers = [], []
+        for (key, key_type, lookup_id, merged), customer_number in zip(new_groups, numbers):
+            guest_id = f"G{customer_number}"
+            merged['id'] = guest_id
+            merged['customerNumber'] = customer_number
+            merged['createdAt'] = now
+            merged['updatedAt'] = now
+
+            ops = [('set', guests_ref.document(guest_id), merged)]
+            # Lookup anlegen (nur fuer phone/email, nicht fuer caphotel fallback)
+            if key_type in ('phone', 'email'):
+                ops.append(('set', lookups_ref.document(lookup_id), {
+                    'guestId': guest_id,
+                    'customerNumber': customer_number
+                }))
+            units.append((key, ops))
+
+        # 5. Gebuendelt schreiben
+        write_stats, failed_keys = commit_write_units(units, label="Dedup")
+        failed = set(failed_keys)
+        failed_gast = {str(p.get('gast')) for key in failed | deferred for p in groups[key]}
+        new_keys = {key for key, _, _, _ in new_groups}
+        created = sum(1 for key, _ in units if key in new_keys and key not in failed)
+        updated = len(units) - created - len(failed)
 
         print(f"[Dedup] Completed: {created} created, {updated} updated")
 
+        if dedup_state is not None:
+            # Fehlgeschlagene Profile beim naechsten Lauf erneut versuchen
+            for gast in failed_gast:
+                new_hashes.pop(gast, None)
+            dedup_state['gkt_hashes'] = new_hashes
+
         return {
             "success": True,
+            "mode": "delta" if delta else "full",
             "total_profiles": len(all_guests),
             "deduplicated_guests": len(groups),
+            "groups_processed": len(target_keys),
             "created": created,
-            "updated": updated
+            "updated": updated,
+            "deferred": len(deferred),
+            "writes": write_stats
         }
 
     except Exception as e:
@@ -1666,140 +2549,341 @@ def init_firebase():
         print(f"[Firebase] Init-Fehler: {e}")
         return False
 
-def sync_to_firebase():
-    """Sync all data from CapHotel to Firebase"""
+def load_account_totals(resns):
+    """Kontosummen (SUM(AKZ.prei)) fuer viele Buchungen in einer Query laden
+
+    Statt einer Query pro Buchung wird der resn-Bereich des Batches einmal
+    gruppiert aggregiert und im Speicher zugeordnet. Buchungen ohne
+    Kontobuchungen fehlen im Ergebnis (wie frueher SUM() = NULL).
+    """
+    if not resns:
+        return {}
+
+    wanted = set(resns)
+    started = time.perf_counter()
+    try:
+        query = """
+            SELECT resn, SUM(prei) as total
+            FROM AKZ
+            WHERE resn BETWEEN ? AND ?
+            GROUP BY resn
+        """
+        rows = db_query(query, (min(wanted), max(wanted)))
+    except Exception as e:
+        print(f"[Sync] Account totals error: {e}")
+        return {}
+
+    totals = {r['resn']: r['total'] for r in rows if r['resn'] in wanted}
+    print(f"[Sync] Account totals for {len(wanted)} bookings in "
+          f"{(time.perf_counter() - started) * 1000:.0f} ms (1 query)")
+    return totals
+
+# ============================================================================
+# DELTA-SYNC (Wasserstaende + Zeilen-Fingerprints)
+# ============================================================================
+
+SYNC_STATE_PATH = os.path.join(os.path.dirname(CONFIG_PATH), 'sync_state.json')
+SYNC_STATE_VERSION = 1
+
+def _state_json_default(value):
+    if isinstance(value, Decimal):
+        return float(value)
+    return str(value)
+
+def load_sync_state():
+    """Lokalen Sync-Zustand laden (fehlt/kaputt -> leerer Zustand = voller Sync)"""
+    if os.path.exists(SYNC_STATE_PATH):
+        try:
+            with open(SYNC_STATE_PATH, 'r', encoding='utf-8') as f:
+                state = json.load(f)
+            if state.get('version') == SYNC_STATE_VERSION:
+                return state
+        except Exception as e:
+            print(f"[Sync] State-Datei nicht lesbar, voller Sync: {e}")
+    return {'version': SYNC_STATE_VERSION, 'sets': {}}
+
+def save_sync_state(state):
+    """Sync-Zustand atomar schreiben"""
+    tmp_path = SYNC_STATE_PATH + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(state, f, ensure_ascii=False, default=_state_json_default)
+    os.replace(tmp_path, SYNC_STATE_PATH)
+
+def row_fingerprint(row):
+    """Stabiler Hash einer Zeile (ohne syncedAt)"""
+    data = {k: v for k, v in row.items() if k != 'syncedAt'}
+    raw = json.dumps(data, sort_keys=True, default=str)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+def probe_table(table, upto=None):
+    """Fingerprint einer Tabelle (optional nur Zeilen mit Schluessel <= upto)
+
+    Gibt None zurueck, wenn die Probe nicht laeuft (z.B. Spalte fehlt) -
+    die Tabelle wird dann wie geaendert behandelt.
+    """
+    try:
+        return fingerprints.compute(table, upto=upto)
+    except Exception as e:
+        print(f"[Sync] Probe {table} fehlgeschlagen: {e}")
+        return None
+
+def attach_account_totals(bookings_data):
+    """Kontosummen an Buchungen haengen"""
+    account_totals = load_account_totals([b['resn'] for b in bookings_data])
+    for b in bookings_data:
+        b['accountTotal'] = account_totals.get(b['resn'])
+
+# Sync-Sets: ein Firestore-Dokument caphotelSync/{name} pro Set.
+# {where} nimmt die Delta-Bedingung auf (nur neue Zeilen).
+SYNC_SETS = [
+    {
+        "name": "bookings",
+        "table": "BUC",
+        "depends": ("GKT", "CHC", "AKZ"),
+        "key": "resn",
+        "key_column": "BUC.resn",
+        "limit": 1000,
+        "descending": True,
+        "enrich": attach_account_totals,
+        "query": """
+            SELECT TOP 1000 BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande, BUC.chid,
+                   BUC.extn, GKT.vorn, GKT.nacn, GKT.mail, CHC.name as channelName
+            FROM (BUC LEFT JOIN GKT ON BUC.gast = GKT.gast)
+            LEFT JOIN CHC ON BUC.chid = CHC.chid
+            {where}
+            ORDER BY BUC.resn DESC
+        """
+    },
+    {
+        "name": "guests",
+        "table": "GKT",
+        "key": "gast",
+        "key_column": "gast",
+        "limit": 2000,
+        "descending": True,
+        "query": """
+            SELECT TOP 2000 gast, vorn, nacn, mail, teln, stra, polz, ortb, land
+            FROM GKT {where} ORDER BY gast DESC
+        """
+    },
+    {
+        "name": "articles",
+        "table": "ART",
+        "key": "artn",
+        "key_column": "artn",
+        "query": "SELECT artn, beze, prei, knto FROM ART {where} ORDER BY artn"
+    },
+    {
+        "name": "rooms",
+        "table": "ZIM",
+        "key": "zimm",
+        "key_column": "zimm",
+        "query": "SELECT zimm, beze, bett, stat, catg FROM ZIM {where} ORDER BY zimm"
+    },
+    {
+        "name": "channels",
+        "table": "CHN",
+        "key": "chid",
+        "key_column": "chid",
+        "query": "SELECT chid, name FROM CHN {where} ORDER BY chid"
+    }
+]
+
+def read_sync_set(spec, after=None):
+    """Zeilen eines Sets lesen (after gesetzt: nur Schluessel > after)"""
+    where, params = '', None
+    if after is not None:
+        where, params = f"WHERE {spec['key_column']} > ?", (after,)
+    rows = [serialize_row(r) for r in db_query(spec['query'].format(where=where), params)]
+    if spec.get('enrich') and rows:
+        spec['enrich'](rows)
+    return rows
+
+def sync_set(spec, state, probes, rebuild, now):
+    """Ein Sync-Set abgleichen und nur bei Aenderungen schreiben
+
+    Ablauf (delta):
+    1. Probes von Tabelle und Abhaengigkeiten unveraendert -> nichts lesen/schreiben
+    2. Nur neue Zeilen (Probe bis zum alten Wasserstand unveraendert)
+       -> nur Schluessel > Wasserstand lesen und mit dem Cache mischen
+    3. Sonst voll lesen; Zeilen-Fingerprints entscheiden ueber das Schreiben
+
+    Gibt (items, geaenderte Zeilen, Info) zurueck.
+    """
+    name, key = spec['name'], spec['key']
+    tables = (spec['table'],) + tuple(spec.get('depends', ()))
+    current = {t: probes[t] for t in tables}
+    probes_ok = all(v is not None for v in current.values())
+    cached = None if rebuild else state['sets'].get(name)
+
+    if cached and probes_ok and cached['probes'] == current:
+        return cached['items'], [], {"mode": "skipped", "read": 0, "written": False}
+
+    old_hashes = cached['hashes'] if cached else {}
+    items = None
+    fresh = None
+    mode = "full"
+
+    deps_unchanged = cached and probes_ok and all(
+        cached['probes'].get(t) == current[t] for t in tables[1:])
+    if deps_unchanged and cached.get('max_key') is not None:
+        before = probe_table(spec['table'], upto=cached['max_key'])
+        if before is not None and before == cached['probes'].get(spec['table']):
+            fresh = read_sync_set(spec, after=cached['max_key'])
+            merged = {str(i[key]): i for i in cached['items']}
+            for row in fresh:
+                merged[str(row[key])] = row
+            items = sorted(merged.values(), key=lambda r: r[key],
+                           reverse=spec.get('descending', False))
+            if spec.get('limit'):
+                items = items[:spec['limit']]
+            mode = "append"
+
+    if items is None:
+        fresh = items = read_sync_set(spec)
+
+    hashes = {str(i[key]): old_hashes.get(str(i[key])) for i in items}
+    for row in fresh:
+        hashes[str(row[key])] = row_fingerprint(row)
+    changed = [i for i in items if old_hashes.get(str(i[key])) != hashes[str(i[key])]]
+    removed = set(old_hashes) - set(hashes)
+
+    written = False
+    if rebuild or not cached or changed or removed:
+        firebase_db.collection('caphotelSync').document(name).set({
+            'items': [dict(i, syncedAt=now) for i in items],
+            'count': len(items),
+            'syncedAt': now
+        })
+        sync_documents.inc(collection='caphotelSync')
+        written = True
+
+    state['sets'][name] = {
+        'probes': current if probes_ok else {},
+        'max_key': max((i[key] for i in items), default=None),
+        'items': items,
+        'hashes': hashes
+    }
+    return items, changed, {"mode": mode, "read": len(fresh), "written": written}
+
+def rebuild_due(state):
+    """True, wenn der letzte Komplett-Sync aelter als sync_rebuild_hours ist"""
+    hours = config.get('sync_rebuild_hours', 24)
+    last = state.get('last_rebuild')
+    if not hours or not last:
+        return not last
+    try:
+        return (datetime.now() - datetime.fromisoformat(last)).total_seconds() > hours * 3600
+    except ValueError:
+        return True
+
+sync_lock = threading.Lock()
+
+@db_pool.scoped
+def sync_to_firebase(mode=None):
+    """Sync all data from CapHotel to Firebase
+
+    mode: 'delta' (nur Geaendertes lesen/schreiben) oder 'rebuild' (alles neu).
+    Ohne Angabe gilt config['sync_mode']; ein Delta-Sync wird automatisch
+    zum Rebuild, wenn der letzte aelter als sync_rebuild_hours ist.
+    """
     if not firebase_initialized:
         if not init_firebase():
             return {"success": False, "error": "Firebase nicht initialisiert"}
 
+    with sync_lock:
+        started = time.perf_counter()
+        result = _sync_to_firebase(mode)
+        record_sync(result, mode, time.perf_counter() - started)
+        return result
+
+def _sync_to_firebase(mode):
     try:
         now = datetime.now().isoformat()
+        state = load_sync_state()
+        mode = mode or config.get('sync_mode', 'delta')
+        if mode != 'rebuild' and rebuild_due(state):
+            mode = 'rebuild'
+        rebuild = mode == 'rebuild'
+        if rebuild:
+            state = {'version': SYNC_STATE_VERSION, 'sets': {}, 'dedup': {}}
+
         results = {
             "bookings": 0,
             "guests": 0,
             "deduplicated_guests": 0,
             "articles": 0,
             "rooms": 0,
-            "channels": 0
+            "channels": 0,
+            "mode": mode,
+            "sets": {}
         }
 
-        # Sync Bookings (with account totals for deduplication stats)
-        bookings_data = []
-        try:
-            query = """
-                SELECT TOP 1000 BUC.resn, BUC.gast, BUC.stat, BUC.andf, BUC.ande, BUC.chid,
-                       BUC.extn, GKT.vorn, GKT.nacn, GKT.mail, CHC.name as channelName
-                FROM (BUC LEFT JOIN GKT ON BUC.gast = GKT.gast)
-                LEFT JOIN CHC ON BUC.chid = CHC.chid
-                ORDER BY BUC.resn DESC
-            """
-            bookings = db_query(query)
-            bookings_data = [serialize_row(b) for b in bookings]
-
-            # Kontosummen fuer jede Buchung laden
-            for b in bookings_data:
-                try:
-                    account_query = "SELECT SUM(prei) as total FROM AKZ WHERE resn = ?"
-                    account = db_query(account_query, (b['resn'],), fetchone=True)
-                    b['accountTotal'] = account.get('total') if account else 0
-                except:
-                    b['accountTotal'] = 0
-                b['syncedAt'] = now
-
-            firebase_db.collection('caphotelSync').document('bookings').set({
-                'items': bookings_data,
-                'count': len(bookings_data),
-                'syncedAt': now
-            })
-            results['bookings'] = len(bookings_data)
-        except Exception as e:
-            print(f"Bookings sync error: {e}")
+        # Probes einmal pro Lauf (vor dem Lesen, damit nichts verloren geht)
+        sync_tables = {spec['table'] for spec in SYNC_SETS}
+        sync_tables.update(t for spec in SYNC_SETS for t in spec.get('depends', ()))
+        probes = {table: probe_table(table) for table in sync_tables}
 
-        # Sync Guests (raw data for caphotelSync)
-        try:
-            query = """
-                SELECT TOP 2000 gast, vorn, nacn, mail, teln, stra, polz, ortb, land
-                FROM GKT ORDER BY gast DESC
-            """
-            guests = db_query(query)
-            guests_data = [serialize_row(g) for g in guests]
-            for g in guests_data:
-                g['syncedAt'] = now
-
-            firebase_db.collection('caphotelSync').document('guests').set({
-                'items': guests_data,
-                'count': len(guests_data),
-                'syncedAt': now
-            })
-            results['guests'] = len(guests_data)
-        except Exception as e:
-            print(f"Guests sync error: {e}")
+        synced = {}
+        changed_gast = set()
+        for spec in SYNC_SETS:
+            name = spec['name']
+            try:
+                items, changed, info = sync_set(spec, state, probes, rebuild, now)
+                synced[name] = items
+                results[name] = len(items)
+                results['sets'][name] = info
+                if name == 'bookings':
+                    changed_gast.update(b.get('gast') for b in changed)
+            except Exception as e:
+                print(f"{name.capitalize()} sync error: {e}")
+                results['sets'][name] = {"mode": "error", "error": str(e)}
 
         # Deduplicate guests and sync to 'guests' collection
         try:
-            dedup_result = deduplicate_and_sync_guests(bookings_data)
-            if dedup_result.get('success'):
-                results['deduplicated_guests'] = dedup_result.get('deduplicated_guests', 0)
-                print(f"[Sync] Deduplicated {results['deduplicated_guests']} guests")
+            dedup_state = state.setdefault('dedup', {})
+            gkt_unchanged = (probes['GKT'] is not None
+                             and dedup_state.get('probe') == probes['GKT'])
+            bookings_data = synced.get('bookings')
+            if bookings_data is None:
+                print("[Sync] Dedup uebersprungen (Buchungen nicht geladen)")
+            elif not rebuild and gkt_unchanged and not changed_gast and 'gkt_hashes' in dedup_state:
+                results['deduplicated_guests'] = dedup_state.get('deduplicated_guests', 0)
+                results['sets']['dedup'] = {"mode": "skipped"}
+            else:
+                dedup_result = deduplicate_and_sync_guests(
+                    bookings_data, dedup_state=dedup_state, changed_gast=changed_gast)
+                if dedup_result.get('success'):
+                    results['deduplicated_guests'] = dedup_result.get('deduplicated_guests', 0)
+                    dedup_state['probe'] = probes['GKT']
+                    dedup_state['deduplicated_guests'] = results['deduplicated_guests']
+                    results['sets']['dedup'] = {
+                        "mode": dedup_result.get('mode'),
+                        "groups": dedup_result.get('groups_processed', 0),
+                        "writes": dedup_result.get('writes')
+                    }
+                    print(f"[Sync] Deduplicated {results['deduplicated_guests']} guests")
         except Exception as e:
             print(f"Guest deduplication error: {e}")
 
-        # Sync Articles
+        if rebuild:
+            state['last_rebuild'] = now
         try:
-            query = "SELECT artn, beze, prei, knto FROM ART ORDER BY artn"
-            articles = db_query(query)
-            articles_data = [serialize_row(a) for a in articles]
-            for a in articles_data:
-                a['syncedAt'] = now
-
-            firebase_db.collection('caphotelSync').document('articles').set({
-                'items': articles_data,
-                'count': len(articles_data),
-                'syncedAt': now
-            })
-            results['articles'] = len(articles_data)
+            save_sync_state(state)
         except Exception as e:
-            print(f"Articles sync error: {e}")
+            print(f"[Sync] State-Datei nicht schreibbar: {e}")
 
-        # Sync Rooms
-        try:
-            query = "SELECT zimm, beze, bett, stat, catg FROM ZIM ORDER BY zimm"
-            rooms = db_query(query)
-            rooms_data = [serialize_row(r) for r in rooms]
-            for r in rooms_data:
-                r['syncedAt'] = now
-
-            firebase_db.collection('caphotelSync').document('rooms').set({
-                'items': rooms_data,
-                'count': len(rooms_data),
-                'syncedAt': now
-            })
-            results['rooms'] = len(rooms_data)
-        except Exception as e:
-            print(f"Rooms sync error: {e}")
-
-        # Sync Channels
-        try:
-            query = "SELECT chid, name FROM CHN ORDER BY chid"
-            channels = db_query(query)
-            channels_data = [serialize_row(c) for c in channels]
-            for c in channels_data:
-                c['syncedAt'] = now
-
-            firebase_db.collection('caphotelSync').document('channels').set({
-                'items': channels_data,
-                'count': len(channels_data),
-                'syncedAt': now
-            })
-            results['channels'] = len(channels_data)
-        except Exception as e:
-            print(f"Channels sync error: {e}")
+        skipped = sum(1 for i in results['sets'].values() if i.get('mode') == 'skipped')
+        print(f"[Sync] Mode {mode}: {skipped}/{len(results['sets'])} sets unchanged, "
+              f"{sum(i.get('read', 0) for i in results['sets'].values())} rows read")
 
         # Update sync status
         firebase_db.collection('caphotelSync').document('status').set({
             'lastSync': now,
             'lastSyncSuccess': True,
             'syncInProgress': False,
+            'syncMode': mode,
+            'lastRebuild': state.get('last_rebuild'),
             'bookingsCount': results['bookings'],
             'guestsCount': results['guests'],
             'deduplicatedGuestsCount': results['deduplicated_guests'],
@@ -1807,6 +2891,7 @@ def sync_to_firebase():
             'autoSyncInterval': config.get('sync_interval', 15),
             'syncSource': 'bridge'
         })
+        sync_documents.inc(collection='caphotelSync')
 
         return {"success": True, "results": results, "timestamp": now}
 
@@ -1877,7 +2962,6 @@ def stop_auto_sync():
 
 import shutil
 import glob as glob_module
-import hashlib
 
 backup_thread = None
 backup_running = False
@@ -1915,6 +2999,12 @@ def get_file_hash(filepath):
 
 def create_backup(force=False):
     """Create a backup of the Access database"""
+    started = time.perf_counter()
+    result = _create_backup(force)
+    record_backup(result, time.perf_counter() - started)
+    return result
+
+def _create_backup(force):
     try:
         db_path = config['database_path']
 
@@ -2193,6 +3283,10 @@ def manual_sync(icon=None, item=None):
     """Trigger manual sync from tray"""
     threading.Thread(target=sync_to_firebase, daemon=True).start()
 
+def manual_rebuild(icon=None, item=None):
+    """Trigger full resync (rebuild) from tray"""
+    threading.Thread(target=lambda: sync_to_firebase(mode='rebuild'), daemon=True).start()
+
 def manual_backup(icon=None, item=None):
     """Trigger manual backup from tray"""
     threading.Thread(target=lambda: create_backup(force=True), daemon=True).start()
@@ -2222,6 +3316,7 @@ def setup_tray():
     menu = pystray.Menu(
         pystray.MenuItem("Einstellungen oeffnen", show_window, default=True),
         pystray.MenuItem("Jetzt synchronisieren", manual_sync),
+        pystray.MenuItem("Komplett neu synchronisieren", manual_rebuild),
         pystray.MenuItem("Jetzt Backup erstellen", manual_backup),
         pystray.Menu.SEPARATOR,
         pystray.MenuItem("Beenden", quit_app)
@@ -2567,6 +3662,11 @@ und die Datenbank wird regelmaessig gesichert."""
 
     def save_settings(self):
         config['database_path'] = self.db_path_var.get()
+        db_pool.close_all()
+        availability_index.invalidate()
+        ref_cache.invalidate()
+        sequences.invalidate()
+        write_queue.reset()
         config['auto_sync'] = self.auto_sync_var.get()
         config['sync_interval'] = int(self.interval_var.get())
         save_config(config)
@@ -2588,8 +3688,7 @@ und die Datenbank wird regelmaessig gesichert."""
             return
 
         try:
-            conn_str = f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={db_path}"
-            conn = pyodbc.connect(conn_str)
+            conn = database_backend(config.get('db_backend'), db_path).connect()
             cursor = conn.cursor()
             cursor.execute("SELECT COUNT(*) FROM ZIM")
             count = cursor.fetchone()[0]
@@ -2608,10 +3707,18 @@ und die Datenbank wird regelmaessig gesichert."""
 
     def start_server(self):
         config['database_path'] = self.db_path_var.get()
+        db_pool.close_all()
+        availability_index.invalidate()
+        ref_cache.invalidate()
+        sequences.invalidate()
+        write_queue.reset()
 
         if not config['database_path'] or not os.path.exists(config['database_path']):
             return
 
+        # Tabellen-Fingerprints im Hintergrund aktuell halten
+        fingerprints.start()
+
         def run_server():
             try:
                 flask_app.run(host=config['host'], port=config['port'], debug=False, use_reloader=False)
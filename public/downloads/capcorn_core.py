@@ -0,0 +1,2882 @@
+# -*- coding: utf-8 -*-
+"""
+CapCorn Bridge - Gemeinsame Infrastruktur
+==========================================
+Wird von capcorn_bridge.py und capcorn_bridge_gui.py importiert.
+Enthaelt nur Code ohne Flask-/pyodbc-Abhaengigkeit auf Modulebene
+(pyodbc wird erst beim Verbinden mit dem Access-Backend importiert).
+
+(c) 2024-2026 - Hotel Stadler Bridge
+"""
+
+import base64
+import bisect
+import gzip
+import hashlib
+import json
+import os
+import queue
+import re
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeout
+from contextlib import contextmanager
+from datetime import date, datetime
+from decimal import Decimal
+from functools import lru_cache, wraps
+
+# ============================================================================
+# CONNECTION POOL
+# ============================================================================
+
+class PoolTimeout(RuntimeError):
+    """Keine Verbindung innerhalb des Timeouts frei"""
+
+
+def _close_quietly(raw):
+    try:
+        raw.close()
+    except Exception:
+        pass
+
+
+class PooledConnection:
+    """
+    Leihgabe einer Pool-Verbindung.
+
+    Verhaelt sich wie die pyodbc-Verbindung, close() gibt sie aber an den
+    Pool zurueck. Nicht committete Aenderungen werden dabei verworfen -
+    wie bisher beim Schliessen einer eigenen Verbindung. Bei Scope-Handles
+    passiert das erst am Scope-Ende, weil sich alle Handles des Requests
+    eine Verbindung (und damit eine Transaktion) teilen.
+    """
+
+    def __init__(self, pool, raw, scoped=False):
+        self._pool = pool
+        self._raw = raw
+        self._scoped = scoped
+        self._closed = False
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    @property
+    def raw(self):
+        return self._raw
+
+    def close(self):
+        if self._closed:
+            return
+        self._closed = True
+        self._pool._checkin(self._raw, scoped=self._scoped)
+
+
+class ConnectionPool:
+    """
+    Begrenzter, thread-sicherer Verbindungs-Pool.
+
+    - max_size:     Maximale Anzahl offener Verbindungen (idle + ausgeliehen)
+    - max_idle:     Sekunden, nach denen eine unbenutzte Verbindung geschlossen wird
+    - health_query: Query zum Pruefen einer Verbindung, die laenger als
+                    check_after Sekunden unbenutzt war
+    - timeout:      Sekunden, die acquire() auf eine freie Verbindung wartet
+
+    Mit scope() wird fuer die Dauer eines Requests (oder Sync-Laufs) genau
+    eine Verbindung an den aktuellen Thread gebunden; alle acquire()-Aufrufe
+    innerhalb des Scopes teilen sich diese Verbindung.
+    """
+
+    def __init__(self, connect, max_size=8, max_idle=300, health_query=None,
+                 check_after=30, timeout=30):
+        self._connect = connect
+        self.max_size = max(1, int(max_size))
+        self.max_idle = max_idle
+        self.health_query = health_query
+        self.check_after = check_after
+        self.timeout = timeout
+
+        self._cond = threading.Condition()
+        self._idle = deque()  # (raw, last_used)
+        self._size = 0
+        self._generation = 0
+        self._born = {}  # id(raw) -> Generation beim Verbindungsaufbau
+        self._local = threading.local()
+        self._counters = {
+            "created": 0,
+            "reused": 0,
+            "evicted": 0,
+            "discarded": 0,
+            "waits": 0,
+            "timeouts": 0
+        }
+
+    # ------------------------------------------------------------------
+    # Ausleihen / Zurueckgeben
+    # ------------------------------------------------------------------
+
+    def acquire(self, scoped=True):
+        """
+        Verbindung ausleihen (innerhalb eines Scopes: die Scope-Verbindung).
+        scoped=False holt immer eine eigene Verbindung, z.B. fuer Streams,
+        die laenger leben als der Request-Scope.
+        """
+        scope = getattr(self._local, 'scope', None) if scoped else None
+        if scope is not None:
+            if scope['raw'] is None:
+                scope['raw'] = self._take()
+            return PooledConnection(self, scope['raw'], scoped=True)
+        return PooledConnection(self, self._take())
+
+    @contextmanager
+    def connection(self):
+        """Verbindung fuer einen with-Block ausleihen"""
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            conn.close()
+
+    @contextmanager
+    def scope(self):
+        """Eine Verbindung fuer den ganzen Block an diesen Thread binden"""
+        if getattr(self._local, 'scope', None) is not None:
+            yield
+            return
+        self.begin_scope()
+        try:
+            yield
+        finally:
+            self.end_scope()
+
+    def scoped(self, func):
+        """Decorator: Funktion komplett mit einer Verbindung ausfuehren"""
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with self.scope():
+                return func(*args, **kwargs)
+        return wrapper
+
+    def begin_scope(self):
+        """Scope starten (Verbindung wird erst beim ersten Zugriff geholt)"""
+        self._local.scope = {"raw": None}
+
+    def end_scope(self):
+        """Scope beenden, offene Transaktion verwerfen, Verbindung zurueckgeben"""
+        scope = getattr(self._local, 'scope', None)
+        self._local.scope = None
+        if scope and scope['raw'] is not None:
+            self._checkin(scope['raw'])
+
+    def _take(self):
+        deadline = time.monotonic() + self.timeout
+        with self._cond:
+            while True:
+                self._evict_idle_locked()
+                if self._idle:
+                    raw, last_used = self._idle.pop()
+                    break
+                if self._size < self.max_size:
+                    self._size += 1
+                    raw, last_used = None, None
+                    break
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self._counters['timeouts'] += 1
+                    raise PoolTimeout(
+                        f"Keine freie Datenbankverbindung nach {self.timeout}s "
+                        f"({self.max_size} belegt)"
+                    )
+                self._counters['waits'] += 1
+                self._cond.wait(remaining)
+
+        if raw is not None:
+            if time.monotonic() - last_used < self.check_after or self._is_healthy(raw):
+                with self._cond:
+                    self._counters['reused'] += 1
+                return raw
+            # Tote Verbindung schliessen, der Slot bleibt fuer die neue reserviert
+            _close_quietly(raw)
+            with self._cond:
+                self._born.pop(id(raw), None)
+                self._counters['discarded'] += 1
+
+        try:
+            raw = self._connect()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self._counters['created'] += 1
+            self._born[id(raw)] = self._generation
+        return raw
+
+    def _checkin(self, raw, scoped=False):
+        if scoped:
+            # Scope-Verbindung bleibt gebunden; offene Transaktionen anderer
+            # Handles im selben Request laufen weiter. Zurueckgerollt wird
+            # erst in end_scope().
+            return
+        try:
+            raw.rollback()
+        except Exception:
+            self._discard(raw)
+            return
+        if self._born.get(id(raw)) != self._generation:
+            # Verbindung stammt von vor close_all() (z.B. alter DB-Pfad)
+            self._discard(raw)
+            return
+        with self._cond:
+            self._idle.append((raw, time.monotonic()))
+            self._evict_idle_locked()
+            self._cond.notify()
+
+    def _is_healthy(self, raw):
+        if not self.health_query:
+            return True
+        try:
+            cursor = raw.cursor()
+            cursor.execute(self.health_query)
+            cursor.fetchall()
+            cursor.close()
+            return True
+        except Exception:
+            return False
+
+    def _discard(self, raw):
+        _close_quietly(raw)
+        with self._cond:
+            self._born.pop(id(raw), None)
+            self._size -= 1
+            self._counters['discarded'] += 1
+            self._cond.notify()
+
+    def _evict_idle_locked(self):
+        if not self.max_idle:
+            return
+        now = time.monotonic()
+        # Aelteste Verbindungen liegen vorne (LIFO-Entnahme hinten)
+        while self._idle and now - self._idle[0][1] > self.max_idle:
+            raw, _ = self._idle.popleft()
+            self._born.pop(id(raw), None)
+            self._size -= 1
+            self._counters['evicted'] += 1
+            _close_quietly(raw)
+
+    # ------------------------------------------------------------------
+    # Verwaltung
+    # ------------------------------------------------------------------
+
+    def close_all(self):
+        """Alle Verbindungen schliessen (z.B. nach Pfad-Wechsel)
+
+        Freie Verbindungen sofort, ausgeliehene bei der Rueckgabe.
+        """
+        with self._cond:
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._generation += 1
+            for raw, _ in idle:
+                self._born.pop(id(raw), None)
+            self._cond.notify_all()
+        for raw, _ in idle:
+            _close_quietly(raw)
+
+    def stats(self):
+        """Pool-Zustand fuer /health und Monitoring"""
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                **self._counters
+            }
+
+# ============================================================================
+# VERFUEGBARKEITS-INDEX (Intervalle pro Zimmer)
+# ============================================================================
+
+def to_day(value):
+    """Datum (date/datetime/'YYYY-MM-DD...') als Tagesnummer (date.toordinal)"""
+    if value is None:
+        return None
+    if isinstance(value, datetime):
+        return value.date().toordinal()
+    if isinstance(value, date):
+        return value.toordinal()
+    return date.fromisoformat(str(value)[:10]).toordinal()
+
+
+class AvailabilityIndex:
+    """
+    In-Memory-Index der Zimmerbelegungen (BUZ) fuer schnelle Verfuegbarkeit.
+
+    Pro Zimmer sortierte Listen der Belegungen (Anreise, Abreise, resn).
+    Ueberlappung wie in den SQL-Pruefungen: vndt <= bis AND bsdt >= von
+    (beide Grenzen inklusive).
+
+    - loader():  liefert alle relevanten Belegungen als Dicts mit
+                 resn, zimm, vndt, bsdt
+    - probe():   billiger Fingerprint der Quelltabellen; aendert er sich,
+                 wird beim naechsten Zugriff neu geladen (Aenderungen durch
+                 CapCorn selbst oder andere Clients)
+    - check_interval: Sekunden zwischen zwei Probe-Abfragen
+
+    Eigene Schreibzugriffe der Bridge werden per add()/remove() sofort
+    eingepflegt.
+    """
+
+    def __init__(self, loader, probe=None, check_interval=5):
+        self._loader = loader
+        self._probe = probe
+        self.check_interval = check_interval
+
+        self._lock = threading.RLock()
+        self._rooms = {}      # zimm -> {"starts": [], "entries": [], "max_len": 0}
+        self._by_resn = {}    # resn -> [(zimm, start, end)]
+        self._loaded = False
+        self._fingerprint = None
+        self._checked_at = 0.0
+        self._counters = {"loads": 0, "probes": 0, "queries": 0, "local_updates": 0}
+        self._last_load_ms = None
+
+    # ------------------------------------------------------------------
+    # Laden / Aktualisieren
+    # ------------------------------------------------------------------
+
+    def invalidate(self):
+        """Beim naechsten Zugriff komplett neu laden"""
+        with self._lock:
+            self._loaded = False
+
+    def refresh(self, force=False):
+        """Index laden bzw. neu laden, wenn sich die Datenbank geaendert hat"""
+        now = time.monotonic()
+        with self._lock:
+            if self._loaded and not force and now - self._checked_at < self.check_interval:
+                return
+            self._checked_at = now
+            fingerprint = None
+            if self._probe is not None:
+                fingerprint = self._probe()
+                self._counters['probes'] += 1
+                if self._loaded and not force and fingerprint == self._fingerprint:
+                    return
+            self._load()
+            self._fingerprint = fingerprint
+
+    def _load(self):
+        started = time.perf_counter()
+        rooms, by_resn = {}, {}
+        for row in self._loader():
+            self._insert(rooms, by_resn, row.get('resn'), row.get('zimm'),
+                         row.get('vndt'), row.get('bsdt'))
+        self._rooms, self._by_resn = rooms, by_resn
+        self._loaded = True
+        self._counters['loads'] += 1
+        self._last_load_ms = round((time.perf_counter() - started) * 1000, 1)
+
+    @staticmethod
+    def _insert(rooms, by_resn, resn, zimm, von, bis):
+        start, end = to_day(von), to_day(bis)
+        if zimm is None or start is None or end is None:
+            return
+        room = rooms.setdefault(zimm, {"starts": [], "entries": [], "max_len": 0})
+        pos = bisect.bisect_right(room['starts'], start)
+        room['starts'].insert(pos, start)
+        room['entries'].insert(pos, (start, end, resn))
+        room['max_len'] = max(room['max_len'], end - start)
+        by_resn.setdefault(resn, []).append((zimm, start, end))
+
+    def add(self, resn, zimm, von, bis):
+        """Neue Belegung der Bridge sofort eintragen"""
+        with self._lock:
+            if not self._loaded:
+                return
+            self._insert(self._rooms, self._by_resn, resn, zimm, von, bis)
+            self._counters['local_updates'] += 1
+
+    def remove(self, resn):
+        """Alle Belegungen einer Reservierung entfernen (Storno/Loeschung)"""
+        with self._lock:
+            for zimm, start, end in self._by_resn.pop(resn, []):
+                room = self._rooms.get(zimm)
+                if not room:
+                    continue
+                entry = (start, end, resn)
+                lo = bisect.bisect_left(room['starts'], start)
+                for i in range(lo, len(room['entries'])):
+                    if room['entries'][i] == entry:
+                        del room['entries'][i]
+                        del room['starts'][i]
+                        break
+            self._counters['local_updates'] += 1
+
+    # ------------------------------------------------------------------
+    # Abfragen
+    # ------------------------------------------------------------------
+
+    def _overlaps(self, room, start, end):
+        # Nur Eintraege mit Anreise in [start - max_len, end] koennen ueberlappen
+        lo = bisect.bisect_left(room['starts'], start - room['max_len'])
+        hi = bisect.bisect_right(room['starts'], end)
+        return [e for e in room['entries'][lo:hi] if e[1] >= start]
+
+    def conflicts(self, zimm, von, bis):
+        """resn aller Belegungen von Zimmer zimm, die [von, bis] beruehren"""
+        start, end = to_day(von), to_day(bis)
+        self.refresh()
+        with self._lock:
+            self._counters['queries'] += 1
+            room = self._rooms.get(zimm)
+            if not room:
+                return []
+            return [e[2] for e in self._overlaps(room, start, end)]
+
+    def is_free(self, zimm, von, bis):
+        return not self.conflicts(zimm, von, bis)
+
+    def occupied_rooms(self, von, bis):
+        """Menge der Zimmer mit mindestens einer Belegung in [von, bis]"""
+        start, end = to_day(von), to_day(bis)
+        self.refresh()
+        with self._lock:
+            self._counters['queries'] += 1
+            return {zimm for zimm, room in self._rooms.items()
+                    if self._overlaps(room, start, end)}
+
+    def free_rooms(self, rooms, von, bis, category=None, persons=None):
+        """Freie Zimmer aus rooms (Dicts mit zimm, catg, maxv) filtern"""
+        occupied = self.occupied_rooms(von, bis)
+        return [
+            r for r in rooms
+            if r['zimm'] not in occupied
+            and (not category or r.get('catg') == category)
+            and (not persons or (r.get('maxv') or 2) >= persons)
+        ]
+
+    def occupied_days(self, von, bis, zimms):
+        """Pro Zimmer ein bytearray (1 = belegt) fuer jeden Tag in [von, bis]
+
+        Gezaehlt werden Naechte wie in occupancy_runs: belegt ist ein Tag mit
+        Anreise <= Tag < Abreise, der Abreisetag selbst ist frei (Wechseltag).
+        Sweep ueber Differenz-Array: jede Belegung kostet O(1), das
+        Aufsummieren O(Tage) - unabhaengig von der Aufenthaltsdauer.
+        """
+        start, end = to_day(von), to_day(bis)
+        days = end - start + 1
+        self.refresh()
+        result = {}
+        with self._lock:
+            self._counters['queries'] += 1
+            for zimm in zimms:
+                room = self._rooms.get(zimm)
+                flags = bytearray(days)
+                if room:
+                    diff = [0] * (days + 1)
+                    for s, e, _ in self._overlaps(room, start, end):
+                        if e <= max(s, start):
+                            continue  # keine Nacht im Zeitraum
+                        diff[max(s, start) - start] += 1
+                        diff[min(e, end + 1) - start] -= 1
+                    running = 0
+                    for i in range(days):
+                        running += diff[i]
+                        if running:
+                            flags[i] = 1
+                result[zimm] = flags
+        return result
+
+    def free_matrix(self, rooms, von, bis):
+        """Pro Kategorie und Tag: Anzahl freier Zimmer und groesste freie Kapazitaet
+
+        rooms: Dicts mit zimm, catg, maxv (maxv fehlt -> 2 wie bei /availability).
+        Rueckgabe: {catg: {"rooms": n, "free": [...], "max_free": [...]}}
+        """
+        days = to_day(bis) - to_day(von) + 1
+        occupied = self.occupied_days(von, bis, [r['zimm'] for r in rooms])
+        matrix = {}
+        for room in rooms:
+            cat = matrix.setdefault(room.get('catg'), {
+                "rooms": 0,
+                "free": [0] * days,
+                "max_free": [0] * days
+            })
+            cat['rooms'] += 1
+            capacity = room.get('maxv') or 2
+            free, max_free = cat['free'], cat['max_free']
+            flags = occupied[room['zimm']]
+            for i in range(days):
+                if not flags[i]:
+                    free[i] += 1
+                    if capacity > max_free[i]:
+                        max_free[i] = capacity
+        return matrix
+
+    def stats(self):
+        with self._lock:
+            return {
+                "loaded": self._loaded,
+                "rooms": len(self._rooms),
+                "reservations": len(self._by_resn),
+                "intervals": sum(len(r['entries']) for r in self._rooms.values()),
+                "last_load_ms": self._last_load_ms,
+                **self._counters
+            }
+
+# ============================================================================
+# KALENDER
+# ============================================================================
+
+CALENDAR_MAX_DAYS = 366
+
+
+def _day_string(value):
+    if value is None:
+        return None
+    if isinstance(value, (date, datetime)):
+        return value.strftime('%Y-%m-%d')
+    return str(value)[:10]
+
+
+def occupancy_runs(intervals, start, days):
+    """Run-Length-Kodierung der Belegung eines Zimmers pro Nacht
+
+    intervals: (Anreise-Tag, Abreise-Tag, resn) als Tagesnummern; belegt
+    sind die Naechte Anreise <= Tag < Abreise. Ergebnis: [[resn, Naechte], ...]
+    mit resn 0 fuer frei, zusammen genau days Naechte ab start.
+    """
+    nights = [0] * days
+    for arrival, departure, resn in intervals:
+        for i in range(max(arrival - start, 0), min(departure - start, days)):
+            if not nights[i]:
+                nights[i] = resn
+    runs = []
+    for value in nights:
+        if runs and runs[-1][0] == value:
+            runs[-1][1] += 1
+        else:
+            runs.append([value, 1])
+    return runs
+
+
+def build_calendar(rooms, bookings, start, end, occupancy=False):
+    """Belegungskalender in einem Durchlauf aufbauen
+
+    rooms:    Dicts mit zimm, beze
+    bookings: Dicts mit zimm, vndt, bsdt, resn, pers, stat, nacn
+    start/end: date (end inklusive)
+    occupancy: zusaetzlich Run-Length-Belegung pro Zimmer (siehe occupancy_runs)
+    """
+    by_room = {}
+    for b in bookings:
+        by_room.setdefault(b['zimm'], []).append(b)
+
+    start_day = start.toordinal()
+    days = end.toordinal() - start_day + 1
+    calendar = []
+    for room in rooms:
+        room_bookings = by_room.get(room['zimm'], [])
+        entry = {
+            "zimm": room['zimm'],
+            "name": room['beze'],
+            "bookings": [
+                {
+                    "resn": b['resn'],
+                    "from": _day_string(b['vndt']),
+                    "to": _day_string(b['bsdt']),
+                    "guest": b['nacn'],
+                    "guest_id": b.get('gast'),
+                    "persons": b['pers'],
+                    "status": b['stat']
+                }
+                for b in room_bookings
+            ]
+        }
+        if occupancy:
+            intervals = [
+                (to_day(b['vndt']), to_day(b['bsdt']), b['resn'])
+                for b in room_bookings if b['vndt'] and b['bsdt']
+            ]
+            intervals.sort()
+            entry["occupancy"] = occupancy_runs(intervals, start_day, days)
+        calendar.append(entry)
+    return calendar
+
+# ============================================================================
+# STAMMDATEN-CACHE (ZIM, CAT, ART, CHC/CHN, PMT)
+# ============================================================================
+
+class ReferenceCache:
+    """
+    Prozessweiter Cache fuer kleine, selten geaenderte Tabellen.
+
+    Pro Eintrag (register):
+    - loader():  liefert die Zeilen (Liste von Dicts)
+    - probe():   optionaler billiger Fingerprint (z.B. COUNT/MAX/SUM); wird
+                 hoechstens alle check_interval Sekunden abgefragt und loest
+                 bei Aenderung ein Neuladen aus
+    - ttl:       Sekunden, nach denen spaetestens neu geladen wird
+
+    Die gelieferten Zeilen werden geteilt und duerfen nicht veraendert werden.
+    """
+
+    def __init__(self, ttl=600, check_interval=30):
+        self.ttl = ttl
+        self.check_interval = check_interval
+        self._lock = threading.RLock()
+        self._entries = {}
+
+    def register(self, name, loader, probe=None, ttl=None):
+        with self._lock:
+            self._entries[name] = {
+                "loader": loader,
+                "probe": probe,
+                "ttl": self.ttl if ttl is None else ttl,
+                "rows": None,
+                "indexes": {},
+                "fingerprint": None,
+                "loaded_at": 0.0,
+                "checked_at": 0.0,
+                "version": 0,
+                "hits": 0,
+                "loads": 0,
+                "probes": 0
+            }
+
+    def get(self, name):
+        """Alle Zeilen (aus dem Speicher, bei Bedarf neu geladen)"""
+        with self._lock:
+            entry = self._entries[name]
+            self._refresh(entry)
+            entry['hits'] += 1
+            return entry['rows']
+
+    def version(self, name):
+        """Versionsnummer des Eintrags (steigt bei jedem Neuladen)"""
+        with self._lock:
+            entry = self._entries[name]
+            self._refresh(entry)
+            return entry['version']
+
+    def lookup(self, name, key, value, default=None):
+        """Eine Zeile per Schluesselspalte (Index wird pro Version gebaut)"""
+        return self.index(name, key).get(value, default)
+
+    def index(self, name, key):
+        """Dict Schluessel -> Zeile"""
+        with self._lock:
+            rows = self.get(name)
+            entry = self._entries[name]
+            index = entry['indexes'].get(key)
+            if index is None:
+                index = {row[key]: row for row in rows}
+                entry['indexes'][key] = index
+            return index
+
+    def invalidate(self, name=None):
+        """Eintrag (oder alle) beim naechsten Zugriff neu laden"""
+        with self._lock:
+            names = [name] if name else list(self._entries)
+            for n in names:
+                self._entries[n]['rows'] = None
+                self._entries[n]['indexes'] = {}
+
+    def _refresh(self, entry):
+        now = time.monotonic()
+        expired = entry['ttl'] and now - entry['loaded_at'] > entry['ttl']
+        if entry['rows'] is not None and not expired:
+            if entry['probe'] is None or now - entry['checked_at'] < self.check_interval:
+                return
+            entry['checked_at'] = now
+            entry['probes'] += 1
+            if entry['probe']() == entry['fingerprint']:
+                return
+        fingerprint = entry['probe']() if entry['probe'] is not None else None
+        rows = entry['loader']()
+        entry.update({
+            "rows": rows,
+            "indexes": {},
+            "fingerprint": fingerprint,
+            "loaded_at": now,
+            "checked_at": now,
+            "version": entry['version'] + 1,
+            "loads": entry['loads'] + 1
+        })
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            return {
+                name: {
+                    "rows": len(e['rows']) if e['rows'] is not None else None,
+                    "version": e['version'],
+                    "age_seconds": round(now - e['loaded_at'], 1) if e['rows'] is not None else None,
+                    "hits": e['hits'],
+                    "loads": e['loads'],
+                    "probes": e['probes']
+                }
+                for name, e in self._entries.items()
+            }
+
+# ============================================================================
+# TABELLEN-FINGERPRINTS (Aenderungserkennung)
+# ============================================================================
+
+class TableFingerprints:
+    """
+    Billige Aenderungserkennung pro Tabelle ohne die Tabelle zu lesen.
+
+    Fingerprint = Ergebnis einer Aggregat-Query (COUNT, MAX(Schluessel),
+    mit dem Schluessel gewichtete Summen ueber Spalten/Laengen - so faellt
+    auch eine zwischen zwei Zeilen vertauschte Zimmer- oder Reservierungs-
+    nummer auf). Aendert er sich, steigt die Versionsnummer der Tabelle;
+    Caches vergleichen nur noch Versionen. Aenderungen aus dem CapCorn-Client
+    werden so genauso erkannt wie eigene Schreibzugriffe.
+
+    - query(sql, params): liefert eine Zeile als Dict
+    - interval: Sekunden, die ein Fingerprint als aktuell gilt; start()
+      pollt im Hintergrund im selben Takt, aber nur beobachtete Tabellen
+      (watch() bzw. subscribe() mit Tabellen)
+
+    version()/versions() warten nie auf einen laufenden Poll, sondern
+    liefern dann die letzte bekannte Version. Eigene Schreibzugriffe
+    meldet touch() ohne DB-Abfrage.
+    """
+
+    def __init__(self, query, interval=30):
+        self._query = query
+        self.interval = interval
+        self._lock = threading.RLock()
+        self._poll_lock = threading.Lock()
+        self._tables = {}
+        self._watched = set()
+        self._subscribers = []
+        self._thread = None
+        self._running = False
+        self._polls = 0
+        self._skipped = 0
+
+    def register(self, table, key, aggregates, exact=True):
+        """Tabelle mit Schluesselspalte und Aggregat-Ausdruecken anmelden
+
+        exact=False: der Fingerprint sieht nicht jede Aenderung (z.B. Texte
+        nur ueber die Laenge) - taugt fuer Caches mit TTL, nicht als ETag.
+        """
+        with self._lock:
+            self._tables[table] = {
+                "key": key,
+                "aggregates": list(aggregates),
+                "exact": exact,
+                "fingerprint": None,
+                "version": 0,
+                "checked_at": 0.0,
+                "expired": False,
+                "changed_at": None,
+                "errors": 0
+            }
+
+    def tables(self):
+        return list(self._tables)
+
+    def known_max(self, table):
+        """MAX(Schluessel) aus dem letzten Poll (ohne Abfrage; None = unbekannt)"""
+        spec = self._tables[table]
+        fingerprint = spec['fingerprint']
+        expr = f"MAX({spec['key']})"
+        if fingerprint is None or expr not in spec['aggregates']:
+            return None
+        value = fingerprint[spec['aggregates'].index(expr)]
+        return None if value is None else int(float(value))
+
+    def exact(self, tables):
+        """Decken die Fingerprints aller Tabellen jede Inhaltsaenderung ab?"""
+        return all(self._tables[t]['exact'] for t in tables)
+
+    def watch(self, tables):
+        """Tabellen im Hintergrund-Poll beobachten (Caches, ETags, Nummernkreise)"""
+        with self._lock:
+            self._watched.update(t for t in tables if t in self._tables)
+
+    def compute(self, table, upto=None):
+        """Fingerprint direkt aus der DB (optional nur Zeilen mit Schluessel <= upto)
+
+        Wirft die DB-Exception weiter; aendert keine Versionen.
+        """
+        spec = self._tables[table]
+        columns = ', '.join(f"{expr} AS p{i}" for i, expr in enumerate(spec['aggregates']))
+        sql = f"SELECT {columns} FROM {table}"
+        params = None
+        if upto is not None:
+            sql += f" WHERE {spec['key']} <= ?"
+            params = (upto,)
+        row = self._query(sql, params)
+        return [None if row[f'p{i}'] is None else str(row[f'p{i}'])
+                for i in range(len(spec['aggregates']))]
+
+    def poll(self, tables=None, wait=True):
+        """Fingerprints neu abfragen; gibt die geaenderten Tabellen zurueck
+
+        wait=False: laeuft schon ein Poll, sofort ohne Abfrage zurueck.
+        """
+        if not self._poll_lock.acquire(blocking=wait):
+            self._skipped += 1
+            return []
+        changed = []
+        try:
+            for table in tables or self.tables():
+                spec = self._tables[table]
+                with self._lock:
+                    spec['expired'] = False
+                started = time.monotonic()
+                try:
+                    fingerprint = self.compute(table)
+                except Exception as e:
+                    # Unbekannter Zustand: als geaendert melden, damit niemand
+                    # mit veralteten Daten weiterarbeitet
+                    if not spec['errors']:
+                        print(f"[Fingerprint] {table}: {e}")
+                    fingerprint = None
+                    spec['errors'] += 1
+                with self._lock:
+                    # Waehrend der Abfrage verworfen: beim naechsten Mal neu fragen
+                    if not spec['expired']:
+                        spec['checked_at'] = started
+                    if fingerprint is None or fingerprint != spec['fingerprint']:
+                        spec['fingerprint'] = fingerprint
+                        spec['version'] += 1
+                        spec['changed_at'] = time.time()
+                        changed.append(table)
+            self._polls += 1
+        finally:
+            self._poll_lock.release()
+        if changed:
+            self._notify(changed)
+        return changed
+
+    def _stale(self, table, max_age, now):
+        """Muss table im Request neu abgefragt werden?"""
+        spec = self._tables[table]
+        if spec['expired']:
+            return True
+        if self._running and table in self._watched:
+            return False  # haelt der Hintergrund-Poll aktuell
+        return now - spec['checked_at'] >= max_age
+
+    def version(self, table, max_age=None):
+        """Versionsnummer (fragt neu ab, wenn aelter als max_age/interval)"""
+        return self.versions((table,), max_age)[table]
+
+    def touch(self, tables):
+        """Eigener Schreibzugriff: Version sofort erhoehen, ohne DB-Abfrage
+
+        Der naechste regulaere Poll liest den neuen Fingerprint nach (und
+        erhoeht dabei hoechstens noch einmal).
+        """
+        changed = []
+        with self._lock:
+            for table in tables:
+                if table in self._tables:
+                    spec = self._tables[table]
+                    spec['version'] += 1
+                    spec['changed_at'] = time.time()
+                    changed.append(table)
+        if changed:
+            self._notify(changed)
+
+    def expire(self, tables=None):
+        """Unbekannte Aenderung: der naechste version()-Aufruf fragt neu ab (auch wartend)"""
+        with self._lock:
+            for table in tables or self.tables():
+                if table in self._tables:
+                    self._tables[table]['expired'] = True
+
+    def versions(self, tables=None, max_age=None):
+        """Versionsnummern mehrerer Tabellen (veraltete in einem Durchgang abfragen)
+
+        Nur verworfene Tabellen (expire) warten auf einen laufenden Poll;
+        sonst gilt die letzte Version, bis der Poll fertig ist.
+        """
+        tables = list(tables or self.tables())
+        max_age = self.interval if max_age is None else max_age
+        now = time.monotonic()
+        stale = [t for t in tables if self._stale(t, max_age, now)]
+        if stale:
+            self.poll(stale, wait=any(self._tables[t]['expired'] for t in stale))
+        return {t: self._tables[t]['version'] for t in tables}
+
+    def subscribe(self, callback, tables=None):
+        """callback(table, version) bei jeder erkannten Aenderung aufrufen
+
+        Mit tables werden diese Tabellen auch beobachtet (watch). Gibt eine
+        Funktion zum Abmelden zurueck.
+        """
+        entry = (callback, set(tables) if tables else None)
+        with self._lock:
+            self._subscribers.append(entry)
+        if tables:
+            self.watch(tables)
+
+        def unsubscribe():
+            with self._lock:
+                if entry in self._subscribers:
+                    self._subscribers.remove(entry)
+        return unsubscribe
+
+    def _notify(self, changed):
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for callback, tables in subscribers:
+            for table in changed:
+                if tables is None or table in tables:
+                    try:
+                        callback(table, self._tables[table]['version'])
+                    except Exception as e:
+                        print(f"[Fingerprint] Subscriber-Fehler ({table}): {e}")
+
+    def start(self):
+        """Hintergrund-Polling der beobachteten Tabellen im Takt von interval starten"""
+        if self._running or not self.interval:
+            return
+        self._running = True
+
+        def loop():
+            while self._running:
+                with self._lock:
+                    watched = sorted(self._watched)
+                if watched:
+                    self.poll(watched)
+                time.sleep(self.interval)
+
+        self._thread = threading.Thread(target=loop, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+
+    def stats(self):
+        with self._lock:
+            return {
+                "interval": self.interval,
+                "polling": self._running,
+                "polls": self._polls,
+                "skipped": self._skipped,
+                "watched": sorted(self._watched),
+                "tables": {
+                    table: {
+                        "version": spec['version'],
+                        "exact": spec['exact'],
+                        "changed_at": (datetime.fromtimestamp(spec['changed_at']).isoformat()
+                                       if spec['changed_at'] else None),
+                        "errors": spec['errors']
+                    }
+                    for table, spec in self._tables.items()
+                }
+            }
+
+# ============================================================================
+# KEYSET-PAGINATION
+# ============================================================================
+
+def encode_cursor(field, value):
+    """Opaker Cursor fuer die naechste Seite (Schluesselspalte + letzter Wert)"""
+    raw = json.dumps([field, value], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode('ascii')
+
+
+def decode_cursor(cursor, field):
+    """Letzten Schluesselwert aus dem Cursor lesen (ValueError wenn ungueltig)"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        cursor_field, value = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise ValueError("Ungueltiger Cursor")
+    if cursor_field != field:
+        raise ValueError("Cursor gehoert zu einer anderen Liste")
+    return value
+
+
+def keyset_page(rows, limit, field):
+    """Seite aus limit + 1 gelesenen Zeilen bilden: (Zeilen, next_cursor oder None)"""
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(field, rows[-1][field])
+
+
+# ============================================================================
+# ZEILEN-ENCODER (aus cursor.description)
+# ============================================================================
+
+def _iso_datetime(value):
+    return value.isoformat() if value.year > 1900 else None
+
+
+def _iso_day(value):
+    return value.date().isoformat() if value.year > 1900 else None
+
+
+def _any_converter(convert_datetime):
+    """Fallback fuer Spalten ohne verlaessliche Typ-Info (Pruefung pro Wert)"""
+    def convert(value):
+        if isinstance(value, datetime):
+            return convert_datetime(value)
+        if isinstance(value, date):
+            return value.isoformat()
+        if isinstance(value, Decimal):
+            return float(value)
+        return value
+    return convert
+
+
+_PASSTHROUGH_TYPES = (str, int, float, bool)
+
+
+def _column_converter(type_code, convert_datetime):
+    if type_code in _PASSTHROUGH_TYPES:
+        return None
+    if type_code is datetime:
+        return convert_datetime
+    if type_code is date:
+        return date.isoformat
+    if type_code is Decimal:
+        return float
+    return _any_converter(convert_datetime)
+
+
+def row_encoder(description, dates='iso'):
+    """
+    Encoder fuer die Zeilen einer Query bauen: tuple -> JSON-fertiges Dict.
+
+    Die Spaltentypen werden einmal aus cursor.description gelesen; pro Zeile
+    laufen nur noch die Konverter der Datums-/Decimal-Spalten.
+    - Datum: ISO-String (dates='day': nur YYYY-MM-DD), vor 1900 -> None
+    - Decimal: float
+    - None und alle anderen Werte unveraendert
+    Doppelte Spaltennamen verhalten sich wie dict(zip(...)): die letzte gewinnt.
+    """
+    columns = tuple(column[0] for column in description)
+    convert_datetime = _iso_day if dates == 'day' else _iso_datetime
+    last = {name: i for i, name in enumerate(columns)}
+    converters = []
+    for i, column in enumerate(description):
+        convert = _column_converter(column[1], convert_datetime)
+        if convert is not None and last[column[0]] == i:
+            converters.append((i, column[0], convert))
+
+    if not converters:
+        def encode(row):
+            return dict(zip(columns, row))
+        return encode
+
+    def encode(row):
+        result = dict(zip(columns, row))
+        for i, name, convert in converters:
+            value = row[i]
+            if value is not None:
+                result[name] = convert(value)
+        return result
+    return encode
+
+
+# ============================================================================
+# NDJSON-STREAMING
+# ============================================================================
+
+STREAM_BATCH_ROWS = 500
+
+
+def json_default(value):
+    """json.dumps-Fallback fuer Datums- und Decimal-Werte aus pyodbc"""
+    if isinstance(value, datetime):
+        return value.isoformat() if value.year > 1900 else None
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return float(value)
+    raise TypeError(f"{type(value).__name__} ist nicht JSON-serialisierbar")
+
+
+def iter_cursor_rows(cursor, batch=STREAM_BATCH_ROWS):
+    """Zeilen eines ausgefuehrten Cursors per fetchmany als JSON-fertige Dicts liefern"""
+    encode = row_encoder(cursor.description or ())
+    while True:
+        rows = cursor.fetchmany(batch)
+        if not rows:
+            return
+        for row in rows:
+            yield encode(row)
+
+
+def ndjson_stream(rows, serialize=None, limit=None, key=None, batch=STREAM_BATCH_ROWS, dumps=None):
+    """
+    Zeilen als NDJSON-Chunks (bytes) erzeugen - eine JSON-Zeile pro Datensatz,
+    alle `batch` Zeilen wird ein Chunk geliefert.
+
+    Die letzte Zeile ist {"_end": true, "count": n, "next_cursor": ...}; fehlt
+    sie, wurde der Stream abgebrochen. Mit limit/key gilt dieselbe Logik wie
+    bei keyset_page (limit + 1 Zeilen lesen). dumps: Encoder aus json_codec().
+    """
+    encode = dumps or json_codec()[1]
+    chunk = []
+    count = 0
+    last = None
+    next_cursor = None
+    for row in rows:
+        if limit is not None and count >= limit:
+            next_cursor = encode_cursor(key, last[key])
+            break
+        chunk.append(encode(serialize(row) if serialize is not None else row))
+        count += 1
+        last = row
+        if len(chunk) >= batch:
+            chunk.append(b'')
+            yield b'\n'.join(chunk)
+            chunk = []
+    chunk.append(encode({"_end": True, "count": count, "next_cursor": next_cursor}))
+    chunk.append(b'')
+    yield b'\n'.join(chunk)
+
+
+# ============================================================================
+# JSON-ENCODER (orjson / ujson / json)
+# ============================================================================
+
+JSON_BACKENDS = ('orjson', 'ujson', 'json')
+
+
+def _stdlib_dumps():
+    encode = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'), default=json_default).encode
+
+    def dumps(obj):
+        return encode(obj).encode('utf-8')
+    return dumps
+
+
+def _orjson_dumps():
+    import orjson
+    # Datumswerte ueber json_default, damit "vor 1900 -> None" ueberall gilt
+    option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+
+    def dumps(obj):
+        return orjson.dumps(obj, default=json_default, option=option)
+    return dumps
+
+
+def _ujson_dumps():
+    import ujson
+    ujson.dumps(Decimal(1), default=float)  # aeltere ujson-Versionen kennen kein default
+
+    def dumps(obj):
+        return ujson.dumps(obj, ensure_ascii=False, default=json_default).encode('utf-8')
+    return dumps
+
+
+_JSON_FACTORIES = {'orjson': _orjson_dumps, 'ujson': _ujson_dumps, 'json': _stdlib_dumps}
+
+
+def json_codec(preferred=None):
+    """
+    Schnellsten verfuegbaren JSON-Encoder waehlen: (Name, dumps) - dumps
+    liefert UTF-8-bytes. preferred ('orjson', 'ujson', 'json', 'auto'/None)
+    wird zuerst versucht; ist er nicht installiert, gilt die normale Reihenfolge.
+    """
+    order = list(JSON_BACKENDS)
+    if preferred in _JSON_FACTORIES:
+        order.remove(preferred)
+        order.insert(0, preferred)
+    for name in order:
+        try:
+            return name, _JSON_FACTORIES[name]()
+        except Exception:
+            continue
+    return 'json', _stdlib_dumps()
+
+
+def install_json_provider(app, preferred=None):
+    """
+    Flask-App (ab Flask 2.2) auf den gewaehlten Encoder umstellen: jsonify()
+    schreibt dann direkt bytes, Datum und Decimal werden nativ kodiert.
+    Gibt (Name, dumps) zurueck, z.B. fuer den NDJSON-Stream.
+    """
+    from flask.json.provider import DefaultJSONProvider
+
+    name, dumps = json_codec(preferred)
+
+    class FastJSONProvider(DefaultJSONProvider):
+        backend = name
+
+        def dumps(self, obj, **kwargs):
+            return dumps(obj).decode('utf-8')
+
+        def response(self, *args, **kwargs):
+            obj = self._prepare_response_obj(args, kwargs)
+            with profile_phase('encode'):
+                body = dumps(obj) + b"\n"
+            return self._app.response_class(body, mimetype=self.mimetype)
+
+    app.json = FastJSONProvider(app)
+    return name, dumps
+
+
+# ============================================================================
+# HTTP: ETAG & KOMPRESSION
+# ============================================================================
+
+COMPRESS_MIN_BYTES = 1024
+_ENCODING_SUFFIX = {'gzip': '-gz', 'br': '-br'}
+
+
+def body_etag(body):
+    """Starker ETag aus dem Antwort-Body"""
+    return '"' + hashlib.blake2b(body, digest_size=12).hexdigest() + '"'
+
+
+def version_etag(*parts):
+    """Starker ETag aus Tabellen-Versionen + Request (ohne den Body zu bauen)"""
+    raw = repr(parts).encode('utf-8')
+    return '"v' + hashlib.blake2b(raw, digest_size=12).hexdigest() + '"'
+
+
+def encoded_etag(etag, encoding):
+    """ETag fuer die komprimierte Variante (eigener Wert pro Content-Encoding)"""
+    return etag[:-1] + _ENCODING_SUFFIX[encoding] + '"'
+
+
+def _etag_base(tag):
+    tag = tag.strip()
+    if tag.startswith('W/'):
+        tag = tag[2:]
+    tag = tag.strip('"')
+    for suffix in _ENCODING_SUFFIX.values():
+        if tag.endswith(suffix):
+            return tag[:-len(suffix)]
+    return tag
+
+
+def etag_matches(if_none_match, etag):
+    """If-None-Match gegen einen ETag pruefen (schwacher Vergleich, alle Encodings)"""
+    if not if_none_match:
+        return False
+    base = _etag_base(etag)
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate == '*' or (candidate and _etag_base(candidate) == base):
+            return True
+    return False
+
+
+_brotli = None
+
+
+def _brotli_module():
+    global _brotli
+    if _brotli is None:
+        try:
+            import brotli
+            _brotli = brotli
+        except ImportError:
+            _brotli = False
+    return _brotli or None
+
+
+def negotiate_encoding(accept_encoding):
+    """Bestes Content-Encoding aus Accept-Encoding: 'br' (wenn installiert), 'gzip' oder None"""
+    weights = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        weights[name] = q
+    candidates = ['br', 'gzip'] if _brotli_module() else ['gzip']
+    best, best_q = None, 0.0
+    for name in candidates:
+        q = weights.get(name, weights.get('*', 0.0))
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def compress_body(body, encoding):
+    """Body komprimieren (mittlere Stufe: wenig CPU, gute Rate bei JSON)"""
+    with profile_phase('encode'):
+        if encoding == 'br':
+            return _brotli_module().compress(body, quality=5)
+        return gzip.compress(body, compresslevel=6)
+
+
+
+# ============================================================================
+# SINGLE-FLIGHT (gleichzeitige identische Anfragen buendeln)
+# ============================================================================
+
+class _FlightCall:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Gleichzeitige Aufrufe mit demselben Schluessel nur einmal ausfuehren.
+
+    Der erste Aufrufer (Leader) rechnet, alle weiteren warten auf sein
+    Ergebnis bzw. bekommen seine Exception. Nach dem Ende wird nichts
+    aufbewahrt - das ist kein Cache, nur eine Buendelung paralleler Arbeit.
+    Wartet ein Aufrufer laenger als timeout, rechnet er selbst.
+    """
+
+    def __init__(self, timeout=60):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._groups = {}
+
+    def do(self, key, func, group=None):
+        """func() fuer key ausfuehren oder mitwarten: (Ergebnis, geteilt)"""
+        with self._lock:
+            counters = self._groups.setdefault(
+                group or key, {"leaders": 0, "coalesced": 0, "errors": 0, "timeouts": 0}
+            )
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _FlightCall()
+                counters['leaders'] += 1
+            else:
+                counters['coalesced'] += 1
+
+        if not leader:
+            if call.done.wait(self.timeout):
+                if call.error is not None:
+                    raise call.error
+                return call.result, True
+            with self._lock:
+                counters['timeouts'] += 1
+            return func(), False
+
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            with self._lock:
+                counters['errors'] += 1
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
+            call.done.set()
+        return call.result, False
+
+    def stats(self):
+        with self._lock:
+            groups = {name: dict(c) for name, c in self._groups.items()}
+            in_flight = len(self._calls)
+        return {
+            "in_flight": in_flight,
+            "leaders": sum(c['leaders'] for c in groups.values()),
+            "coalesced": sum(c['coalesced'] for c in groups.values()),
+            "routes": groups
+        }
+
+
+# ============================================================================
+# RESPONSE-CACHE (TTL + Tabellen-Abhaengigkeiten + LRU)
+# ============================================================================
+
+class ResponseCache:
+    """
+    Fertige Antworten pro Schluessel (Pfad + Query) fuer eine TTL aufbewahren.
+
+    Jeder Eintrag nennt die Tabellen, aus denen er gebaut wurde;
+    invalidate_tables() verwirft genau die betroffenen Eintraege. Der
+    Speicher ist durch max_bytes/max_entries begrenzt, verdraengt wird der
+    am laengsten nicht benutzte Eintrag (LRU).
+
+    Gegen Rennen mit Schreibzugriffen: generation() vor dem Berechnen
+    merken und an put() uebergeben - hat sich eine der Tabellen inzwischen
+    geaendert, wird das Ergebnis nicht gespeichert.
+    """
+
+    def __init__(self, max_bytes=32 * 1024 * 1024, max_entries=1000):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._by_table = {}
+        self._generations = {}
+        self._epoch = 0
+        self._bytes = 0
+        self._routes = {}
+        self._counters = {"evictions": 0, "invalidations": 0, "stale_puts": 0}
+
+    def _route(self, group):
+        return self._routes.setdefault(group, {"hits": 0, "misses": 0, "stores": 0})
+
+    def get(self, key, group=None):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry['expires'] <= now:
+                self._drop(key)
+                entry = None
+            counters = self._route(group or key)
+            if entry is None:
+                counters['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            counters['hits'] += 1
+            return entry['value']
+
+    def generation(self, tables):
+        with self._lock:
+            return self._generation_locked(tables)
+
+    def _generation_locked(self, tables):
+        return (self._epoch,) + tuple(self._generations.get(t, 0) for t in tables)
+
+    def put(self, key, value, size, ttl, tables, generation=None, group=None):
+        """Eintrag speichern (False, wenn zu gross oder inzwischen veraltet)"""
+        tables = tuple(tables)
+        with self._lock:
+            if generation is not None and generation != self._generation_locked(tables):
+                self._counters['stale_puts'] += 1
+                return False
+            if size > self.max_bytes:
+                return False
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = {
+                "value": value, "size": size, "tables": tables,
+                "expires": time.monotonic() + ttl
+            }
+            for table in tables:
+                self._by_table.setdefault(table, set()).add(key)
+            self._bytes += size
+            self._route(group or key)['stores'] += 1
+            while self._entries and (self._bytes > self.max_bytes or len(self._entries) > self.max_entries):
+                self._drop(next(iter(self._entries)))
+                self._counters['evictions'] += 1
+            return True
+
+    def invalidate_tables(self, tables):
+        """Alle Eintraege verwerfen, die von einer der Tabellen abhaengen"""
+        with self._lock:
+            for table in tables:
+                self._generations[table] = self._generations.get(table, 0) + 1
+                for key in list(self._by_table.get(table, ())):
+                    self._drop(key)
+                    self._counters['invalidations'] += 1
+
+    def clear(self):
+        with self._lock:
+            self._epoch += 1
+            self._counters['invalidations'] += len(self._entries)
+            self._entries.clear()
+            self._by_table.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        entry = self._entries.pop(key)
+        self._bytes -= entry['size']
+        for table in entry['tables']:
+            keys = self._by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_table[table]
+
+    def stats(self):
+        with self._lock:
+            hits = sum(r['hits'] for r in self._routes.values())
+            misses = sum(r['misses'] for r in self._routes.values())
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_entries": self.max_entries,
+                "hits": hits,
+                "misses": misses,
+                "hit_rate": round(hits / (hits + misses), 3) if hits + misses else None,
+                **self._counters,
+                "routes": {name: dict(r) for name, r in self._routes.items()}
+            }
+
+
+# ============================================================================
+# NUMMERNKREISE (statt SELECT MAX(id) + 1 bei jedem Insert)
+# ============================================================================
+
+class SequenceAllocator:
+    """
+    Vergibt Schluessel (resn, gast, aknr, ...) im Prozess unter einem Lock.
+
+    - max_query(table, column): aktuelles MAX aus der DB (nur zum Abgleich)
+    - probe(table): optional der zuletzt bekannte Hoechstwert ohne eigene
+      Abfrage (z.B. MAX aus dem letzten Fingerprint-Poll); erreicht er die
+      naechste Nummer, hat der CapCorn-Client Nummern vergeben und MAX wird
+      neu gelesen. Eigene Einfuegungen liegen immer darunter und loesen
+      keinen Abgleich aus.
+
+    Der Zaehler laeuft nie rueckwaerts: Nummern aus zurueckgerollten
+    Transaktionen bleiben als Luecke, werden aber nie doppelt vergeben.
+    """
+
+    def __init__(self, max_query, probe=None):
+        self._max_query = max_query
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._sequences = {}
+
+    def register(self, table, column):
+        with self._lock:
+            self._sequences[table] = {
+                "column": column,
+                "next": None,
+                "stale": False,
+                "allocated": 0,
+                "syncs": 0
+            }
+
+    def next(self, table):
+        """Naechste freie Nummer"""
+        return self.reserve(table, 1)
+
+    def reserve(self, table, count):
+        """count aufeinanderfolgende Nummern reservieren; gibt die erste zurueck"""
+        with self._lock:
+            seq = self._sequences[table]
+            seen = self._probe(table) if self._probe is not None else None
+            if (seq['next'] is None or seq['stale']
+                    or (seen is not None and seen >= seq['next'])):
+                current = self._max_query(table, seq['column']) or 0
+                seq['next'] = max(seq['next'] or 0, current + 1)
+                seq['stale'] = False
+                seq['syncs'] += 1
+            first = seq['next']
+            seq['next'] += count
+            seq['allocated'] += count
+            return first
+
+    def invalidate(self, table=None):
+        """Vor der naechsten Vergabe MAX neu lesen (z.B. nach Backup-Restore)"""
+        with self._lock:
+            for name in ([table] if table else list(self._sequences)):
+                seq = self._sequences[name]
+                seq['stale'] = True
+                if table is None:
+                    seq['next'] = None
+
+    def stats(self):
+        with self._lock:
+            return {
+                name: {"next": s['next'], "allocated": s['allocated'], "syncs": s['syncs']}
+                for name, s in self._sequences.items()
+            }
+
+
+# ============================================================================
+# KONTOBUCHUNGEN (AKZ gesammelt schreiben)
+# ============================================================================
+
+class AccountPoster:
+    """
+    Schreibt AKZ-Positionen gesammelt: aknr-Block in einem Schritt
+    reservieren, dann ein executemany pro Spaltensatz.
+
+    - allocate(count): erste von count reservierten aknr (SequenceAllocator)
+    - fast_executemany: pyodbc-Parameter-Arrays nutzen (nur wenn der
+      ODBC-Treiber sie kann - der Access-Treiber kann es nicht zuverlaessig)
+
+    Jede Zeile ist ein Dict mit den AKZ-Spalten (resn, zimm, artn, prei,
+    bez1, optional meng, ...); lfdn = 1 und edat = jetzt sind Vorgaben.
+
+    Innerhalb einer offenen Transaktion (commit=False) den aknr-Block vorher
+    mit reserve() holen und als first uebergeben - die Vergabe liest sonst
+    mitten in der Transaktion auf derselben Verbindung.
+    """
+
+    def __init__(self, allocate, fast_executemany=False):
+        self._allocate = allocate
+        self.fast_executemany = fast_executemany
+        self._lock = threading.Lock()
+        self._counters = {"batches": 0, "lines": 0, "fallbacks": 0, "failed_lines": 0}
+
+    def reserve(self, count):
+        """count aufeinanderfolgende aknr reservieren; gibt die erste zurueck"""
+        return self._allocate(count)
+
+    def post(self, conn, lines, commit=True, partial=False, first=None):
+        """
+        Zeilen buchen; gibt pro Zeile {"success", "aknr"} bzw. {"success": False,
+        "error"} in derselben Reihenfolge zurueck.
+
+        commit=False: Teil einer groesseren Transaktion des Aufrufers.
+        partial=True: schlaegt der Sammel-Insert fehl, wird zurueckgerollt und
+        zeilenweise gebucht - fehlerhafte Zeilen werden gemeldet, der Rest
+        committet. Ohne partial wird die Exception weitergereicht. Das
+        Zurueckrollen verwirft die ganze Transaktion, daher nur mit commit=True.
+        first: erste aknr eines mit reserve(len(lines)) reservierten Blocks.
+        """
+        if partial and not commit:
+            raise ValueError("partial=True verwirft die Transaktion des Aufrufers (nur mit commit=True)")
+        lines = list(lines)
+        if not lines:
+            return []
+        if first is None:
+            first = self._allocate(len(lines))
+        now = datetime.now()
+        rows = []
+        groups = {}
+        for i, line in enumerate(lines):
+            row = {"aknr": first + i, "lfdn": 1, "edat": now}
+            row.update(line)
+            rows.append(row)
+            groups.setdefault(tuple(row), []).append(i)
+
+        cursor = conn.cursor()
+        if self.fast_executemany:
+            cursor.fast_executemany = True
+        try:
+            for columns, indexes in groups.items():
+                cursor.executemany(self._insert_sql(columns),
+                                   [tuple(rows[i][c] for c in columns) for i in indexes])
+        except Exception:
+            if not partial:
+                raise
+            conn.rollback()
+            results = self._post_each(cursor, rows)
+        else:
+            results = [{"success": True, "aknr": row['aknr']} for row in rows]
+        if commit:
+            conn.commit()
+
+        with self._lock:
+            self._counters['batches'] += 1
+            self._counters['lines'] += len(rows)
+        return results
+
+    def _post_each(self, cursor, rows):
+        results = []
+        failed = 0
+        for row in rows:
+            columns = tuple(row)
+            try:
+                cursor.execute(self._insert_sql(columns), tuple(row[c] for c in columns))
+                results.append({"success": True, "aknr": row['aknr']})
+            except Exception as e:
+                failed += 1
+                results.append({"success": False, "error": str(e)})
+        with self._lock:
+            self._counters['fallbacks'] += 1
+            self._counters['failed_lines'] += failed
+        return results
+
+    @staticmethod
+    def _insert_sql(columns):
+        return f"INSERT INTO AKZ ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+
+    def stats(self):
+        with self._lock:
+            return dict(self._counters)
+
+
+# ============================================================================
+# ZIMMER-SPERREN (Pruefen + Anlegen pro Zimmer serialisieren)
+# ============================================================================
+
+class RoomLockTimeout(RuntimeError):
+    """Zimmer-Sperre nicht innerhalb des Timeouts frei"""
+
+
+class RoomLocks:
+    """
+    Prozessinterne Sperre pro Zimmer: Verfuegbarkeitspruefung und Insert
+    fuer dasselbe Zimmer laufen nacheinander, verschiedene Zimmer parallel.
+
+    - timeout: Sekunden, die hold() auf die Sperre wartet (RoomLockTimeout)
+
+    Sperren werden bei Bedarf angelegt und wieder entfernt, sobald niemand
+    mehr haelt oder wartet.
+    """
+
+    def __init__(self, timeout=10):
+        self.timeout = timeout
+        self._lock = threading.Lock()
+        self._rooms = {}  # zimm -> [Lock, Halter + Wartende]
+        self._counters = {"acquired": 0, "contended": 0, "timeouts": 0}
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+
+    @contextmanager
+    def hold(self, zimm, timeout=None):
+        """Sperre fuer zimm halten; wartet hoechstens timeout Sekunden"""
+        timeout = self.timeout if timeout is None else timeout
+        with self._lock:
+            entry = self._rooms.setdefault(zimm, [threading.Lock(), 0])
+            entry[1] += 1
+
+        try:
+            start = time.monotonic()
+            got = entry[0].acquire(blocking=False)
+            contended = not got
+            if not got:
+                got = entry[0].acquire(timeout=timeout)
+            waited = time.monotonic() - start
+            with self._lock:
+                if contended:
+                    self._counters['contended'] += 1
+                    self._wait_total += waited
+                    self._wait_max = max(self._wait_max, waited)
+                self._counters['acquired' if got else 'timeouts'] += 1
+            if not got:
+                raise RoomLockTimeout(f"Zimmer {zimm}: Sperre nach {timeout}s nicht frei")
+            try:
+                yield waited
+            finally:
+                entry[0].release()
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self._rooms[zimm]
+
+    def stats(self):
+        with self._lock:
+            contended = self._counters['contended']
+            return {
+                "timeout": self.timeout,
+                "rooms_locked": len(self._rooms),
+                **self._counters,
+                "wait_ms_avg": round(self._wait_total / contended * 1000, 1) if contended else 0.0,
+                "wait_ms_max": round(self._wait_max * 1000, 1)
+            }
+
+
+# ============================================================================
+# SCHREIB-QUEUE (Gruppen-Commit auf einer Verbindung)
+# ============================================================================
+
+class WriteQueueTimeout(RuntimeError):
+    """Schreiboperation nicht innerhalb des Timeouts gestartet"""
+
+
+class WriteQueue:
+    """
+    Ein Schreib-Thread mit eigener, langlebiger Verbindung fuer kleine
+    Schreiboperationen. Access/Jet mag keine parallelen Schreiber (Seiten-
+    Sperren, .ldb); hier schreibt nur ein Thread, und alle Operationen, die
+    waehrend eines Commits auflaufen, gehen gemeinsam in den naechsten.
+
+    - connect:   Funktion, die eine neue DB-Verbindung liefert
+    - window:    Sekunden, die nach der ersten Operation auf weitere gewartet wird
+    - max_batch: Maximale Operationen pro Commit
+    - timeout:   Sekunden, die run() auf den Start der Operation wartet
+
+    Eine Operation ist op(conn) -> Ergebnis und committet nicht selbst.
+    Schlaegt eine Operation fehl, wird die Gruppe zurueckgerollt und ohne
+    sie wiederholt - der Fehler geht nur an ihren Aufrufer.
+    """
+
+    def __init__(self, connect, window=0.005, max_batch=64, timeout=30):
+        self._connect = connect
+        self.window = window
+        self.max_batch = max(1, int(max_batch))
+        self.timeout = timeout
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._conn = None
+        self._reset = False
+        self._counters = {"operations": 0, "commits": 0, "failed": 0, "retries": 0, "timeouts": 0}
+        self._largest_batch = 0
+
+    def submit(self, op):
+        """Operation einreihen; gibt ein Future mit dem Ergebnis zurueck"""
+        future = Future()
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="write-queue", daemon=True)
+                self._thread.start()
+        self._queue.put((op, future))
+        return future
+
+    def run(self, op):
+        """Operation einreihen und auf das Ergebnis warten (Fehler werden geworfen)"""
+        future = self.submit(op)
+        try:
+            return future.result(self.timeout)
+        except FutureTimeout:
+            if future.cancel():
+                with self._lock:
+                    self._counters['timeouts'] += 1
+                raise WriteQueueTimeout(f"Schreiboperation nach {self.timeout}s nicht gestartet")
+            # Laeuft bereits - Ergebnis abwarten
+            return future.result()
+
+    def execute(self, query, params=None):
+        """Einzelnes Statement ueber die Queue; gibt rowcount zurueck"""
+        def op(conn):
+            cursor = conn.cursor()
+            if params:
+                cursor.execute(query, params)
+            else:
+                cursor.execute(query)
+            return cursor.rowcount
+        return self.run(op)
+
+    def reset(self):
+        """Verbindung vor dem naechsten Commit neu aufbauen (z.B. neuer DB-Pfad)"""
+        self._reset = True
+
+    # ------------------------------------------------------------------
+    # Schreib-Thread
+    # ------------------------------------------------------------------
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.window
+            while len(batch) < self.max_batch:
+                try:
+                    batch.append(self._queue.get(timeout=max(0.0, deadline - time.monotonic())))
+                except queue.Empty:
+                    break
+            batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+
+    def _connection(self):
+        if self._reset:
+            self._reset = False
+            self._drop()
+        if self._conn is None:
+            self._conn = self._connect()
+        return self._conn
+
+    def _drop(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                conn.close()
+            except Exception:
+                pass
+
+    def _rollback(self):
+        try:
+            self._conn.rollback()
+        except Exception:
+            self._drop()
+
+    def _commit(self, batch):
+        pending = list(batch)
+        while pending:
+            try:
+                conn = self._connection()
+            except Exception as e:
+                for _, future in pending:
+                    future.set_exception(e)
+                self._count(failed=len(pending))
+                return
+
+            results = []
+            failed = None
+            for item in pending:
+                try:
+                    results.append(item[0](conn))
+                except Exception as e:
+                    failed = (item, e)
+                    break
+
+            if failed is None:
+                try:
+                    conn.commit()
+                except Exception as e:
+                    self._rollback()
+                    if len(pending) > 1:
+                        # Gruppe nicht committbar: jede Operation einzeln
+                        self._count(retries=1)
+                        for item in pending:
+                            self._commit([item])
+                        return
+                    pending[0][1].set_exception(e)
+                    self._count(failed=1)
+                    return
+                for (_, future), result in zip(pending, results):
+                    future.set_result(result)
+                self._count(operations=len(pending), commits=1, batch=len(pending))
+                return
+
+            (item, error) = failed
+            self._rollback()
+            item[1].set_exception(error)
+            pending.remove(item)
+            self._count(failed=1, retries=1 if pending else 0)
+
+    def _count(self, operations=0, commits=0, failed=0, retries=0, batch=0):
+        with self._lock:
+            self._counters['operations'] += operations
+            self._counters['commits'] += commits
+            self._counters['failed'] += failed
+            self._counters['retries'] += retries
+            self._largest_batch = max(self._largest_batch, batch)
+
+    def stats(self):
+        with self._lock:
+            commits = self._counters['commits']
+            return {
+                "queued": self._queue.qsize(),
+                **self._counters,
+                "avg_batch": round(self._counters['operations'] / commits, 2) if commits else 0.0,
+                "largest_batch": self._largest_batch
+            }
+
+
+# ============================================================================
+# DATENBANK-BACKENDS (Access/ODBC oder SQLite-Nachbildung)
+# ============================================================================
+
+# Teilmenge des CapCorn-Schemas, die die Bridge liest und schreibt
+# (Tabelle -> Spalten mit SQLite-Typ; DATETIME wird als datetime gelesen)
+CAPCORN_SCHEMA = {
+    'ZIM': ['zimm INTEGER PRIMARY KEY', 'beze TEXT', 'bett TEXT', 'stat INTEGER DEFAULT 0',
+            'catg INTEGER', 'betm INTEGER', 'maxv INTEGER', 'type INTEGER'],
+    'CAT': ['catg INTEGER PRIMARY KEY', 'beze TEXT', 'bez1 TEXT', 'bett TEXT', 'type INTEGER',
+            'betm INTEGER', 'maxv INTEGER', 'maxe INTEGER']
+           + [f'prw{c} REAL' for c in 'abcde'] + [f'prs{c} REAL' for c in 'abcde'],
+    'ART': ['artn INTEGER PRIMARY KEY', 'beze TEXT', 'prei REAL', 'knto TEXT'],
+    'CHC': ['chid INTEGER PRIMARY KEY', 'name TEXT'],
+    'CHN': ['chid INTEGER PRIMARY KEY', 'name TEXT'],
+    'PMT': ['paym INTEGER PRIMARY KEY', 'payt TEXT', 'gknt TEXT', 'flag INTEGER'],
+    'BUC': ['resn INTEGER PRIMARY KEY', 'gast INTEGER DEFAULT 0', 'stat INTEGER DEFAULT 0',
+            'flgl INTEGER DEFAULT 0', 'andf DATETIME', 'ande DATETIME', 'chid INTEGER DEFAULT 0',
+            'bdat DATETIME', 'extn TEXT', 'tokn TEXT', 'bemk TEXT'],
+    'BUZ': ['buzn INTEGER PRIMARY KEY', 'resn INTEGER', 'lfdn INTEGER', 'zimm INTEGER',
+            'vndt DATETIME', 'bsdt DATETIME', 'pers INTEGER DEFAULT 0', 'kndr INTEGER DEFAULT 0',
+            'pession INTEGER DEFAULT 0', 'ckin INTEGER DEFAULT 0'],
+    'GKT': ['gast INTEGER PRIMARY KEY', 'anre TEXT', 'akad TEXT', 'vorn TEXT', 'nacn TEXT',
+            'gesc TEXT', 'gebd DATETIME', 'gebg DATETIME', 'mail TEXT', 'mad1 TEXT', 'teln TEXT',
+            'mobt TEXT', 'faxn TEXT', 'skyp TEXT', 'stra TEXT', 'polz TEXT', 'ortb TEXT',
+            'land TEXT', 'nati TEXT', 'lang TEXT', 'beru TEXT', 'noti TEXT', 'raba REAL',
+            'frau TEXT', 'gebf DATETIME', 'gesf TEXT', 'cvgf TEXT', 'cvdf TEXT']
+           + [f'{col}{n} {typ}' for n in range(1, 10)
+              for col, typ in (('kin', 'TEXT'), ('geb', 'DATETIME'), ('ges', 'TEXT'),
+                               ('cvg', 'TEXT'), ('cvd', 'TEXT'), ('nac', 'TEXT'))]
+           + ['cvdg TEXT', 'cvgg TEXT', 'cvbd DATETIME', 'uidn TEXT', 'type TEXT', 'grup TEXT',
+              'b2bc TEXT', 'flag INTEGER']
+           + [f'att{c} TEXT' for c in '123456789a']
+           + ['nacf TEXT', 'vert TEXT', 'rdoc TEXT', 'azus TEXT', 'dat1 DATETIME', 'dat2 DATETIME'],
+    'GKI': ['gkid INTEGER PRIMARY KEY', 'vorn TEXT', 'nacn TEXT', 'gebd DATETIME', 'land TEXT'],
+    'AKZ': ['aknr INTEGER PRIMARY KEY', 'lfdn INTEGER', 'edat DATETIME', 'resn INTEGER',
+            'zimm INTEGER', 'artn INTEGER', 'prei REAL', 'bez1 TEXT', 'meng REAL'],
+    'REC': ['rnum INTEGER PRIMARY KEY', 'edat DATETIME', 'rbez TEXT', 'gast INTEGER',
+            'pmt1 INTEGER', 'pmv1 REAL DEFAULT 0', 'pmv2 REAL DEFAULT 0', 'pmv3 REAL DEFAULT 0',
+            'pmta REAL'],
+    'ANM': ['annr INTEGER PRIMARY KEY', 'resn INTEGER', 'gast INTEGER', 'stat INTEGER',
+            'dat1 DATETIME', 'dat2 DATETIME', 'pers INTEGER', 'kind INTEGER', 'numr TEXT'],
+}
+
+# Indizes wie in der CapCorn-Datenbank (Fremdschluessel der Bridge-Abfragen)
+CAPCORN_INDEXES = [
+    ('BUC', 'gast'), ('BUZ', 'resn'), ('BUZ', 'zimm'), ('AKZ', 'resn'),
+    ('REC', 'gast'), ('REC', 'edat'), ('ANM', 'resn'),
+]
+
+
+class AccessBackend:
+    """CapCorn-Datenbank (.mdb/.accdb) ueber pyodbc und den Access-ODBC-Treiber"""
+
+    name = 'access'
+    health_query = "SELECT TOP 1 zimm FROM ZIM"
+
+    def __init__(self, path):
+        self.path = path
+
+    def connect(self):
+        import pyodbc
+        return pyodbc.connect(f"DRIVER={{Microsoft Access Driver (*.mdb, *.accdb)}};DBQ={self.path}")
+
+
+class SQLiteBackend:
+    """
+    SQLite-Datei mit dem Bridge-Teil des CapCorn-Schemas - zum Testen und
+    Benchmarken ohne Windows/Access. Die Verbindungen uebersetzen die
+    Access-Syntax der Bridge (siehe translate_sql) und liefern Datumsspalten
+    als datetime wie pyodbc.
+    """
+
+    name = 'sqlite'
+    health_query = "SELECT TOP 1 zimm FROM ZIM"
+
+    def __init__(self, path, create=True):
+        self.path = path
+        self.create = create
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def connect(self):
+        raw = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                              detect_types=sqlite3.PARSE_DECLTYPES | sqlite3.PARSE_COLNAMES)
+        for name, func in _SQLITE_FUNCTIONS.items():
+            raw.create_function(name, 1, func, deterministic=True)
+        if self.create and not self._ready:
+            with self._lock:
+                if not self._ready:
+                    create_schema(raw)
+                    self._ready = True
+        return SQLiteConnection(raw)
+
+
+def create_schema(raw):
+    """CapCorn-Tabellen und Indizes in einer (rohen) SQLite-Verbindung anlegen"""
+    raw.execute("PRAGMA journal_mode=WAL")
+    for table, columns in CAPCORN_SCHEMA.items():
+        raw.execute(f"CREATE TABLE IF NOT EXISTS {table} ({', '.join(columns)})")
+    for table, column in CAPCORN_INDEXES:
+        raw.execute(f"CREATE INDEX IF NOT EXISTS ix_{table}_{column} ON {table} ({column})")
+    raw.commit()
+
+
+def database_backend(kind, path):
+    """Backend fuer config "db_backend" ('access' = Standard oder 'sqlite')"""
+    key = (kind or 'access', path)
+    with _BACKENDS_LOCK:
+        backend = _BACKENDS.get(key)
+        if backend is None:
+            if key[0] == 'access':
+                backend = AccessBackend(path)
+            elif key[0] == 'sqlite':
+                backend = SQLiteBackend(path)
+            else:
+                raise ValueError(f"Unbekanntes db_backend: {kind}")
+            _BACKENDS[key] = backend
+    return backend
+
+
+_BACKENDS = {}
+_BACKENDS_LOCK = threading.Lock()
+
+
+# ------------------------------------------------------------------
+# SQLite: Access-Dialekt und Datumswerte
+# ------------------------------------------------------------------
+
+_TOP = re.compile(r'^(\s*SELECT\s+(?:DISTINCT\s+)?)TOP\s+(\d+)\s+', re.IGNORECASE)
+_FROM_PARENS = re.compile(r'\bFROM\s*(\(+)(?!\s*SELECT\b)', re.IGNORECASE)
+_DATETIME_COLUMNS = sorted({column.split()[0] for columns in CAPCORN_SCHEMA.values()
+                            for column in columns if ' DATETIME' in column})
+_DATE_AGGREGATE = re.compile(
+    r'\b((?:MIN|MAX)\(\s*(?:\w+\.)?(?:%s)\s*\))\s+AS\s+(\w+)' % '|'.join(_DATETIME_COLUMNS),
+    re.IGNORECASE)
+_ISO_TEXT = re.compile(r'^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?$')
+_ACCESS_EPOCH = datetime(1899, 12, 30)
+
+
+@lru_cache(maxsize=512)
+def translate_sql(query):
+    """
+    Access-SQL der Bridge fuer SQLite umschreiben:
+    - SELECT TOP n ...         -> SELECT ... LIMIT n
+    - FROM (A JOIN B ON ..) .. -> Klammern um Join-Gruppen entfernen
+    - MIN/MAX(Datumsspalte) AS x -> Spaltentyp anhaengen, damit auch das
+      Aggregat als datetime zurueckkommt
+    YEAR/MONTH/DAY, LEN und CDbl sind als SQLite-Funktionen registriert.
+    """
+    sql = query.strip().rstrip(';')
+    m = _TOP.match(sql)
+    if m:
+        sql = f"{m.group(1)}{sql[m.end():]} LIMIT {m.group(2)}"
+    sql = _DATE_AGGREGATE.sub(r'\1 AS "\2 [DATETIME]"', sql)
+    return _flatten_joins(sql)
+
+
+def _flatten_joins(sql):
+    m = _FROM_PARENS.search(sql)
+    if not m:
+        return sql
+    opened = len(m.group(1))
+    depth = 0
+    rest = []
+    for ch in sql[m.end(1):]:
+        if opened and ch == '(':
+            depth += 1
+        elif opened and ch == ')':
+            if depth == 0:
+                opened -= 1
+                continue
+            depth -= 1
+        rest.append(ch)
+    return sql[:m.start(1)] + ''.join(rest)
+
+
+def _sqlite_datetime_text(value):
+    """datetime/date als Text speichern; Mitternacht nur als Tag (vergleichbar mit 'YYYY-MM-DD')"""
+    if isinstance(value, datetime):
+        if value.hour or value.minute or value.second:
+            return value.strftime('%Y-%m-%d %H:%M:%S')
+        return value.strftime('%Y-%m-%d')
+    return value.isoformat()
+
+
+def _sqlite_param(value):
+    if isinstance(value, (datetime, date)):
+        return _sqlite_datetime_text(value)
+    if isinstance(value, Decimal):
+        return float(value)
+    if isinstance(value, str) and _ISO_TEXT.match(value):
+        return _sqlite_datetime_text(_parse_sqlite_datetime(value))
+    return value
+
+
+def _parse_sqlite_datetime(value):
+    if isinstance(value, bytes):
+        value = value.decode()
+    value = value.replace('T', ' ')
+    if len(value) == 10:
+        return datetime.strptime(value, '%Y-%m-%d')
+    return datetime.fromisoformat(value)
+
+
+def _sqlite_date_part(attr):
+    def part(value):
+        if value is None:
+            return None
+        try:
+            return getattr(_parse_sqlite_datetime(str(value)), attr)
+        except ValueError:
+            return None
+    return part
+
+
+def _sqlite_cdbl(value):
+    """CDbl wie Access: Datum -> Tage seit 30.12.1899, sonst Zahl"""
+    if value is None or isinstance(value, (int, float)):
+        return value
+    try:
+        return float(value)
+    except ValueError:
+        delta = _parse_sqlite_datetime(value) - _ACCESS_EPOCH
+        return delta.days + delta.seconds / 86400
+
+
+_SQLITE_FUNCTIONS = {
+    'YEAR': _sqlite_date_part('year'),
+    'MONTH': _sqlite_date_part('month'),
+    'DAY': _sqlite_date_part('day'),
+    'LEN': lambda value: None if value is None else len(str(value)),
+    'CDbl': _sqlite_cdbl,
+}
+
+sqlite3.register_converter('DATETIME', _parse_sqlite_datetime)
+
+
+class SQLiteCursor:
+    """Cursor mit pyodbc-Verhalten: Access-SQL, Datumsparameter, fast_executemany"""
+
+    fast_executemany = False
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def execute(self, query, params=None):
+        if params:
+            self._raw.execute(translate_sql(query), [_sqlite_param(p) for p in params])
+        else:
+            self._raw.execute(translate_sql(query))
+        return self
+
+    def executemany(self, query, seq_of_params):
+        self._raw.executemany(translate_sql(query),
+                              ([_sqlite_param(p) for p in params] for params in seq_of_params))
+        return self
+
+    @property
+    def description(self):
+        return self._raw.description
+
+    @property
+    def rowcount(self):
+        return self._raw.rowcount
+
+    def fetchone(self):
+        return self._raw.fetchone()
+
+    def fetchmany(self, size=None):
+        return self._raw.fetchmany(size) if size else self._raw.fetchmany()
+
+    def fetchall(self):
+        return self._raw.fetchall()
+
+    def close(self):
+        self._raw.close()
+
+    def __iter__(self):
+        return iter(self._raw)
+
+
+class SQLiteConnection:
+    """Verbindung mit der Schnittstelle, die Pool und Routen von pyodbc nutzen"""
+
+    def __init__(self, raw):
+        self._raw = raw
+
+    def cursor(self):
+        return SQLiteCursor(self._raw.cursor())
+
+    def execute(self, query, params=None):
+        return self.cursor().execute(query, params)
+
+    def commit(self):
+        self._raw.commit()
+
+    def rollback(self):
+        self._raw.rollback()
+
+    def close(self):
+        self._raw.close()
+
+
+# ============================================================================
+# ABFRAGE-STATISTIK (Laufzeit pro SQL-Fingerprint, Slow-Log)
+# ============================================================================
+
+_FP_STRING = re.compile(r"'(?:[^']|'')*'")
+_FP_DATE = re.compile(r"#[^#\n]*#")  # Access-Datumsliterale #2025-01-31#
+_FP_NUMBER = re.compile(r"\b\d+(?:\.\d+)?\b")
+_FP_SPACE = re.compile(r"\s+")
+_FP_LIST = re.compile(r"\(\s*\?(?:\s*,\s*\?)+\s*\)")
+
+# Sortierung fuer QueryStats.stats() / GET /debug/queries
+QUERY_SORT_KEYS = {
+    "total": "total_ms",
+    "mean": "mean_ms",
+    "p95": "exec_p95_ms",
+    "calls": "calls",
+    "rows": "rows",
+    "fetch": "fetch_ms",
+}
+
+
+@lru_cache(maxsize=2048)
+def sql_fingerprint(query):
+    """SQL ohne Literale und Whitespace-Varianten: gleiche Abfrage = gleicher Schluessel
+
+    Strings, Access-Datumsliterale und Zahlen werden zu ?, IN-Listen beliebiger
+    Laenge zu (?...), damit z.B. f-String-Abfragen mit wechselnden IDs nicht
+    je einen eigenen Eintrag bekommen.
+    """
+    sql = _FP_STRING.sub('?', query)
+    sql = _FP_DATE.sub('?', sql)
+    sql = _FP_NUMBER.sub('?', sql)
+    sql = _FP_SPACE.sub(' ', sql).strip()
+    return _FP_LIST.sub('(?...)', sql)
+
+
+class _Statement:
+    """Ein ausgefuehrtes Statement eines Cursors (fuer Fetch-Zeit und Slow-Log)"""
+
+    __slots__ = ('entry', 'sql', 'route', 'exec_s', 'fetch_s', 'rows', 'slow')
+
+    def __init__(self, entry, sql, route, exec_s):
+        self.entry = entry
+        self.sql = sql
+        self.route = route
+        self.exec_s = exec_s
+        self.fetch_s = 0.0
+        self.rows = 0
+        self.slow = None
+
+
+class QueryStats:
+    """
+    Laufzeit-Statistik pro SQL-Fingerprint.
+
+    wrap(conn) liefert die Verbindung mit Cursorn, die execute/executemany
+    und fetch* mitstoppen: Aufrufe, Fehler, Ausfuehrungs- und Fetch-Zeit,
+    gelieferte Zeilen und die aufrufende Route (context(), sonst der
+    Thread-Name). p95 der Ausfuehrungszeit aus den letzten `samples` Aufrufen.
+
+    Braucht ein Statement (Ausfuehrung + Fetch) laenger als slow_ms, landet es
+    im Slow-Log (die letzten slow_log_size Eintraege) und on_slow(eintrag)
+    wird aufgerufen. Parameterwerte werden nicht gespeichert (Gastdaten).
+
+    Kosten pro Statement: ein paar perf_counter-Aufrufe und ein kurzer Lock,
+    gegenueber Millisekunden pro Access-Abfrage vernachlaessigbar.
+    """
+
+    OVERFLOW = "(weitere Statements)"
+
+    def __init__(self, slow_ms=250, slow_log_size=200, samples=256, max_fingerprints=500,
+                 context=None, on_slow=None):
+        self.slow_ms = slow_ms
+        self._slow_s = slow_ms / 1000 if slow_ms else None
+        self.samples = samples
+        self.max_fingerprints = max_fingerprints
+        self.context = context
+        self.on_slow = on_slow
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._slow = deque(maxlen=slow_log_size)
+        self._since = datetime.now()
+
+    def wrap(self, conn):
+        """Verbindung instrumentieren (Cursor messen mit)"""
+        return _TimedConnection(self, conn)
+
+    def reset(self):
+        with self._lock:
+            self._entries.clear()
+            self._slow.clear()
+            self._since = datetime.now()
+
+    # ------------------------------------------------------------------
+    # Erfassung (aus _TimedCursor)
+    # ------------------------------------------------------------------
+
+    def _route(self):
+        try:
+            route = self.context() if self.context else None
+        except Exception:
+            route = None
+        return route or threading.current_thread().name
+
+    def _entry_locked(self, fingerprint):
+        entry = self._entries.get(fingerprint)
+        if entry is None:
+            if len(self._entries) >= self.max_fingerprints:
+                fingerprint = self.OVERFLOW
+                entry = self._entries.get(fingerprint)
+            if entry is None:
+                entry = self._entries[fingerprint] = {
+                    "calls": 0, "errors": 0, "exec_s": 0.0, "fetch_s": 0.0, "rows": 0,
+                    "times": deque(maxlen=self.samples), "routes": {}
+                }
+        return entry
+
+    def _executed(self, query, seconds, failed=False):
+        sql = sql_fingerprint(query)
+        route = self._route()
+        with self._lock:
+            entry = self._entry_locked(sql)
+            entry['calls'] += 1
+            entry['exec_s'] += seconds
+            entry['times'].append(seconds)
+            entry['routes'][route] = entry['routes'].get(route, 0) + 1
+            if failed:
+                entry['errors'] += 1
+        statement = _Statement(entry, sql, route, seconds)
+        self._check_slow(statement)
+        return statement
+
+    def _fetched(self, statement, seconds, rows):
+        with self._lock:
+            statement.entry['fetch_s'] += seconds
+            statement.entry['rows'] += rows
+        statement.fetch_s += seconds
+        statement.rows += rows
+        self._check_slow(statement)
+
+    def _check_slow(self, statement):
+        if self._slow_s is None:
+            return
+        total = statement.exec_s + statement.fetch_s
+        if statement.slow is not None:
+            # Bereits protokolliert: weitere Fetches nachtragen
+            statement.slow.update(fetch_ms=round(statement.fetch_s * 1000, 1),
+                                  total_ms=round(total * 1000, 1), rows=statement.rows)
+            return
+        if total < self._slow_s:
+            return
+        statement.slow = {
+            "at": datetime.now().isoformat(timespec='seconds'),
+            "route": statement.route,
+            "sql": statement.sql,
+            "exec_ms": round(statement.exec_s * 1000, 1),
+            "fetch_ms": round(statement.fetch_s * 1000, 1),
+            "total_ms": round(total * 1000, 1),
+            "rows": statement.rows,
+        }
+        with self._lock:
+            self._slow.append(statement.slow)
+        if self.on_slow:
+            try:
+                self.on_slow(statement.slow)
+            except Exception:
+                pass
+
+    # ------------------------------------------------------------------
+    # Auswertung
+    # ------------------------------------------------------------------
+
+    def stats(self, sort='total', limit=50):
+        """Statements nach QUERY_SORT_KEYS[sort] absteigend plus Slow-Log (neueste zuerst)"""
+        with self._lock:
+            entries = [(sql, dict(entry, times=sorted(entry['times']), routes=dict(entry['routes'])))
+                       for sql, entry in self._entries.items()]
+            slow = [dict(item) for item in reversed(self._slow)]
+            since = self._since
+
+        statements = []
+        for sql, entry in entries:
+            calls = entry['calls']
+            total = entry['exec_s'] + entry['fetch_s']
+            times = entry['times']
+            statements.append({
+                "sql": sql,
+                "calls": calls,
+                "errors": entry['errors'],
+                "total_ms": round(total * 1000, 1),
+                "mean_ms": round(total / calls * 1000, 2) if calls else 0,
+                "exec_ms": round(entry['exec_s'] * 1000, 1),
+                "exec_p95_ms": round(times[int(0.95 * (len(times) - 1))] * 1000, 2) if times else 0,
+                "fetch_ms": round(entry['fetch_s'] * 1000, 1),
+                "rows": entry['rows'],
+                "rows_per_call": round(entry['rows'] / calls, 1) if calls else 0,
+                "routes": dict(sorted(entry['routes'].items(), key=lambda item: -item[1])),
+            })
+        statements.sort(key=lambda s: s[QUERY_SORT_KEYS[sort]], reverse=True)
+
+        return {
+            "since": since.isoformat(timespec='seconds'),
+            "fingerprints": len(statements),
+            "calls": sum(s['calls'] for s in statements),
+            "total_ms": round(sum(s['total_ms'] for s in statements), 1),
+            "slow_query_ms": self.slow_ms,
+            "statements": statements[:limit],
+            "slow": slow[:limit],
+        }
+
+
+class _TimedCursor:
+    """Cursor-Huelle: misst execute/executemany und fetch*, alles andere geht durch"""
+
+    __slots__ = ('_stats', '_raw', '_statement')
+
+    def __init__(self, stats, raw):
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_raw', raw)
+        object.__setattr__(self, '_statement', None)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        # z.B. cursor.fast_executemany = True
+        setattr(self._raw, name, value)
+
+    def _run(self, method, query, args):
+        start = time.perf_counter()
+        failed = True
+        try:
+            getattr(self._raw, method)(query, *args)
+            failed = False
+        finally:
+            seconds = time.perf_counter() - start
+            object.__setattr__(self, '_statement', self._stats._executed(query, seconds, failed))
+            profile_add('db_execute', seconds)
+        return self
+
+    def execute(self, query, *args):
+        return self._run('execute', query, args)
+
+    def executemany(self, query, *args):
+        return self._run('executemany', query, args)
+
+    def _fetch(self, method, *args):
+        start = time.perf_counter()
+        rows = getattr(self._raw, method)(*args)
+        seconds = time.perf_counter() - start
+        if self._statement is not None:
+            count = (1 if rows is not None else 0) if method == 'fetchone' else len(rows)
+            self._stats._fetched(self._statement, seconds, count)
+        profile_add('db_fetch', seconds)
+        return rows
+
+    def fetchone(self):
+        return self._fetch('fetchone')
+
+    def fetchmany(self, *args):
+        return self._fetch('fetchmany', *args)
+
+    def fetchall(self):
+        return self._fetch('fetchall')
+
+    def __iter__(self):
+        while True:
+            rows = self.fetchmany(STREAM_BATCH_ROWS)
+            if not rows:
+                return
+            yield from rows
+
+
+class _TimedConnection:
+    """Verbindungs-Huelle: cursor() liefert _TimedCursor, sonst unveraendert"""
+
+    __slots__ = ('_stats', '_raw')
+
+    def __init__(self, stats, raw):
+        object.__setattr__(self, '_stats', stats)
+        object.__setattr__(self, '_raw', raw)
+
+    def __getattr__(self, name):
+        return getattr(self._raw, name)
+
+    def __setattr__(self, name, value):
+        setattr(self._raw, name, value)
+
+    def cursor(self):
+        return _TimedCursor(self._stats, self._raw.cursor())
+
+    def execute(self, query, *args):
+        return self.cursor().execute(query, *args)
+
+
+# ============================================================================
+# METRIKEN (Prometheus-Textformat, ohne prometheus_client)
+# ============================================================================
+
+# Sekunden: von schnellen Stammdaten-GETs bis zu langsamen Statistiken
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+METRICS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+def _metric_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, int):
+        return str(value)
+    return repr(float(value))
+
+
+def _metric_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+class _MetricFamily:
+    """Eine Metrik mit festen Label-Namen; Werte pro Label-Kombination"""
+
+    def __init__(self, registry, kind, name, help_text, labels, buckets=None):
+        self.registry = registry
+        self.kind = kind
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets) if buckets else None
+        self._values = {}
+        if not self.labels and kind != 'histogram':
+            self._values[()] = 0
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self.registry._lock:
+            self._values[key] = value
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self.registry._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._values.items()):
+            if self.kind != 'histogram':
+                lines.append(f"{self.name}{_metric_labels(self.labels, key)} {_metric_value(value)}")
+                continue
+            counts, total, count = value
+            cumulative = 0
+            for bound, bucket in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket
+                le = (('le', _metric_value(bound)),)
+                lines.append(f"{self.name}_bucket{_metric_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_metric_labels(self.labels, key)} {_metric_value(total)}")
+            lines.append(f"{self.name}_count{_metric_labels(self.labels, key)} {count}")
+        return lines
+
+
+class Metrics:
+    """
+    Kleine Metrik-Registry im Prometheus-Textformat (Version 0.0.4).
+
+    counter()/gauge()/histogram() legen Metriken mit festen Label-Namen an;
+    Werte kommen ueber inc()/set()/observe() mit Labels als Keyword-Argumenten.
+    collect(func) registriert eine Funktion, die beim Abruf zusaetzliche
+    Familien liefert: [(name, typ, hilfe, [(labels_dict, wert), ...]), ...]
+    - z.B. Pool-Zustaende, die ohnehin als stats() vorliegen.
+    """
+
+    def __init__(self, prefix=''):
+        self.prefix = prefix
+        self._lock = threading.Lock()
+        self._families = []
+        self._collectors = []
+
+    def _add(self, kind, name, help_text, labels, buckets=None):
+        family = _MetricFamily(self, kind, self.prefix + name, help_text, labels, buckets)
+        self._families.append(family)
+        return family
+
+    def counter(self, name, help_text, labels=()):
+        return self._add('counter', name, help_text, labels)
+
+    def gauge(self, name, help_text, labels=()):
+        return self._add('gauge', name, help_text, labels)
+
+    def histogram(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        return self._add('histogram', name, help_text, labels, sorted(buckets))
+
+    def collect(self, func):
+        self._collectors.append(func)
+        return func
+
+    def render(self):
+        """Alle Metriken als Text fuer GET /metrics"""
+        with self._lock:
+            lines = [line for family in self._families for line in family.render()]
+        for collector in self._collectors:
+            try:
+                families = collector()
+            except Exception:
+                continue
+            for name, kind, help_text, samples in families:
+                name = self.prefix + name
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {kind}")
+                for labels, value in samples:
+                    lines.append(f"{name}{_metric_labels(labels, labels.values())} {_metric_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+
+# ============================================================================
+# PROFILING (einzelne Requests auf Anfrage)
+# ============================================================================
+
+PROFILE_MODES = {"1": "tree", "tree": "tree", "collapsed": "collapsed", "sample": "collapsed"}
+PROFILE_PHASES = ("db_execute", "db_fetch", "serialize", "encode")
+
+_profile_local = threading.local()
+
+
+def profile_add(phase, seconds):
+    """Zeit einer Phase dem laufenden Profil dieses Threads gutschreiben (sonst nichts)"""
+    profile = getattr(_profile_local, 'profile', None)
+    if profile is not None:
+        profile.phases[phase] += seconds
+        if phase == 'db_execute':
+            profile.statements += 1
+
+
+@contextmanager
+def profile_phase(phase):
+    """Block als Phase messen - ohne laufendes Profil nur ein Attribut-Lookup"""
+    profile = getattr(_profile_local, 'profile', None)
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.phases[phase] += time.perf_counter() - start
+
+
+def _frame_label(filename, line, name):
+    if filename == '~':
+        return name  # Builtin, z.B. <method 'execute' of 'pyodbc.Cursor' objects>
+    return f"{os.path.basename(filename)}:{line}({name})"
+
+
+class _StackSampler(threading.Thread):
+    """Stack eines Threads alle interval Sekunden abgreifen (Collapsed-Stacks)"""
+
+    def __init__(self, target, interval):
+        super().__init__(name="profile-sampler", daemon=True)
+        self.target = target
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.target)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                frame = frame.f_back
+            if stack:
+                key = ';'.join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+                self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+
+class RequestProfile:
+    """
+    Profil eines einzelnen Requests.
+
+    mode "tree":      cProfile (deterministisch), Ausgabe als Aufrufbaum mit
+                      kumulierter Zeit; Zweige unter min_share der Gesamtzeit
+                      fallen weg. Der Profiler-Overhead steckt in allen Zeiten.
+    mode "collapsed": Stichproben alle interval Sekunden, Ausgabe im
+                      Collapsed-Stack-Format (flamegraph.pl, speedscope).
+
+    Unabhaengig vom Modus werden die Phasen db_execute/db_fetch (Cursor-Huelle
+    der QueryStats), serialize (Zeilen -> Dicts) und encode (JSON, Kompression)
+    ueber profile_phase()/profile_add() gemessen; der Rest ist Routen-Logik.
+    Es laeuft immer nur ein Profil gleichzeitig (cProfile ist ab Python 3.12
+    prozessweit), start() liefert sonst None.
+    """
+
+    _busy = threading.Lock()
+
+    def __init__(self, mode, interval=0.001, min_share=0.005, max_depth=40):
+        self.mode = PROFILE_MODES[mode]
+        self.interval = interval
+        self.min_share = min_share
+        self.max_depth = max_depth
+        self.phases = dict.fromkeys(PROFILE_PHASES, 0.0)
+        self.statements = 0
+        self.seconds = None
+        self._profiler = None
+        self._sampler = None
+        self._started = None
+
+    @classmethod
+    def start(cls, mode, **options):
+        if not cls._busy.acquire(blocking=False):
+            return None
+        try:
+            profile = cls(mode, **options)
+            if profile.mode == 'tree':
+                import cProfile
+                profile._profiler = cProfile.Profile()
+            else:
+                profile._sampler = _StackSampler(threading.get_ident(), profile.interval)
+                profile._sampler.start()
+        except Exception:
+            cls._busy.release()
+            raise
+        _profile_local.profile = profile
+        profile._started = time.perf_counter()
+        if profile._profiler is not None:
+            profile._profiler.enable()
+        return profile
+
+    def stop(self):
+        """Messung beenden (mehrfacher Aufruf unschaedlich)"""
+        if self.seconds is not None:
+            return
+        if self._profiler is not None:
+            self._profiler.disable()
+        self.seconds = time.perf_counter() - self._started
+        if self._sampler is not None:
+            self._sampler.stop()
+        _profile_local.profile = None
+        RequestProfile._busy.release()
+
+    def summary(self):
+        ms = {phase: round(seconds * 1000, 2) for phase, seconds in self.phases.items()}
+        total = round(self.seconds * 1000, 2)
+        return {
+            "mode": self.mode,
+            "total_ms": total,
+            "phases_ms": dict(ms, rest=round(max(0.0, total - sum(ms.values())), 2)),
+            "statements": self.statements,
+        }
+
+    def output(self):
+        """Aufrufbaum (tree) bzw. Collapsed-Stacks (collapsed) als Text"""
+        if self._sampler is not None:
+            stacks = self._trim_stacks(self._sampler.stacks)
+            return '\n'.join(f"{stack} {count}" for stack, count in
+                             sorted(stacks.items(), key=lambda item: -item[1])) + '\n'
+        return self._call_tree()
+
+    @staticmethod
+    def _trim_stacks(stacks):
+        # Server-/Thread-Rahmen oberhalb von Flask abschneiden
+        trimmed = {}
+        for stack, count in stacks.items():
+            frames = stack.split(';')
+            for i, frame in enumerate(frames):
+                if frame.endswith(':full_dispatch_request'):
+                    frames = frames[i:]
+                    break
+            key = ';'.join(frames)
+            trimmed[key] = trimmed.get(key, 0) + count
+        return trimmed
+
+    def _call_tree(self):
+        import pstats
+
+        stats = pstats.Stats(self._profiler).stats
+        children = {}
+        for callee, (_, _, _, _, callers) in stats.items():
+            for caller, edge in callers.items():
+                children.setdefault(caller, []).append((callee, edge[1], edge[3]))
+        roots = [(func, data[1], data[3]) for func, data in stats.items()
+                 if not any(caller in stats for caller in data[4])]
+        limit = self.seconds * self.min_share
+        lines = [f"{'ms':>10} {'Aufrufe':>8}  Funktion"]
+
+        def walk(func, calls, seconds, depth, path):
+            if seconds < limit or depth > self.max_depth:
+                return
+            lines.append(f"{seconds * 1000:10.2f} {calls:>8}  {'  ' * depth}{_frame_label(*func)}")
+            if func in path:
+                return  # Rekursion
+            for child, child_calls, child_seconds in sorted(children.get(func, ()), key=lambda c: -c[2]):
+                walk(child, child_calls, child_seconds, depth + 1, path | {func})
+
+        for func, calls, seconds in sorted(roots, key=lambda r: -r[2]):
+            walk(func, calls, seconds, 0, frozenset())
+        return '\n'.join(lines) + '\n'
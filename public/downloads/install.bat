@@ -40,6 +40,7 @@ echo.
 echo Kopiere Dateien...
 copy /Y "%~dp0capcorn_bridge.py" "%INSTALL_DIR%\" >nul
 copy /Y "%~dp0capcorn_bridge_gui.py" "%INSTALL_DIR%\" >nul
+copy /Y "%~dp0capcorn_core.py" "%INSTALL_DIR%\" >nul
 echo [OK] Dateien kopiert
 
 :: Install Python dependencies
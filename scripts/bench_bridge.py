@@ -0,0 +1,569 @@
+# -*- coding: utf-8 -*-
+"""
+Endpunkt-Benchmark der Bridge gegen einen synthetischen Datenbestand
+====================================================================
+Ruft jede Route von capcorn_bridge.py ueber den Flask-Test-Client auf
+(Lesen, Schreiben, Backup-Agent) und misst zusaetzlich create_backup() und
+sync_to_firebase() der GUI-Bridge. Gearbeitet wird auf einer Kopie der
+Datenbank in einem Temp-Ordner, das Original bleibt unveraendert.
+
+Pro Fall: p50/p95/p99-Latenz, Zeilen pro Sekunde (Listen bzw. NDJSON in der
+Antwort) und Peak-RSS des Prozesses. Das Ergebnis landet mit Zeitstempel als
+JSON in --output-dir und laesst sich mit --compare gegen einen frueheren Lauf
+vergleichen.
+
+Aufruf:
+    python scripts/generate_dataset.py bench.sqlite
+    python scripts/bench_bridge.py bench.sqlite [--repeat 20] [--cold]
+    python scripts/bench_bridge.py bench.sqlite --compare bench-results/<frueher>.json
+
+sync_to_firebase braucht die GUI-Bridge (tkinter, winreg, firebase_admin,
+also Windows); geschrieben wird dabei in ein Firestore-Double im Speicher,
+nie in das echte Projekt. Laesst sich die GUI nicht importieren, steht der
+Fall mit Grund als "skipped" im Ergebnis.
+"""
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+import uuid
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'public', 'downloads'))
+
+
+# ============================================================================
+# MESSWERTE
+# ============================================================================
+
+def percentile(sorted_values, p):
+    """Nearest-Rank-Perzentil einer sortierten Liste"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+def peak_rss_mb():
+    """Hoechster Speicherverbrauch des Prozesses bisher (MB), None wenn unbekannt"""
+    try:
+        import resource
+    except ImportError:  # Windows
+        try:
+            import psutil
+        except ImportError:
+            return None
+        info = psutil.Process().memory_info()
+        return round(getattr(info, 'peak_wset', info.rss) / 2**20, 1)
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (2**20 if sys.platform == 'darwin' else 2**10), 1)
+
+def count_rows(response, body):
+    """Datensaetze in einer Antwort: NDJSON-Zeilen, Liste oder laengste Liste im Objekt"""
+    if response.mimetype == 'application/x-ndjson':
+        return body.count(b'\n')
+    try:
+        data = json.loads(body)
+    except ValueError:
+        return 0
+    if isinstance(data, list):
+        return len(data)
+    if isinstance(data, dict):
+        return max((len(v) for v in data.values() if isinstance(v, list)), default=0)
+    return 0
+
+def summarize(samples, rows, statuses):
+    ms = sorted(s * 1000 for s in samples)
+    total = sum(samples)
+    return {
+        "samples": len(samples),
+        "status": statuses,
+        "first_ms": round(samples[0] * 1000, 2),
+        "p50_ms": round(percentile(ms, 50), 2),
+        "p95_ms": round(percentile(ms, 95), 2),
+        "p99_ms": round(percentile(ms, 99), 2),
+        "max_ms": round(ms[-1], 2),
+        "rows": rows,
+        "rows_per_s": round(rows / total) if total and rows else 0,
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+# ============================================================================
+# TESTDATEN
+# ============================================================================
+
+class Context:
+    """IDs aus dem Datenbestand plus alles, was Schreib-Faelle anlegen"""
+
+    def __init__(self, db_path, seed, backup_folder):
+        self.rng = random.Random(seed)
+        self.backup_folder = backup_folder
+        conn = sqlite3.connect(db_path)
+
+        def column(sql):
+            return [row[0] for row in conn.execute(sql)]
+
+        self.rooms = column("SELECT zimm FROM ZIM ORDER BY zimm")
+        self.bookings = column("SELECT DISTINCT resn FROM BUZ")
+        self.stays = [(resn, datetime.strptime(andf[:10], '%Y-%m-%d'), nights) for resn, andf, nights in conn.execute(
+            "SELECT resn, andf, julianday(ande) - julianday(andf) FROM BUC WHERE ande > andf AND stat > 0")]
+        self.guests = column("SELECT gast FROM GKT")
+        self.names = column("SELECT DISTINCT nacn FROM GKT WHERE nacn <> ''")
+        self.invoices = column("SELECT rnum FROM REC")
+        self.years = column("SELECT DISTINCT substr(edat, 1, 4) FROM REC ORDER BY 1")
+        first, last = conn.execute("SELECT MIN(vndt), MAX(bsdt) FROM BUZ").fetchone()
+        conn.close()
+
+        self.first = datetime.strptime(first[:10], '%Y-%m-%d')
+        self.last = datetime.strptime(last[:10], '%Y-%m-%d')
+        # Neue Buchungen hinter dem Bestand, damit keine 409 die Messung verfaelscht
+        self.free_from = self.last + timedelta(days=30)
+        self.slots = itertools.count()
+        self.created = {}
+
+    def pick(self, values):
+        return self.rng.choice(values)
+
+    def day(self, span=0):
+        """Zufaelliges Datum im Bestand (mit Platz fuer span Tage)"""
+        days = max(1, (self.last - self.first).days - span)
+        return self.first + timedelta(days=self.rng.randrange(days))
+
+    def stay_days(self, count=1):
+        """Buchung mit count aufeinanderfolgenden Tagen innerhalb des Aufenthalts"""
+        resn, andf, nights = self.pick(self.stays)
+        first = self.rng.randrange(max(1, int(nights) - count + 1))
+        return resn, [(andf + timedelta(days=first + i)).strftime('%Y-%m-%d')
+                      for i in range(min(count, int(nights)))]
+
+    def window(self, days):
+        start = self.day(days)
+        return start.strftime('%Y-%m-%d'), (start + timedelta(days=days)).strftime('%Y-%m-%d')
+
+    def slot(self, nights=3):
+        """Freies Zimmer/Zeitraum hinter dem Bestand, jedes Mal ein anderes"""
+        k = next(self.slots)
+        von = self.free_from + timedelta(days=(k // len(self.rooms)) * (nights + 1))
+        return {
+            "zimm": self.rooms[k % len(self.rooms)],
+            "von": von.strftime('%Y-%m-%d'),
+            "bis": (von + timedelta(days=nights)).strftime('%Y-%m-%d'),
+        }
+
+    def keep(self, name, value):
+        self.created.setdefault(name, []).append(value)
+
+    def take(self, name, fallback=None):
+        values = self.created.get(name)
+        if values:
+            return values.pop()
+        return fallback() if fallback else None
+
+    def backup_copy(self):
+        """Wegwerf-Kopie des letzten Backups fuer /backup/delete und /backup/restore"""
+        backups = sorted(f for f in os.listdir(self.backup_folder) if '_backup_' in f)
+        name = f"bench_backup_{uuid.uuid4().hex[:8]}{os.path.splitext(backups[-1])[1]}"
+        shutil.copy2(os.path.join(self.backup_folder, backups[-1]),
+                     os.path.join(self.backup_folder, name))
+        return name
+
+
+# ============================================================================
+# FAELLE
+# ============================================================================
+
+class Case:
+    """Ein HTTP-Aufruf: url/body sind Werte oder Funktionen(ctx), keep merkt sich IDs"""
+
+    def __init__(self, method, rule, url=None, body=None, keep=None, variant=None):
+        self.method = method
+        self.rule = rule
+        self.url = url or rule
+        self.body = body
+        self.keep = keep
+        self.name = f"{method} {rule}" + (f" ({variant})" if variant else "")
+
+    def request(self, ctx):
+        url = self.url(ctx) if callable(self.url) else self.url
+        body = self.body(ctx) if callable(self.body) else self.body
+        return url, body
+
+    def after(self, ctx, response):
+        if self.keep and response.status_code < 300:
+            name, field = self.keep
+            ctx.keep(name, response.get_json()[field])
+
+
+def read_cases():
+    def booking(ctx):
+        return ctx.pick(ctx.bookings)
+
+    def year(ctx):
+        return ctx.pick(ctx.years)
+
+    return [
+        Case('GET', '/'),
+        Case('GET', '/health'),
+        Case('GET', '/cache/stats'),
+        Case('GET', '/fingerprints'),
+        Case('GET', '/metrics'),
+        Case('GET', '/debug/queries'),
+        Case('GET', '/rooms'),
+        Case('GET', '/rooms/<int:zimm>', lambda c: f"/rooms/{c.pick(c.rooms)}"),
+        Case('GET', '/categories'),
+        Case('GET', '/availability', lambda c: "/availability?from=%s&to=%s" % c.window(7)),
+        Case('GET', '/availability/matrix', lambda c: "/availability/matrix?from=%s&to=%s" % c.window(30)),
+        Case('GET', '/bookings', "/bookings?limit=500"),
+        Case('GET', '/bookings', "/bookings?stream=1&limit=5000", variant="stream"),
+        Case('GET', '/bookings/<int:resn>', lambda c: f"/bookings/{booking(c)}"),
+        Case('GET', '/guests', lambda c: f"/guests?q={c.pick(c.names)[:4]}&limit=50"),
+        Case('GET', '/guests', "/guests?stream=1&limit=5000", variant="stream"),
+        Case('GET', '/guests/<int:gast>', lambda c: f"/guests/{c.pick(c.guests)}"),
+        Case('GET', '/articles'),
+        Case('GET', '/channels'),
+        Case('GET', '/calendar', lambda c: "/calendar?start_date=%s&end_date=%s" % c.window(30)),
+        Case('GET', '/stats'),
+        Case('GET', '/account/<int:resn>', lambda c: f"/account/{booking(c)}"),
+        Case('GET', '/checkin-status/<int:resn>', lambda c: f"/checkin-status/{booking(c)}"),
+        Case('GET', '/registrations/<int:resn>', lambda c: f"/registrations/{booking(c)}"),
+        Case('GET', '/meal/<int:resn>', lambda c: f"/meal/{booking(c)}"),
+        Case('GET', '/invoices', "/invoices?limit=500"),
+        Case('GET', '/invoices/<int:rnum>', lambda c: f"/invoices/{c.pick(c.invoices)}"),
+        Case('GET', '/invoices/by-booking/<int:resn>', lambda c: f"/invoices/by-booking/{booking(c)}"),
+        Case('GET', '/invoices/open'),
+        Case('GET', '/invoices/stats', lambda c: f"/invoices/stats?year={year(c)}"),
+        Case('GET', '/invoices/by-payment-type', lambda c: f"/invoices/by-payment-type?year={year(c)}"),
+        Case('GET', '/payment-types'),
+        Case('GET', '/invoices/by-month', lambda c: f"/invoices/by-month?year={year(c)}"),
+        Case('GET', '/invoices/by-year'),
+        Case('GET', '/backup/status'),
+        Case('GET', '/backup/list'),
+        Case('GET', '/backup/settings'),
+    ]
+
+
+def write_cases():
+    def booking(ctx):
+        return ctx.pick(ctx.bookings)
+
+    def option(ctx):
+        return dict(ctx.slot(), nachname="Benchmark", vorname="Option")
+
+    def priced(ctx):
+        return dict(ctx.slot(), nachname="Benchmark", positionen=[
+            {"artikel": "Logis", "preis": 420.0, "artn": 1},
+            {"artikel": "Halbpension", "preis": 180.0, "artn": 53},
+        ])
+
+    def meal_day(ctx):
+        resn, days = ctx.stay_days()
+        return {"resn": resn, "date": days[0], "person": 1}
+
+    def meal_bulk(ctx):
+        resn, days = ctx.stay_days(5)
+        return {"resn": resn, "bookings": [{"date": day, "person": p} for day in days for p in (1, 2)]}
+
+    return [
+        Case('POST', '/reference/invalidate'),
+        Case('POST', '/guest', body=lambda c: {"nachname": "Benchmark", "vorname": "Gast", "ort": "Wien"},
+             keep=('guests', 'gast')),
+        Case('PUT', '/guest/<int:gast>', lambda c: f"/guest/{c.pick(c.guests)}",
+             body={"telefon": "+43 1 234567"}),
+        Case('POST', '/option', body=option, keep=('options', 'resn')),
+        Case('PUT', '/book/<int:resn>', lambda c: f"/book/{c.take('options', lambda: booking(c))}",
+             keep=('booked', 'resn')),
+        Case('DELETE', '/cancel/<int:resn>', lambda c: f"/cancel/{c.take('booked', lambda: booking(c))}"),
+        Case('POST', '/block', body=lambda c: dict(c.slot(), grund="Benchmark"), keep=('blocks', 'resn')),
+        Case('DELETE', '/block/<int:resn>', lambda c: f"/block/{c.take('blocks')}"),
+        Case('POST', '/booking-with-price', body=priced, keep=('priced', 'resn')),
+        Case('POST', '/service', body=lambda c: {"resn": booking(c), "artn": 19}),
+        Case('PUT', '/checkin/<int:resn>', lambda c: f"/checkin/{booking(c)}"),
+        Case('PUT', '/checkout/<int:resn>', lambda c: f"/checkout/{booking(c)}"),
+        Case('POST', '/register/<int:resn>', lambda c: f"/register/{booking(c)}",
+             body={"nachname": "Benchmark", "vorname": "Meldung", "geburtsdatum": "1980-05-01"},
+             keep=('registrations', 'annr')),
+        Case('PUT', '/deregister/<int:annr>', lambda c: f"/deregister/{c.take('registrations')}"),
+        Case('POST', '/meal-day', body=meal_day),
+        Case('POST', '/meal-bulk', body=meal_bulk),
+        Case('POST', '/backup/now', body={"force": True}),
+        Case('PUT', '/backup/settings', body={"backup_keep_days": 7}),
+        Case('POST', '/backup/cleanup'),
+        Case('DELETE', '/backup/delete/<filename>', lambda c: f"/backup/delete/{c.backup_copy()}"),
+    ]
+
+
+# Ueberschreibt die (Kopie der) Datenbank, deshalb ganz am Ende
+RESTORE_CASE = Case('POST', '/backup/restore/<filename>', lambda c: f"/backup/restore/{c.backup_copy()}",
+                    body={"confirm": True})
+
+
+def run_case(client, case, ctx, repeat, reset=None):
+    samples, rows, statuses = [], 0, {}
+    for _ in range(repeat):
+        url, body = case.request(ctx)
+        if reset:
+            reset()
+        t0 = time.perf_counter()
+        response = client.open(url, method=case.method, json=body)
+        data = response.get_data()
+        samples.append(time.perf_counter() - t0)
+        rows += count_rows(response, data)
+        statuses[str(response.status_code)] = statuses.get(str(response.status_code), 0) + 1
+        case.after(ctx, response)
+    return summarize(samples, rows, statuses)
+
+
+def run_function(func, repeat, rows_of=None):
+    samples, rows = [], 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = func()
+        samples.append(time.perf_counter() - t0)
+        rows += rows_of(result) if rows_of else 0
+    return summarize(samples, rows, {})
+
+
+# ============================================================================
+# FIREBASE-SYNC (GUI-BRIDGE)
+# ============================================================================
+
+class MemoryFirestore:
+    """Firestore-Double fuer sync_to_firebase: Dokumente im Speicher, Schreibzaehler"""
+
+    def __init__(self):
+        self.docs = {}
+        self.writes = 0
+
+    def collection(self, name):
+        return _Collection(self, name)
+
+    def batch(self):
+        return _Batch()
+
+    def get_all(self, refs):
+        return [ref.get() for ref in refs]
+
+
+class _Collection:
+    def __init__(self, store, name):
+        self.store, self.name, self.id = store, name, name
+
+    def document(self, doc_id=None):
+        return _Document(self.store, self.name, doc_id or uuid.uuid4().hex)
+
+    def stream(self):
+        return [_Document(self.store, self.name, doc_id).get()
+                for (name, doc_id) in list(self.store.docs) if name == self.name]
+
+
+class _Document:
+    def __init__(self, store, collection, doc_id):
+        self.store, self.key, self.id = store, (collection, doc_id), doc_id
+
+    @property
+    def parent(self):
+        return _Collection(self.store, self.key[0])
+
+    def set(self, data, merge=False):
+        self.store.writes += 1
+        base = self.store.docs.get(self.key, {}) if merge else {}
+        self.store.docs[self.key] = dict(base, **data)
+
+    def update(self, data):
+        self.set(data, merge=True)
+
+    def delete(self):
+        self.store.writes += 1
+        self.store.docs.pop(self.key, None)
+
+    def get(self, transaction=None):
+        return _Snapshot(self, self.store.docs.get(self.key))
+
+
+class _Snapshot:
+    def __init__(self, reference, data):
+        self.reference, self.id, self._data = reference, reference.id, data
+        self.exists = data is not None
+
+    def to_dict(self):
+        return dict(self._data) if self._data is not None else None
+
+
+class _Batch:
+    def __init__(self):
+        self.ops = []
+
+    def set(self, ref, data, merge=False):
+        self.ops.append(lambda: ref.set(data, merge=merge))
+
+    def update(self, ref, data):
+        self.ops.append(lambda: ref.update(data))
+
+    def delete(self, ref):
+        self.ops.append(ref.delete)
+
+    def commit(self):
+        for op in self.ops:
+            op()
+
+
+def load_gui(db_path, workdir):
+    """GUI-Bridge auf die Kopie umbiegen, Firestore durch das Double ersetzen"""
+    import capcorn_bridge_gui as gui
+
+    gui.CONFIG_PATH = os.path.join(workdir, 'config_gui.json')
+    gui.SYNC_STATE_PATH = os.path.join(workdir, 'sync_state.json')
+    gui.config.update({"db_backend": "sqlite", "database_path": db_path})
+    gui.firebase_db = MemoryFirestore()
+    gui.firebase_initialized = True
+    numbers = itertools.count(1)
+    gui.get_next_customer_numbers = lambda count: [next(numbers) for _ in range(count)]
+    return gui
+
+
+def sync_rows(result):
+    return sum(result.get(k, 0) for k in ('bookings', 'guests', 'articles', 'rooms', 'channels'))
+
+
+# ============================================================================
+# VERGLEICH
+# ============================================================================
+
+def compare(current, previous_path, threshold):
+    with open(previous_path, encoding='utf-8') as f:
+        previous = json.load(f)
+    print(f"\nVergleich mit {previous_path} ({previous.get('started_at')}), Schwelle {threshold:.0f}%")
+    print(f"  {'Fall':<48} {'p50 alt':>9} {'p50 neu':>9} {'p95 alt':>9} {'p95 neu':>9}")
+    regressions = []
+    for name, new in current['cases'].items():
+        old = previous['cases'].get(name)
+        if not old or 'p50_ms' not in old or 'p50_ms' not in new:
+            continue
+        flag = ''
+        if old['p95_ms'] and (new['p95_ms'] - old['p95_ms']) / old['p95_ms'] * 100 > threshold:
+            flag = '  <-- langsamer'
+            regressions.append(name)
+        print(f"  {name:<48} {old['p50_ms']:>9.2f} {new['p50_ms']:>9.2f} "
+              f"{old['p95_ms']:>9.2f} {new['p95_ms']:>9.2f}{flag}")
+    return regressions
+
+
+# ============================================================================
+# MAIN
+# ============================================================================
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('dataset', help="SQLite-Datei von generate_dataset.py")
+    parser.add_argument('--repeat', type=int, default=20, help="Aufrufe pro Fall")
+    parser.add_argument('--cold', action='store_true',
+                        help="Response- und Referenz-Cache vor jedem Lese-Aufruf leeren")
+    parser.add_argument('--skip-writes', action='store_true', help="nur Lese-Routen messen")
+    parser.add_argument('--output-dir', default='bench-results')
+    parser.add_argument('--compare', help="frueheres Ergebnis-JSON zum Vergleich")
+    parser.add_argument('--threshold', type=float, default=10.0,
+                        help="p95-Verschlechterung in Prozent, ab der --compare warnt")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='capcorn-bench-')
+    db_path = os.path.join(workdir, 'caphotel' + os.path.splitext(args.dataset)[1])
+    shutil.copy2(args.dataset, db_path)
+    backup_folder = os.path.join(workdir, 'backups')
+
+    import capcorn_bridge as bridge
+
+    bridge.CONFIG_PATH = os.path.join(workdir, 'config.json')
+    bridge.config.update({"db_backend": "sqlite", "database_path": db_path, "backup_folder": backup_folder})
+    client = bridge.app.test_client()
+    ctx = Context(db_path, args.seed, backup_folder)
+
+    meta_path = args.dataset + '.json'
+    result = {
+        "started_at": datetime.now().isoformat(timespec='seconds'),
+        "dataset": os.path.abspath(args.dataset),
+        "dataset_meta": json.load(open(meta_path, encoding='utf-8')) if os.path.exists(meta_path) else None,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "json_backend": bridge.JSON_BACKEND,
+        "repeat": args.repeat,
+        "cold": args.cold,
+        "cases": {},
+    }
+    cases = result['cases']
+
+    def record(name, summary):
+        cases[name] = summary
+        if 'skipped' in summary:
+            print(f"  {name:<48} skipped: {summary['skipped']}")
+            return
+        bad = {s: n for s, n in summary['status'].items() if not s.startswith('2')}
+        print(f"  {name:<48} p50 {summary['p50_ms']:8.2f}  p95 {summary['p95_ms']:8.2f}  "
+              f"p99 {summary['p99_ms']:8.2f} ms  {summary['rows_per_s']:>9,} rows/s"
+              + (f"  status {bad}" if bad else ""))
+
+    def reset_caches():
+        bridge.response_cache.clear()
+        bridge.ref_cache.invalidate()
+
+    t_start = time.perf_counter()
+    print(f"Datenbestand {args.dataset}, {args.repeat} Aufrufe pro Fall, Arbeitskopie {workdir}")
+
+    # Backup-Ordner mit einem ersten Backup fuellen (Vorlage fuer delete/restore)
+    record("create_backup()", run_function(lambda: bridge.create_backup(force=True), args.repeat))
+
+    for case in read_cases():
+        record(case.name, run_case(client, case, ctx, args.repeat, reset_caches if args.cold else None))
+
+    writes = [] if args.skip_writes else write_cases()
+    for case in writes:
+        record(case.name, run_case(client, case, ctx, args.repeat))
+
+    try:
+        gui = load_gui(db_path, workdir)
+    except Exception as e:
+        reason = f"GUI-Bridge nicht importierbar ({type(e).__name__}: {e})"
+        record("sync_to_firebase(rebuild)", {"skipped": reason})
+        record("sync_to_firebase(delta)", {"skipped": reason})
+    else:
+        record("sync_to_firebase(rebuild)",
+               run_function(lambda: gui.sync_to_firebase(mode='rebuild'), args.repeat, sync_rows))
+        record("sync_to_firebase(delta)",
+               run_function(lambda: gui.sync_to_firebase(mode='delta'), args.repeat, sync_rows))
+
+    if not args.skip_writes:
+        record(RESTORE_CASE.name, run_case(client, RESTORE_CASE, ctx, args.repeat))
+
+    # Abdeckung: jede Route der Bridge sollte mindestens einen Fall haben
+    covered = {(c.method, c.rule) for c in read_cases() + writes + ([RESTORE_CASE] if writes else [])}
+    result['uncovered'] = sorted(
+        f"{method} {rule.rule}" for rule in bridge.app.url_map.iter_rules() if rule.endpoint != 'static'
+        for method in rule.methods - {'HEAD', 'OPTIONS'} if (method, rule.rule) not in covered)
+    result['total_s'] = round(time.perf_counter() - t_start, 1)
+    result['peak_rss_mb'] = peak_rss_mb()
+
+    if result['uncovered']:
+        print(f"\nOhne Fall: {', '.join(result['uncovered'])}")
+    print(f"\nGesamt {result['total_s']}s, Peak-RSS {result['peak_rss_mb']} MB")
+
+    os.makedirs(args.output_dir, exist_ok=True)
+    out_path = os.path.join(args.output_dir, f"bench_{datetime.now():%Y%m%d_%H%M%S}.json")
+    with open(out_path, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+    print(f"Ergebnis: {out_path}")
+
+    regressions = compare(result, args.compare, args.threshold) if args.compare else []
+    shutil.rmtree(workdir, ignore_errors=True)
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
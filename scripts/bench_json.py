@@ -0,0 +1,118 @@
+# -*- coding: utf-8 -*-
+"""
+Micro-Benchmark: JSON-Kodierung einer /bookings-Antwort
+=======================================================
+Misst die Zeit fuer eine Seite mit 5000 Buchungen (Standard) vom
+Datenbank-Tupel bis zu den Response-bytes:
+
+- vorher:  dict(zip(...)) + serialize_row + json.dumps wie Flask-jsonify
+           (sort_keys, ensure_ascii, Decimal als String)
+- nachher: row_encoder + json_codec (orjson / ujson / json, je nach Installation)
+
+Aufruf:  python scripts/bench_json.py [--rows 5000] [--repeat 20]
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'public', 'downloads'))
+
+from capcorn_core import JSON_BACKENDS, json_codec, row_encoder  # noqa: E402
+
+# Spalten wie in GET /bookings (standalone) plus ein Betrag
+DESCRIPTION = [
+    ('resn', int), ('gast', int), ('stat', int), ('andf', datetime), ('ande', datetime),
+    ('chid', int), ('extn', str), ('bdat', datetime), ('tokn', str),
+    ('vorn', str), ('nacn', str), ('mail', str), ('prei', Decimal),
+]
+
+
+def make_rows(count):
+    start = datetime(2026, 1, 1)
+    rows = []
+    for i in range(count):
+        arrival = start + timedelta(days=i % 365)
+        rows.append((
+            100000 - i, 5000 + i % 1200, (0, 2, 64)[i % 3], arrival, arrival + timedelta(days=3 + i % 5),
+            i % 7, f"BK{i:08d}" if i % 4 == 0 else None,
+            datetime(1899, 12, 30) if i % 10 == 0 else arrival - timedelta(days=30), f"tok{i}",
+            "Anna", "Müller", f"gast{i}@example.com", Decimal(f"{100 + i % 400}.50"),
+        ))
+    return rows
+
+
+def serialize_row(row):
+    result = {}
+    for key, value in row.items():
+        if isinstance(value, datetime):
+            result[key] = value.isoformat() if value.year > 1900 else None
+        else:
+            result[key] = value
+    return result
+
+
+def flask_default(value):
+    # Verhalten von Flasks DefaultJSONProvider fuer die hier vorkommenden Typen
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(type(value).__name__)
+
+
+def before(rows):
+    columns = [column[0] for column in DESCRIPTION]
+    bookings = [serialize_row(dict(zip(columns, row))) for row in rows]
+    payload = {"count": len(bookings), "bookings": bookings, "next_cursor": None}
+    return json.dumps(payload, default=flask_default, sort_keys=True).encode('utf-8') + b"\n"
+
+
+def after(dumps):
+    def run(rows):
+        encode = row_encoder(DESCRIPTION)
+        bookings = [encode(row) for row in rows]
+        return dumps({"count": len(bookings), "bookings": bookings, "next_cursor": None}) + b"\n"
+    return run
+
+
+def measure(func, rows, repeat):
+    func(rows)  # Aufwaermen
+    times = []
+    size = 0
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        size = len(func(rows))
+        times.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(times), min(times), size
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=20)
+    args = parser.parse_args()
+
+    rows = make_rows(args.rows)
+    cases = [("vorher: serialize_row + json (wie jsonify)", before)]
+    seen = set()
+    for name in JSON_BACKENDS:
+        backend, dumps = json_codec(name)
+        if backend in seen:
+            continue
+        seen.add(backend)
+        cases.append((f"nachher: row_encoder + {backend}", after(dumps)))
+
+    print(f"{args.rows} Zeilen, {args.repeat} Durchlaeufe (Median / Minimum)")
+    baseline = None
+    for label, func in cases:
+        median, best, size = measure(func, rows, args.repeat)
+        baseline = baseline or median
+        print(f"  {label:<45} {median:8.2f} ms  {best:8.2f} ms  {size / 1024:7.0f} KB  x{baseline / median:.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,319 @@
+# -*- coding: utf-8 -*-
+"""
+Synthetischer Hotel-Datenbestand im CapCorn-Schema
+==================================================
+Fuellt eine SQLite-Datei (Backend "sqlite" der Bridge) mit realistischen
+Mengen: Zimmer und Kategorien, Stammdaten, Gaeste mit Stammgast-Anteil,
+Buchungen ueber mehrere Jahre mit Saisonkurve, Kontobuchungen, Rechnungen
+und Meldungen.
+
+Beispiel (ca. 200.000 AKZ-Zeilen):
+    python scripts/generate_dataset.py bench.sqlite --rooms 60 --years 10 --postings 7
+
+Die Parameter landen zusaetzlich in <datei>.json (fuer bench_bridge.py).
+"""
+
+import argparse
+import json
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..', 'public', 'downloads'))
+
+from capcorn_core import SQLiteBackend  # noqa: E402
+
+CATEGORIES = [
+    # catg, beze, bett, maxv, Anteil Zimmer, Preis Nebensaison, Preis Saison
+    (1, "Einzelzimmer", "EZ", 1, 0.15, 79.0, 99.0),
+    (2, "Doppelzimmer", "DZ", 2, 0.45, 119.0, 149.0),
+    (3, "Doppelzimmer Seeblick", "DZ", 2, 0.25, 149.0, 189.0),
+    (4, "Familien-Suite", "FS", 4, 0.15, 199.0, 259.0),
+]
+
+ARTICLES = [
+    # artn, beze, prei, knto, Gewicht fuer Zusatzbuchungen
+    (1, "Logis", 0.0, "4000", 0),
+    (19, "E-Bike 1 Tag", 25.0, "4100", 3),
+    (53, "Halbpension Erwachsener", 35.0, "4010", 0),
+    (54, "HP Kind 8-16 Jahre", 24.0, "4010", 0),
+    (55, "HP Kind 5-7 Jahre", 18.0, "4010", 0),
+    (56, "HP Kind 0-4 Jahre", 0.0, "4010", 0),
+    (60, "Getraenke", 6.5, "4200", 10),
+    (61, "Minibar", 4.0, "4200", 4),
+    (62, "Wellness-Massage", 65.0, "4300", 2),
+    (70, "Ortstaxe", 2.6, "2500", 0),
+]
+
+CHANNELS = [(0, "Lokal"), (1, "Booking.com"), (2, "Expedia"), (3, "Webseite"), (4, "Telefon")]
+CHANNEL_WEIGHTS = [20, 35, 10, 25, 10]
+
+PAYMENT_TYPES = {"offen": (1, "Offen"), "bar": (2, "Bar"), "karte": (3, "Karte"),
+                 "ueberweisung": (4, "Ueberweisung")}
+
+FIRST_NAMES = ["Anna", "Lukas", "Maria", "Paul", "Julia", "Felix", "Laura", "Jonas", "Sophie",
+               "David", "Lena", "Elias", "Sarah", "Tobias", "Hannah", "Simon", "Eva", "Florian"]
+LAST_NAMES = ["Gruber", "Huber", "Wagner", "Mueller", "Pichler", "Steiner", "Moser", "Mayer",
+              "Hofer", "Leitner", "Berger", "Fuchs", "Eder", "Fischer", "Schmid", "Winkler",
+              "Weber", "Schwarz", "Maier", "Reiter", "Baumgartner", "Brunner", "Wallner"]
+COUNTRIES = [("AT", 55), ("DE", 30), ("CH", 5), ("IT", 4), ("NL", 3), ("CZ", 3)]
+TOWNS = {"AT": ("4864", "Attersee"), "DE": ("80331", "Muenchen"), "CH": ("8001", "Zuerich"),
+         "IT": ("39100", "Bozen"), "NL": ("1012", "Amsterdam"), "CZ": ("11000", "Praha")}
+
+
+def parse_mix(text):
+    """'bar=0.35,karte=0.45,...' -> {(paym, payt): Gewicht}"""
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip().lower()
+        if name not in PAYMENT_TYPES:
+            raise argparse.ArgumentTypeError(f"Unbekannte Zahlart: {name} ({', '.join(PAYMENT_TYPES)})")
+        mix[PAYMENT_TYPES[name]] = float(weight)
+    return mix
+
+
+def occupancy(day, args):
+    """Ziel-Auslastung eines Tages: Mittelwert +/- Saison-Amplitude (Cosinus um peak_month)"""
+    peak = datetime(day.year, args.peak_month, 15)
+    phase = 2 * math.pi * (day - peak).days / 365.25
+    return max(0.02, min(0.98, args.occupancy * (1 + args.seasonality * math.cos(phase))))
+
+
+STAY_NIGHTS = [1, 2, 3, 4, 5, 6, 7, 10, 14]
+STAY_WEIGHTS = [6, 14, 18, 16, 12, 8, 16, 6, 4]
+MEAN_STAY = sum(n * w for n, w in zip(STAY_NIGHTS, STAY_WEIGHTS)) / sum(STAY_WEIGHTS)
+
+
+def stay_length(rng):
+    return rng.choices(STAY_NIGHTS, weights=STAY_WEIGHTS)[0]
+
+
+def arrival_probability(target):
+    """Wahrscheinlichkeit fuer eine Anreise an einem freien Tag, damit im Mittel
+    target belegt ist (freie Tage geometrisch, Aufenthalte im Mittel MEAN_STAY)"""
+    return 1 / (1 + MEAN_STAY * (1 - target) / target)
+
+
+class Generator:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.today = datetime.strptime(args.today, '%Y-%m-%d') if args.today else \
+            datetime.now().replace(hour=0, minute=0, second=0, microsecond=0)
+        self.start = self.today - timedelta(days=int(365.25 * args.years))
+        self.end = self.today + timedelta(days=args.future_days)
+        self.rows = {table: [] for table in ('ZIM', 'CAT', 'ART', 'CHC', 'CHN', 'PMT', 'GKT',
+                                             'GKI', 'BUC', 'BUZ', 'AKZ', 'REC', 'ANM')}
+        self.guests = []
+        self.next_id = {'gast': 1, 'resn': 1, 'aknr': 1, 'rnum': 1, 'annr': 1, 'gkid': 1}
+
+    def take(self, name):
+        value = self.next_id[name]
+        self.next_id[name] += 1
+        return value
+
+    # ------------------------------------------------------------------
+
+    def reference_data(self):
+        rooms = []
+        zimm = 1
+        for catg, beze, bett, maxv, share, low, high in CATEGORIES:
+            self.rows['CAT'].append({"catg": catg, "beze": beze, "bez1": beze, "bett": bett,
+                                     "type": 0, "betm": maxv, "maxv": maxv, "maxe": 1,
+                                     "prwa": low, "prsa": high})
+            for _ in range(max(1, round(self.args.rooms * share))):
+                floor = 1 + (zimm - 1) // 20
+                rooms.append((zimm, catg, maxv, low, high))
+                self.rows['ZIM'].append({"zimm": zimm, "beze": f"{floor}{zimm % 100:02d}", "bett": bett,
+                                         "stat": 0, "catg": catg, "betm": maxv, "maxv": maxv, "type": 0})
+                zimm += 1
+        self.rooms = rooms[:self.args.rooms]
+        self.rows['ZIM'] = self.rows['ZIM'][:self.args.rooms]
+        for artn, beze, prei, knto, _ in ARTICLES:
+            self.rows['ART'].append({"artn": artn, "beze": beze, "prei": prei, "knto": knto})
+        for chid, name in CHANNELS:
+            self.rows['CHC'].append({"chid": chid, "name": name})
+            self.rows['CHN'].append({"chid": chid, "name": name})
+        for paym, payt in PAYMENT_TYPES.values():
+            self.rows['PMT'].append({"paym": paym, "payt": payt, "gknt": f"28{paym:02d}", "flag": 0})
+        self.extras = [a for a in ARTICLES if a[4]]
+
+    def guest(self):
+        """Stammgast (repeat_rate) oder neuer Gast"""
+        if self.guests and self.rng.random() < self.args.repeat_rate:
+            return self.rng.choice(self.guests)
+        rng = self.rng
+        gast = self.take('gast')
+        land = rng.choices([c for c, _ in COUNTRIES], weights=[w for _, w in COUNTRIES])[0]
+        polz, ortb = TOWNS[land]
+        vorn, nacn = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        birth = datetime(rng.randint(1940, 2004), rng.randint(1, 12), rng.randint(1, 28))
+        self.rows['GKT'].append({
+            "gast": gast, "anre": rng.choice(["Herr", "Frau"]), "vorn": vorn, "nacn": nacn,
+            "mail": f"{vorn}.{nacn}{gast}@example.com".lower() if rng.random() < 0.85 else None,
+            "teln": f"+43 660 {rng.randint(1000000, 9999999)}" if rng.random() < 0.6 else None,
+            "stra": f"{rng.choice(LAST_NAMES)}gasse {rng.randint(1, 80)}", "polz": polz,
+            "ortb": ortb, "land": land, "nati": land, "gebd": birth, "gebg": birth,
+        })
+        self.guests.append((gast, vorn, nacn, birth, land))
+        return self.guests[-1]
+
+    def bookings(self):
+        rng = self.rng
+        for zimm, catg, maxv, low, high in self.rooms:
+            day = self.start
+            while day < self.end:
+                if rng.random() >= arrival_probability(occupancy(day, self.args)):
+                    day += timedelta(days=1)
+                    continue
+                nights = stay_length(rng)
+                self.stay(zimm, catg, maxv, low, high, day, day + timedelta(days=nights))
+                day += timedelta(days=nights)
+
+    def stay(self, zimm, catg, maxv, low, high, arrival, departure):
+        rng = self.rng
+        args = self.args
+        gast, vorn, nacn, birth, land = self.guest()
+        resn = self.take('resn')
+        nights = (departure - arrival).days
+        pers = rng.randint(1, maxv)
+        kndr = rng.randint(0, 2) if maxv >= 4 else 0
+        past = departure <= self.today
+        current = arrival <= self.today < departure
+        cancelled = rng.random() < args.cancel_rate
+        if cancelled:
+            stat = 64
+        elif arrival > self.today and rng.random() < 0.1:
+            stat = 0  # Option
+        else:
+            stat = 2
+        booked = arrival - timedelta(days=rng.randint(1, 180), hours=rng.randint(8, 20))
+        self.rows['BUC'].append({
+            "resn": resn, "gast": gast, "stat": stat, "flgl": 0, "andf": arrival, "ande": departure,
+            "chid": rng.choices([c for c, _ in CHANNELS], weights=CHANNEL_WEIGHTS)[0],
+            "bdat": booked, "extn": f"BK{resn:08d}" if rng.random() < 0.4 else None,
+            "tokn": f"t{rng.getrandbits(48):012x}",
+        })
+        if cancelled:
+            return
+        pession = rng.choices([0, 1, 2], weights=[15, 45, 40])[0]
+        self.rows['BUZ'].append({
+            "resn": resn, "lfdn": 1, "zimm": zimm, "vndt": arrival, "bsdt": departure,
+            "pers": pers, "kndr": kndr, "pession": pession,
+            "ckin": 4 if past else (2 if current else 0),
+        })
+
+        # Kontobuchungen: Logis, ggf. HP pro Nacht, Ortstaxe, Zusatzleistungen
+        season = occupancy(arrival, args) > args.occupancy
+        price = (high if season else low) * nights
+        lines = [(1, price, f"Logis {nights} Naechte", arrival)]
+        if pession == 2:
+            lines.append((53, 35.0 * pers * nights, f"Halbpension {pers} Pers.", arrival))
+        lines.append((70, 2.6 * pers * nights, "Ortstaxe", departure))
+        extras = max(0, round(rng.gauss(args.postings - len(lines), 1.5)))
+        for _ in range(extras):
+            artn, beze, prei, _, _ = rng.choices(self.extras, weights=[a[4] for a in self.extras])[0]
+            when = arrival + timedelta(days=rng.randint(0, max(0, nights - 1)), hours=rng.randint(8, 22))
+            lines.append((artn, prei * rng.randint(1, 3), beze, when))
+        total = 0.0
+        for lfdn, (artn, prei, bez1, when) in enumerate(lines, 1):
+            if when > self.today:
+                continue
+            prei = round(prei, 2)
+            total += prei
+            self.rows['AKZ'].append({"aknr": self.take('aknr'), "lfdn": lfdn, "edat": when,
+                                     "resn": resn, "zimm": zimm, "artn": artn, "prei": prei,
+                                     "bez1": bez1, "meng": 1})
+
+        # Meldung (Meldewesen) fuer angereiste Gaeste
+        if past or current:
+            gkid = self.take('gkid')
+            self.rows['GKI'].append({"gkid": gkid, "vorn": vorn, "nacn": nacn, "gebd": birth, "land": land})
+            self.rows['ANM'].append({"annr": self.take('annr'), "resn": resn, "gast": gkid,
+                                     "stat": 4 if past else 6, "dat1": arrival, "dat2": departure,
+                                     "pers": pers, "kind": kndr, "numr": str(resn)})
+
+        # Rechnung bei Abreise
+        if past and total:
+            paym, _ = rng.choices(list(self.args.invoice_mix),
+                                  weights=list(self.args.invoice_mix.values()))[0]
+            split = rng.random() < 0.1
+            self.rows['REC'].append({
+                "rnum": self.take('rnum'), "edat": departure, "rbez": f"{vorn} {nacn}", "gast": gast,
+                "pmt1": paym, "pmv1": round(total * (0.7 if split else 1.0), 2),
+                "pmv2": round(total * 0.3, 2) if split else 0.0, "pmv3": 0.0, "pmta": 0.0,
+            })
+
+    # ------------------------------------------------------------------
+
+    def write(self, path):
+        if os.path.exists(path):
+            os.remove(path)
+        for suffix in ('-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+        conn = SQLiteBackend(path).connect()
+        cursor = conn.cursor()
+        for table, rows in self.rows.items():
+            if not rows:
+                continue
+            for columns in sorted({tuple(row) for row in rows}):
+                batch = [row for row in rows if tuple(row) == columns]
+                cursor.executemany(
+                    f"INSERT INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})",
+                    [tuple(row[c] for c in columns) for row in batch])
+        conn.commit()
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('output', help="Ziel-Datei (.sqlite), wird ueberschrieben")
+    parser.add_argument('--rooms', type=int, default=60)
+    parser.add_argument('--years', type=float, default=10, help="Jahre Historie bis heute")
+    parser.add_argument('--future-days', type=int, default=365, help="Buchungen in die Zukunft")
+    parser.add_argument('--occupancy', type=float, default=0.65, help="mittlere Auslastung 0..1")
+    parser.add_argument('--seasonality', type=float, default=0.35,
+                        help="Saison-Amplitude relativ zur Auslastung (0 = ganzjaehrig gleich)")
+    parser.add_argument('--peak-month', type=int, default=8, help="Monat der Hochsaison")
+    parser.add_argument('--repeat-rate', type=float, default=0.3, help="Anteil Stammgaeste je Buchung")
+    parser.add_argument('--postings', type=float, default=7.0, help="mittlere AKZ-Zeilen pro Aufenthalt")
+    parser.add_argument('--invoice-mix', type=parse_mix,
+                        default=parse_mix("bar=0.3,karte=0.5,ueberweisung=0.15,offen=0.05"),
+                        help="Zahlarten-Mix der Rechnungen, z.B. bar=0.3,karte=0.5,offen=0.2")
+    parser.add_argument('--cancel-rate', type=float, default=0.05)
+    parser.add_argument('--today', help="Stichtag YYYY-MM-DD (Standard: heute)")
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    generator = Generator(args)
+    generator.reference_data()
+    generator.bookings()
+    built = time.perf_counter() - t0
+    generator.write(args.output)
+    written = time.perf_counter() - t0 - built
+
+    counts = {table: len(rows) for table, rows in generator.rows.items()}
+    meta = {
+        "generated_at": datetime.now().isoformat(timespec='seconds'),
+        "today": generator.today.date().isoformat(),
+        "params": {key: value for key, value in vars(args).items() if key not in ('output', 'invoice_mix')},
+        "invoice_mix": {payt: weight for (_, payt), weight in args.invoice_mix.items()},
+        "counts": counts,
+        "size_mb": round(os.path.getsize(args.output) / (1024 * 1024), 1),
+    }
+    with open(args.output + '.json', 'w', encoding='utf-8') as f:
+        json.dump(meta, f, indent=2)
+
+    print(f"{args.output}: {meta['size_mb']} MB (erzeugt {built:.1f}s, geschrieben {written:.1f}s)")
+    for table, count in counts.items():
+        print(f"  {table:<4} {count:>9,}")
+
+
+if __name__ == '__main__':
+    main()
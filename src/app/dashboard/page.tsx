@@ -124,8 +124,28 @@ export default function DashboardPage() {
         throw new Error('Fehler beim Laden der Kalenderdaten');
       }
 
-      const calendarData = await calendarResponse.json();
-      const bookings: BridgeBooking[] = calendarData.bookings || [];
+      // /calendar liefert Zimmer mit ihren Belegungen - flach machen
+      const calendarData: {
+        rooms?: {
+          zimm: number;
+          name: string;
+          bookings: { resn: number; from: string; to: string; guest: string | null;
+                      guest_id: number | null; persons: number; status: number }[];
+        }[];
+      } = await calendarResponse.json();
+      const bookings: BridgeBooking[] = (calendarData.rooms || []).flatMap(room =>
+        room.bookings.map(b => ({
+          resn: b.resn,
+          gast: b.guest_id || 0,
+          nacn: b.guest || undefined,
+          zimm: room.zimm,
+          zimm_name: room.name,
+          vndt: b.from,
+          bsdt: b.to,
+          pers: b.persons,
+          stat: b.status
+        }))
+      );
 
       // Filter arrivals and departures for today
       const arrivals = bookings.filter(b => b.vndt === today && b.stat === 2);
@@ -185,6 +185,20 @@ export default function DownloadPage() {
                 <Download className="w-4 h-4 text-gray-400" />
               </button>
 
+              <button
+                onClick={() => handleDownload('capcorn_core.py')}
+                className="w-full flex items-center justify-between p-3 bg-gray-50 rounded-lg hover:bg-gray-100 transition-colors"
+              >
+                <div className="flex items-center gap-3">
+                  <FileCode className="w-4 h-4 text-gray-500" />
+                  <div className="text-left">
+                    <div className="font-medium text-gray-900 text-sm">capcorn_core.py</div>
+                    <div className="text-xs text-gray-500">Gemeinsame Module (wird von beiden Bridges benoetigt)</div>
+                  </div>
+                </div>
+                <Download className="w-4 h-4 text-gray-400" />
+              </button>
+
               <button
                 onClick={() => handleDownload('README.txt')}
                 className="w-full flex items-center justify-between p-3 bg-gray-50 rounded-lg hover:bg-gray-100 transition-colors"
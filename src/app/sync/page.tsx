@@ -142,17 +142,15 @@ export default function SyncPage() {
 
     try {
       let allGuests: any[] = [];
-      let offset = 0;
+      let cursor: string | null = null;
       const limit = 500;
-      let total = 0;
 
       do {
-        const data = await bridgeAPI.getGuests(limit, offset);
+        const data: Awaited<ReturnType<typeof bridgeAPI.getGuests>> = await bridgeAPI.getGuests(limit, cursor);
         allGuests = [...allGuests, ...data.guests];
-        total = data.total;
-        offset += limit;
-        addLog(`${allGuests.length} von ${total} Gästen geladen...`);
-      } while (allGuests.length < total);
+        cursor = data.next_cursor;
+        addLog(`${allGuests.length} Gäste geladen...`);
+      } while (cursor);
 
       const now = new Date().toISOString();
 
@@ -279,39 +277,44 @@ export default function SyncPage() {
       const endStr = '2050-12-31';
 
       addLog('Lade Buchungen von 2000 bis 2050...');
-      const bookings = await bridgeAPI.getCalendar(startStr, endStr);
-      addLog(`${bookings.length} Buchungen von Bridge erhalten`);
+      const entries = await bridgeAPI.getCalendar(startStr, endStr);
       const now = new Date().toISOString();
 
-      // In Firestore speichern - ALLE verfügbaren Buchungsdaten
-      const firestoreBookings: CaphotelBooking[] = bookings.map(b => ({
-        resn: b.resn,
-        gast: b.gast,
-        stat: 1, // aktiv
-        andf: b.rooms?.[0]?.datea || '',
-        ande: b.rooms?.[0]?.datee || '',
-        chid: 0,
-        guestName: `${b.vorn || ''} ${b.nacn || ''}`.trim(),
-        guestEmail: b.mail || '',
-        guestPhone: b.teln || '',           // NEU: Telefonnummer
-        guestSalutation: b.anre || '',      // NEU: Anrede
-        channelName: b.channel_name || '',
-        pession: b.rooms?.[0]?.pession,     // NEU: Verpflegung (0=UE, 1=F, 2=HP)
-        nights: b.rooms?.[0]?.nights,       // NEU: Anzahl Nächte
-        totalPrice: b.rooms?.reduce((sum, r) => sum + (r.preis || 0), 0), // NEU: Gesamtpreis
-        rooms: b.rooms?.map(r => ({
-          zimm: r.zimn,
-          vndt: r.datea,
-          bsdt: r.datee,
-          pers: 2,                          // Default Personen
-          kndr: 0,
-          pession: r.pession,               // Verpflegung pro Zimmer
-          nights: r.nights,                 // Nächte pro Zimmer
-          preis: r.preis,                   // Preis pro Zimmer
-          roomName: r.room_name             // Zimmername
-        })),
-        syncedAt: now
-      }));
+      // /calendar liefert Belegungen pro Zimmer - pro Reservierung zusammenfassen
+      const byResn = new Map<number, typeof entries>();
+      for (const entry of entries) {
+        byResn.set(entry.resn, [...(byResn.get(entry.resn) || []), entry]);
+      }
+      const nightsBetween = (from: string, to: string) =>
+        Math.max(0, Math.round((new Date(to).getTime() - new Date(from).getTime()) / 86400000));
+      const bookings = Array.from(byResn.values());
+      addLog(`${bookings.length} Buchungen von Bridge erhalten`);
+
+      // In Firestore speichern - alle Daten, die /calendar liefert
+      const firestoreBookings: CaphotelBooking[] = bookings.map(rooms => {
+        const andf = rooms.reduce((min, r) => (r.from < min ? r.from : min), rooms[0].from);
+        const ande = rooms.reduce((max, r) => (r.to > max ? r.to : max), rooms[0].to);
+        return {
+          resn: rooms[0].resn,
+          gast: rooms[0].guest_id || 0,
+          stat: rooms[0].status,
+          andf,
+          ande,
+          chid: 0,
+          guestName: rooms[0].guest || '',
+          nights: nightsBetween(andf, ande),
+          rooms: rooms.map(r => ({
+            zimm: r.zimm,
+            vndt: r.from,
+            bsdt: r.to,
+            pers: r.persons,
+            kndr: 0,
+            nights: nightsBetween(r.from, r.to),
+            roomName: r.room_name
+          })),
+          syncedAt: now
+        };
+      });
       await saveSyncedBookings(firestoreBookings);
       addLog(`${bookings.length} Buchungen mit allen Details in Firestore gespeichert`);
 
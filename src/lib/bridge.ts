@@ -57,6 +57,33 @@ export interface BridgeAvailability {
   resn?: number;
 }
 
+export interface BridgeAvailabilityMatrix {
+  from: string;
+  to: string;
+  days: string[];
+  total_rooms: number;
+  categories: {
+    catg: number;
+    beze: string | null;
+    total_rooms: number;
+    free: number[];             // freie Zimmer je Tag (Index wie days)
+    max_free_persons: number[]; // groesste freie Kapazitaet (maxv) je Tag
+  }[];
+}
+
+// Eine Belegung aus /calendar (flach, mit Zimmer)
+export interface BridgeCalendarEntry {
+  zimm: number;
+  room_name: string;
+  resn: number;
+  from: string;               // Anreise (YYYY-MM-DD)
+  to: string;                 // Abreise (YYYY-MM-DD)
+  guest: string | null;       // Nachname
+  guest_id: number | null;
+  persons: number;
+  status: number;
+}
+
 export interface BridgeStats {
   total_guests: number;
   total_bookings: number;
@@ -207,8 +234,10 @@ class BridgeAPI {
   }
 
   // Alle Gäste laden (mit Pagination)
-  async getGuests(limit: number = 100, offset: number = 0): Promise<{ guests: BridgeGuest[]; total: number }> {
-    const response = await fetch(`${this.baseUrl}/guests?limit=${limit}&offset=${offset}`);
+  async getGuests(limit: number = 100, cursor?: string | null): Promise<{ guests: BridgeGuest[]; count: number; next_cursor: string | null }> {
+    const params = new URLSearchParams({ limit: String(limit) });
+    if (cursor) params.set('cursor', cursor);
+    const response = await fetch(`${this.baseUrl}/guests?${params}`);
     if (!response.ok) throw new Error('Failed to fetch guests');
     return response.json();
   }
@@ -239,12 +268,40 @@ class BridgeAPI {
     return data.availability;
   }
 
-  // Kalender laden (Buchungen im Zeitraum)
-  async getCalendar(startDate: string, endDate: string): Promise<BridgeBooking[]> {
-    const response = await fetch(`${this.baseUrl}/calendar?start_date=${startDate}&end_date=${endDate}`);
-    if (!response.ok) throw new Error('Failed to fetch calendar');
-    const data = await response.json();
-    return data.bookings;
+  // Verfügbarkeits-Matrix laden (freie Zimmer pro Tag und Kategorie, max. 366 Tage)
+  async getAvailabilityMatrix(from: string, to: string): Promise<BridgeAvailabilityMatrix> {
+    const response = await fetch(`${this.baseUrl}/availability/matrix?from=${from}&to=${to}`);
+    if (!response.ok) throw new Error('Failed to fetch availability matrix');
+    return response.json();
+  }
+
+  // Kalender laden (Belegungen im Zeitraum). Die Bridge liefert max. 366 Tage
+  // pro Anfrage, laengere Zeitraeume werden in Jahresfenstern geladen.
+  async getCalendar(startDate: string, endDate: string): Promise<BridgeCalendarEntry[]> {
+    const DAY = 24 * 60 * 60 * 1000;
+    const last = new Date(`${endDate}T00:00:00Z`).getTime();
+    const entries = new Map<string, BridgeCalendarEntry>();
+
+    for (let from = new Date(`${startDate}T00:00:00Z`).getTime(); from <= last; from += 366 * DAY) {
+      const to = Math.min(from + 365 * DAY, last);
+      const fromStr = new Date(from).toISOString().split('T')[0];
+      const toStr = new Date(to).toISOString().split('T')[0];
+      const response = await fetch(`${this.baseUrl}/calendar?start_date=${fromStr}&end_date=${toStr}`);
+      if (!response.ok) throw new Error('Failed to fetch calendar');
+      const data: { rooms: { zimm: number; name: string; bookings: Omit<BridgeCalendarEntry, 'zimm' | 'room_name'>[] }[] } =
+        await response.json();
+      for (const room of data.rooms) {
+        for (const booking of room.bookings) {
+          // Aufenthalte ueber eine Fenstergrenze kommen in beiden Fenstern
+          entries.set(`${booking.resn}:${room.zimm}:${booking.from}`, {
+            ...booking,
+            zimm: room.zimm,
+            room_name: room.name,
+          });
+        }
+      }
+    }
+    return Array.from(entries.values());
   }
 
   // Einzelne Buchung laden
@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+"""
+Fixtures fuer die Bridge-Tests
+==============================
+Die Bridge laeuft gegen eine kleine, mit scripts/generate_dataset.py
+erzeugte SQLite-Datenbank (db_backend "sqlite"). Geprueft wird ueber eine
+eigene sqlite3-Verbindung, die nur committete Zeilen sieht.
+
+Benoetigt flask und flask_cors (wie die Bridge selbst); ohne sie werden
+die Route-Tests uebersprungen.
+"""
+
+import itertools
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+from datetime import date, timedelta
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, 'public', 'downloads'))
+
+# Stichtag des Test-Datensatzes; neue Buchungen der Tests liegen weit danach
+DATASET_TODAY = date(2026, 1, 15)
+
+
+@pytest.fixture(scope='session')
+def dataset(tmp_path_factory):
+    """Generierte CapCorn-Datenbank (einmal pro Testlauf)"""
+    path = tmp_path_factory.mktemp('dataset') / 'caphotel.sqlite'
+    subprocess.run([
+        sys.executable, os.path.join(ROOT, 'scripts', 'generate_dataset.py'), str(path),
+        '--rooms', '8', '--years', '1', '--future-days', '60',
+        '--today', DATASET_TODAY.isoformat(), '--seed', '7'
+    ], check=True, stdout=subprocess.DEVNULL)
+    return str(path)
+
+
+@pytest.fixture(scope='session')
+def bridge(dataset, tmp_path_factory):
+    """capcorn_bridge auf einer Kopie des Datensatzes"""
+    pytest.importorskip('flask')
+    pytest.importorskip('flask_cors')
+    workdir = tmp_path_factory.mktemp('bridge')
+    db_path = str(workdir / 'caphotel.sqlite')
+    shutil.copy2(dataset, db_path)
+
+    import capcorn_bridge
+
+    capcorn_bridge.CONFIG_PATH = str(workdir / 'config.json')
+    capcorn_bridge.config.update({
+        "db_backend": "sqlite",
+        "database_path": db_path,
+        "backup_folder": str(workdir / 'backups')
+    })
+    yield capcorn_bridge
+    capcorn_bridge.write_queue.reset()
+    capcorn_bridge.db_pool.close_all()
+
+
+@pytest.fixture
+def client(bridge):
+    return bridge.app.test_client()
+
+
+@pytest.fixture
+def db(bridge):
+    """Eigene Verbindung auf die Bridge-Datenbank (sieht nur Committetes)"""
+    conn = sqlite3.connect(bridge.config['database_path'])
+    conn.row_factory = sqlite3.Row
+    yield conn
+    conn.close()
+
+
+_periods = itertools.count()
+
+
+@pytest.fixture
+def slot(db):
+    """Freies Zimmer/Zeitraum: jeder Aufruf liefert einen eigenen Zeitraum"""
+    rooms = [row['zimm'] for row in db.execute("SELECT zimm FROM ZIM WHERE stat = 0 ORDER BY zimm")]
+
+    def take(nights=3):
+        n = next(_periods)
+        von = DATASET_TODAY + timedelta(days=3 * 365 + 7 * (n // len(rooms)))
+        return rooms[n % len(rooms)], von.isoformat(), (von + timedelta(days=nights)).isoformat()
+    return take
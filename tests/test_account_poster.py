@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""AccountPoster: aknr-Block, Sammel-Insert und zeilenweiser Fallback"""
+
+import pytest
+
+from capcorn_core import AccountPoster, SQLiteBackend
+
+
+@pytest.fixture
+def conn(tmp_path):
+    conn = SQLiteBackend(str(tmp_path / 'akz.sqlite')).connect()
+    yield conn
+    conn.close()
+
+
+def allocator(start=100):
+    calls = []
+
+    def allocate(count):
+        calls.append(count)
+        return start + sum(calls) - count
+    return allocate, calls
+
+
+def line(prei, **extra):
+    return {"resn": 1, "zimm": 2, "artn": 0, "prei": prei, "bez1": f"Pos {prei}", **extra}
+
+
+def akz(conn):
+    cursor = conn.cursor()
+    cursor.execute("SELECT aknr, prei FROM AKZ ORDER BY aknr")
+    return [tuple(row) for row in cursor.fetchall()]
+
+
+def test_post_reserves_one_block_and_commits(conn):
+    allocate, calls = allocator()
+    poster = AccountPoster(allocate)
+
+    results = poster.post(conn, [line(10), line(20), line(30, meng=2)])
+
+    assert calls == [3]
+    assert [r['aknr'] for r in results] == [100, 101, 102]
+    conn.rollback()
+    assert akz(conn) == [(100, 10), (101, 20), (102, 30)]
+    assert poster.stats()['batches'] == 1
+
+
+def test_post_uses_reserved_block_inside_transaction(conn):
+    allocate, calls = allocator()
+    poster = AccountPoster(allocate)
+    first = poster.reserve(2)
+
+    results = poster.post(conn, [line(10), line(20)], commit=False, first=first)
+
+    assert calls == [2]
+    assert [r['aknr'] for r in results] == [100, 101]
+    conn.rollback()
+    assert akz(conn) == []
+
+
+def test_partial_falls_back_to_single_rows(conn):
+    allocate, _ = allocator()
+    poster = AccountPoster(allocate)
+    poster.post(conn, [line(5)])  # belegt aknr 100
+
+    # Zweiter Block beginnt wieder bei 100: Sammel-Insert scheitert am
+    # Primaerschluessel, zeilenweise gehen nur die freien Nummern durch
+    results = poster.post(conn, [line(10), line(20)], partial=True, first=100)
+
+    assert results[0]['success'] is False
+    assert results[1] == {"success": True, "aknr": 101}
+    assert akz(conn) == [(100, 5), (101, 20)]
+    assert poster.stats()['fallbacks'] == 1
+    assert poster.stats()['failed_lines'] == 1
+
+
+def test_partial_refuses_open_transaction(conn):
+    poster = AccountPoster(allocator()[0])
+    with pytest.raises(ValueError):
+        poster.post(conn, [line(10)], commit=False, partial=True)
+
+
+def test_post_without_partial_raises(conn):
+    allocate, _ = allocator()
+    poster = AccountPoster(allocate)
+    poster.post(conn, [line(5)])
+    with pytest.raises(Exception):
+        poster.post(conn, [line(10)], first=100)
@@ -0,0 +1,382 @@
+# -*- coding: utf-8 -*-
+"""capcorn_core ohne Flask: Pool, Nummernkreise, Cursor, ETags, Queue, Sperren, Index"""
+
+import sqlite3
+import threading
+import time
+from datetime import date
+
+import pytest
+
+from capcorn_core import (
+    AvailabilityIndex, ConnectionPool, PoolTimeout, RoomLocks, RoomLockTimeout, SequenceAllocator,
+    SQLiteBackend, TableFingerprints, WriteQueue, decode_cursor, encode_cursor, encoded_etag, etag_matches,
+    keyset_page, occupancy_runs, to_day,
+)
+
+
+# ============================================================================
+# CONNECTION POOL
+# ============================================================================
+
+class FakeConnection:
+    def __init__(self):
+        self.rollbacks = 0
+        self.closed = False
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.closed = True
+
+
+@pytest.fixture
+def pool():
+    return ConnectionPool(FakeConnection, max_size=2, timeout=0.2)
+
+
+def test_scope_shares_one_connection(pool):
+    with pool.scope():
+        first = pool.acquire()
+        second = pool.acquire()
+        assert first.raw is second.raw
+        own = pool.acquire(scoped=False)
+        assert own.raw is not first.raw
+        own.close()
+        first.close()
+        second.close()
+    assert pool.stats()['created'] == 2
+    assert pool.stats()['in_use'] == 0
+
+
+def test_scoped_close_keeps_transaction_until_scope_end(pool):
+    with pool.scope():
+        outer = pool.acquire()
+        raw = outer.raw
+        with pool.connection():
+            pass  # verschachtelter Zugriff, z.B. db_query mitten in einer Route
+        assert raw.rollbacks == 0
+        outer.close()
+        assert raw.rollbacks == 0
+    assert raw.rollbacks == 1
+    assert pool.stats()['idle'] == 1
+
+
+def test_unscoped_close_rolls_back_and_reuses(pool):
+    conn = pool.acquire()
+    raw = conn.raw
+    conn.close()
+    conn.close()  # zweites close() ist wirkungslos
+    assert raw.rollbacks == 1
+    assert pool.acquire().raw is raw
+    assert pool.stats()['reused'] == 1
+
+
+def test_pool_timeout_when_exhausted(pool):
+    held = [pool.acquire(), pool.acquire()]
+    with pytest.raises(PoolTimeout):
+        pool.acquire()
+    assert pool.stats()['timeouts'] == 1
+    for conn in held:
+        conn.close()
+
+
+def test_close_all_discards_borrowed_connections_on_return(pool):
+    conn = pool.acquire()
+    raw = conn.raw
+    pool.close_all()
+    conn.close()
+    assert raw.closed
+    assert pool.stats()['open'] == 0
+
+
+# ============================================================================
+# NUMMERNKREISE
+# ============================================================================
+
+def test_sequence_reads_max_once_and_counts_in_process():
+    queries = []
+
+    def max_query(table, column):
+        queries.append((table, column))
+        return 41
+
+    sequences = SequenceAllocator(max_query)
+    sequences.register('BUC', 'resn')
+
+    assert sequences.next('BUC') == 42
+    assert sequences.reserve('BUC', 3) == 43
+    assert sequences.next('BUC') == 46
+    assert queries == [('BUC', 'resn')]
+    assert sequences.stats()['BUC'] == {"next": 47, "allocated": 5, "syncs": 1}
+
+
+def test_sequence_resyncs_only_on_foreign_numbers_and_never_goes_back():
+    state = {"max": 10, "seen": None}
+    sequences = SequenceAllocator(lambda table, column: state['max'],
+                                  probe=lambda table: state['seen'])
+    sequences.register('GKT', 'gast')
+
+    assert sequences.next('GKT') == 11
+    # Eigene Einfuegungen (Poll sieht 11, 12) loesen keinen Abgleich aus
+    state.update(max=11, seen=11)
+    assert sequences.next('GKT') == 12
+    state.update(max=12, seen=12)
+    assert sequences.next('GKT') == 13
+    assert sequences.stats()['GKT']['syncs'] == 1
+    # Fremder Client hat bis 20 vergeben
+    state.update(max=20, seen=20)
+    assert sequences.next('GKT') == 21
+    # MAX faellt (z.B. zurueckgerollte Transaktion) - keine Doppelvergabe
+    sequences.invalidate('GKT')
+    state.update(max=5, seen=5)
+    assert sequences.next('GKT') == 22
+    assert sequences.stats()['GKT']['syncs'] == 3
+
+
+def test_known_max_comes_from_last_poll_without_query():
+    queries = []
+    fingerprints = TableFingerprints(lambda sql, params: queries.append(sql) or {"p0": 3, "p1": 42.0})
+    fingerprints.register('GKT', 'gast', ['COUNT(*)', 'MAX(gast)'])
+    assert fingerprints.known_max('GKT') is None
+    fingerprints.poll()
+    assert fingerprints.known_max('GKT') == 42
+    assert len(queries) == 1
+
+
+def test_sequence_invalidate_all_rereads_max():
+    state = {"max": 10}
+    sequences = SequenceAllocator(lambda table, column: state['max'])
+    sequences.register('ANM', 'annr')
+    assert sequences.next('ANM') == 11
+    state['max'] = 3  # z.B. nach Backup-Restore
+    sequences.invalidate()
+    assert sequences.next('ANM') == 4
+
+
+# ============================================================================
+# TABELLEN-FINGERPRINTS
+# ============================================================================
+
+def slow_fingerprints(release):
+    """Fingerprints, deren Abfrage bis release.set() haengt"""
+    queries = []
+
+    def query(sql, params):
+        queries.append(sql)
+        release.wait(2)
+        return {"p0": len(queries)}
+
+    fingerprints = TableFingerprints(query, interval=30)
+    fingerprints.register('BUZ', 'resn', ['COUNT(*)'])
+    return fingerprints, queries
+
+
+def test_version_does_not_wait_for_running_poll():
+    release = threading.Event()
+    fingerprints, queries = slow_fingerprints(release)
+    poller = threading.Thread(target=fingerprints.poll)
+    poller.start()
+    time.sleep(0.05)
+
+    started = time.monotonic()
+    assert fingerprints.version('BUZ') == 0
+    assert time.monotonic() - started < 0.5
+    release.set()
+    poller.join(2)
+    assert fingerprints.version('BUZ') == 1
+    assert len(queries) == 1
+    assert fingerprints.stats()['skipped'] == 1
+
+
+def test_touch_bumps_version_without_query_and_expire_rereads():
+    release = threading.Event()
+    release.set()
+    fingerprints, queries = slow_fingerprints(release)
+    assert fingerprints.version('BUZ') == 1
+
+    fingerprints.touch(['BUZ'])
+    assert fingerprints.version('BUZ') == 2
+    assert len(queries) == 1
+
+    fingerprints.expire(['BUZ'])
+    assert fingerprints.version('BUZ') == 3
+    assert len(queries) == 2
+
+
+def test_background_poll_only_covers_watched_tables():
+    queries = []
+    fingerprints = TableFingerprints(lambda sql, params: queries.append(sql) or {"p0": 1},
+                                     interval=0.01)
+    for table in ('BUZ', 'GKT'):
+        fingerprints.register(table, 'id', ['COUNT(*)'])
+    fingerprints.subscribe(lambda table, version: None, tables=['BUZ'])
+    fingerprints.start()
+    time.sleep(0.1)
+    fingerprints.stop()
+
+    assert queries and all('FROM BUZ' in sql for sql in queries)
+    assert fingerprints.stats()['watched'] == ['BUZ']
+
+
+# ============================================================================
+# KEYSET-CURSOR / ETAG
+# ============================================================================
+
+def test_cursor_roundtrip_and_field_check():
+    cursor = encode_cursor('resn', 1234)
+    assert decode_cursor(cursor, 'resn') == 1234
+    with pytest.raises(ValueError):
+        decode_cursor(cursor, 'gast')
+    with pytest.raises(ValueError):
+        decode_cursor('kein-cursor', 'resn')
+
+
+def test_keyset_page_uses_extra_row_for_next_cursor():
+    rows = [{"resn": n} for n in (9, 8, 7)]
+    page, next_cursor = keyset_page(rows, 2, 'resn')
+    assert page == rows[:2]
+    assert decode_cursor(next_cursor, 'resn') == 8
+    assert keyset_page(rows, 3, 'resn') == (rows, None)
+
+
+def test_etag_matches_weak_and_encoded_variants():
+    etag = '"abc123"'
+    assert etag_matches(etag, etag)
+    assert etag_matches('W/"abc123"', etag)
+    assert etag_matches('"other", ' + encoded_etag(etag, 'gzip'), etag)
+    assert etag_matches('*', etag)
+    assert not etag_matches('"other"', etag)
+    assert not etag_matches(None, etag)
+
+
+# ============================================================================
+# SCHREIB-QUEUE
+# ============================================================================
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(str(tmp_path / 'queue.sqlite'))
+
+
+def insert_guest(gast):
+    def op(conn):
+        cursor = conn.cursor()
+        cursor.execute("INSERT INTO GKT (gast, nacn) VALUES (?, ?)", (gast, f"Gast {gast}"))
+        return gast
+    return op
+
+
+def committed_guests(backend):
+    conn = sqlite3.connect(backend.path)
+    try:
+        return [row[0] for row in conn.execute("SELECT gast FROM GKT ORDER BY gast")]
+    finally:
+        conn.close()
+
+
+def test_write_queue_commits_grouped_operations(backend):
+    queue = WriteQueue(backend.connect, window=0.05)
+    futures = [queue.submit(insert_guest(n)) for n in (1, 2, 3)]
+    assert [f.result(5) for f in futures] == [1, 2, 3]
+    assert committed_guests(backend) == [1, 2, 3]
+    stats = queue.stats()
+    assert stats['operations'] == 3
+    assert stats['commits'] < 3
+
+
+def test_write_queue_failure_only_hits_its_caller(backend):
+    queue = WriteQueue(backend.connect, window=0.05)
+    queue.run(insert_guest(1))
+    futures = [queue.submit(insert_guest(n)) for n in (2, 1, 3)]
+
+    assert futures[0].result(5) == 2
+    with pytest.raises(sqlite3.IntegrityError):
+        futures[1].result(5)
+    assert futures[2].result(5) == 3
+    assert committed_guests(backend) == [1, 2, 3]
+    assert queue.stats()['failed'] == 1
+
+
+# ============================================================================
+# ZIMMER-SPERREN
+# ============================================================================
+
+def test_room_lock_serializes_same_room_only():
+    locks = RoomLocks(timeout=1)
+    order = []
+    entered = threading.Event()
+
+    def second():
+        with locks.hold(5):
+            order.append('second')
+
+    with locks.hold(5):
+        with locks.hold(6):  # anderes Zimmer: sofort frei
+            pass
+        thread = threading.Thread(target=lambda: (entered.set(), second()))
+        thread.start()
+        entered.wait(1)
+        time.sleep(0.05)
+        order.append('first')
+    thread.join(2)
+
+    assert order == ['first', 'second']
+    stats = locks.stats()
+    assert stats['contended'] == 1
+    assert stats['rooms_locked'] == 0
+
+
+def test_room_lock_timeout():
+    locks = RoomLocks(timeout=0.05)
+    with locks.hold(7):
+        result = {}
+
+        def waiter():
+            try:
+                with locks.hold(7):
+                    result['got'] = True
+            except RoomLockTimeout:
+                result['timeout'] = True
+        thread = threading.Thread(target=waiter)
+        thread.start()
+        thread.join(2)
+    assert result == {"timeout": True}
+    assert locks.stats()['timeouts'] == 1
+
+
+# ============================================================================
+# VERFUEGBARKEITS-INDEX
+# ============================================================================
+
+def turnover_index():
+    # Zimmer 1: Abreise am 12., naechste Anreise am 12. (Wechseltag)
+    bookings = [
+        {"resn": 1, "zimm": 1, "vndt": "2030-03-10", "bsdt": "2030-03-12"},
+        {"resn": 2, "zimm": 1, "vndt": "2030-03-12", "bsdt": "2030-03-14"},
+        {"resn": 3, "zimm": 2, "vndt": "2030-03-11", "bsdt": "2030-03-12"},
+    ]
+    return AvailabilityIndex(lambda: bookings)
+
+
+def test_occupied_days_count_nights_like_the_calendar():
+    index = turnover_index()
+    start, end = date(2030, 3, 10), date(2030, 3, 14)
+    flags = index.occupied_days(start, end, [1, 2])
+    assert list(flags[1]) == [1, 1, 1, 1, 0]
+    assert list(flags[2]) == [0, 1, 0, 0, 0]
+
+    intervals = sorted((to_day(b['vndt']), to_day(b['bsdt']), b['resn'])
+                       for b in index._loader() if b['zimm'] == 2)
+    nights = [resn for resn, n in occupancy_runs(intervals, start.toordinal(), 5) for _ in range(n)]
+    assert [int(bool(resn)) for resn in nights] == list(flags[2])
+
+
+def test_free_matrix_keeps_departure_day_free():
+    index = turnover_index()
+    rooms = [{"zimm": 1, "catg": 7, "maxv": 2}, {"zimm": 2, "catg": 7, "maxv": 4}]
+    matrix = index.free_matrix(rooms, date(2030, 3, 10), date(2030, 3, 14))
+    # 12.: Zimmer 2 reist ab und ist frei, Zimmer 1 hat einen Wechsel
+    assert matrix[7]['free'] == [1, 0, 1, 1, 2]
+    assert matrix[7]['max_free'] == [4, 0, 4, 4, 4]
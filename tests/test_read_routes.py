@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""Lesende Routen: Keyset-Paging, ETag/304 und Sichtbarkeit eigener Schreibzugriffe"""
+
+
+def walk(client, url, key):
+    seen = []
+    cursor = None
+    while True:
+        resp = client.get(url + (f'&cursor={cursor}' if cursor else ''))
+        assert resp.status_code == 200
+        body = resp.get_json()
+        seen.extend(row[key] for row in body[next(k for k in body if isinstance(body[k], list))])
+        cursor = body['next_cursor']
+        if not cursor:
+            return seen
+
+
+def test_bookings_keyset_paging_covers_all_rows(client, db):
+    seen = walk(client, '/bookings?limit=50', 'resn')
+    assert seen == sorted(seen, reverse=True)
+    assert len(seen) == len(set(seen))
+    assert len(seen) == db.execute("SELECT COUNT(*) FROM BUC").fetchone()[0]
+
+
+def test_guests_keyset_paging(client):
+    seen = walk(client, '/guests?limit=40', 'gast')
+    assert len(seen) == len(set(seen)) > 40
+
+
+def test_invalid_cursor_is_rejected(client):
+    assert client.get('/bookings?cursor=kaputt').status_code == 400
+
+
+def test_etag_revalidation_and_invalidation(client, slot):
+    first = client.get('/bookings?limit=5')
+    etag = first.headers['ETag']
+    assert client.get('/bookings?limit=5', headers={"If-None-Match": etag}).status_code == 304
+
+    zimm, von, bis = slot()
+    assert client.post('/option', json={"zimm": zimm, "von": von, "bis": bis}).status_code == 201
+
+    after = client.get('/bookings?limit=5', headers={"If-None-Match": etag})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != etag
+
+
+def test_compressed_response_keeps_matching_etag(client):
+    resp = client.get('/bookings?limit=200', headers={"Accept-Encoding": "gzip"})
+    assert resp.headers.get('Content-Encoding') == 'gzip'
+    again = client.get('/bookings?limit=200', headers={"Accept-Encoding": "gzip",
+                                                      "If-None-Match": resp.headers['ETag']})
+    assert again.status_code == 304
+
+
+def test_calendar_window_limit_and_shape(client, slot):
+    zimm, von, bis = slot()
+    resn = client.post('/option', json={"zimm": zimm, "von": von, "bis": bis, "gast": 0}).get_json()['resn']
+
+    assert client.get('/calendar?start_date=2000-01-01&end_date=2050-12-31').status_code == 400
+    body = client.get(f'/calendar?start_date={von}&end_date={bis}').get_json()
+    room = next(r for r in body['rooms'] if r['zimm'] == zimm)
+    booking = next(b for b in room['bookings'] if b['resn'] == resn)
+    assert (booking['from'], booking['to'], booking['guest_id']) == (von, bis, 0)
+
+
+def test_same_length_rename_changes_guest_etag(bridge, client, db):
+    gast = client.post('/guest', json={"vorname": "Eva", "nachname": "Meier"}).get_json()['gast']
+    first = client.get('/guests?q=Meier')
+    assert client.get('/guests?q=Meier', headers={"If-None-Match": first.headers['ETag']}).status_code == 304
+
+    # Umbenennung im CapCorn-Client: gleiche Laenge, Fingerprint bleibt gleich
+    db.execute("UPDATE GKT SET vorn = 'Ida' WHERE gast = ?", (gast,))
+    db.commit()
+    bridge.fingerprints.poll(['GKT'])
+
+    after = client.get('/guests?q=Meier', headers={"If-None-Match": first.headers['ETag']})
+    assert after.status_code == 200
+    assert after.headers['ETag'] != first.headers['ETag']
+    assert any(g['vorn'] == 'Ida' for g in after.get_json()['guests'])
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Schreibende Routen: nach jeder Antwort muessen die Zeilen committet sein"""
+
+
+def count(db, sql, params=()):
+    return db.execute(sql, params).fetchone()[0]
+
+
+def test_option_with_new_guest_commits_all_rows(bridge, client, db, slot):
+    zimm, von, bis = slot()
+    # MAX beim naechsten Vergeben neu lesen - der Abgleich laeuft dann
+    # mitten im Request auf der Scope-Verbindung
+    bridge.sequences.invalidate()
+
+    resp = client.post('/option', json={
+        "zimm": zimm, "von": von, "bis": bis, "pers": 2,
+        "vorname": "Anna", "nachname": "Option", "email": "anna@example.com"
+    })
+    assert resp.status_code == 201
+    body = resp.get_json()
+
+    guest = db.execute("SELECT vorn, nacn FROM GKT WHERE gast = ?", (body['gast'],)).fetchone()
+    assert tuple(guest) == ("Anna", "Option")
+    booking = db.execute("SELECT gast, stat FROM BUC WHERE resn = ?", (body['resn'],)).fetchone()
+    assert tuple(booking) == (body['gast'], 2)
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND zimm = ?", (body['resn'], zimm)) == 1
+    assert bridge.availability_index.conflicts(zimm, von, bis) == [body['resn']]
+
+
+def test_booking_with_price_commits_all_rows(bridge, client, db, slot):
+    zimm, von, bis = slot()
+    bridge.sequences.invalidate()
+    positionen = [
+        {"artikel": "Zimmer DZ", "preis": 420.0},
+        {"artikel": "Halbpension", "preis": 180.0, "artn": 53},
+        {"artikel": "Rabatt", "preis": -30.0},
+    ]
+
+    resp = client.post('/booking-with-price', json={
+        "zimm": zimm, "von": von, "bis": bis, "pession": 2,
+        "vorname": "Ben", "nachname": "Preis", "telefon": "+43 1",
+        "positionen": positionen
+    })
+    assert resp.status_code == 201
+    body = resp.get_json()
+    assert body['total'] == 570.0
+
+    assert count(db, "SELECT COUNT(*) FROM GKT WHERE gast = ? AND nacn = 'Preis'", (body['gast'],)) == 1
+    assert count(db, "SELECT COUNT(*) FROM BUC WHERE resn = ? AND stat = 2", (body['resn'],)) == 1
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND pession = 2", (body['resn'],)) == 1
+    lines = db.execute("SELECT aknr, bez1, prei FROM AKZ WHERE resn = ? ORDER BY aknr",
+                       (body['resn'],)).fetchall()
+    assert [(row['bez1'], row['prei']) for row in lines] == [
+        (pos['artikel'], pos['preis']) for pos in positionen]
+    assert len({row['aknr'] for row in lines}) == len(positionen)
+
+
+def book(client, slot, **extra):
+    zimm, von, bis = slot()
+    resp = client.post('/booking-with-price', json={
+        "zimm": zimm, "von": von, "bis": bis, "nachname": "Test",
+        "positionen": [{"artikel": "Logis", "preis": 300.0}], **extra
+    })
+    assert resp.status_code == 201
+    return dict(resp.get_json(), zimm=zimm, von=von, bis=bis)
+
+
+def test_block_and_remove_block(bridge, client, db, slot):
+    zimm, von, bis = slot()
+    resp = client.post('/block', json={"zimm": zimm, "von": von, "bis": bis, "grund": "Renovierung"})
+    assert resp.status_code == 201
+    resn = resp.get_json()['resn']
+    assert tuple(db.execute("SELECT stat, flgl, extn FROM BUC WHERE resn = ?", (resn,)).fetchone()) == (
+        0, 4, "Renovierung")
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND zimm = ?", (resn, zimm)) == 1
+
+    # Zeitraum ist jetzt belegt
+    resp = client.post('/option', json={"zimm": zimm, "von": von, "bis": bis})
+    assert resp.status_code == 409
+
+    assert client.delete(f'/block/{resn}').status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM BUC WHERE resn = ?", (resn,)) == 0
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ?", (resn,)) == 0
+    assert bridge.availability_index.conflicts(zimm, von, bis) == []
+
+
+def test_book_and_cancel_option(bridge, client, db, slot):
+    zimm, von, bis = slot()
+    resn = client.post('/option', json={"zimm": zimm, "von": von, "bis": bis, "gast": 0}).get_json()['resn']
+
+    assert client.put(f'/book/{resn}').status_code == 200
+    assert tuple(db.execute("SELECT stat, flgl FROM BUC WHERE resn = ?", (resn,)).fetchone()) == (2, 0)
+
+    assert client.delete(f'/cancel/{resn}').status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM BUC WHERE resn = ? AND stat = 65536", (resn,)) == 1
+    # BUZ bleibt fuer die Historie, das Zimmer ist trotzdem frei
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ?", (resn,)) == 1
+    assert bridge.availability_index.conflicts(zimm, von, bis) == []
+
+
+def test_create_and_update_guest(client, db):
+    resp = client.post('/guest', json={"vorname": "Clara", "nachname": "Neu", "ort": "Wien"})
+    assert resp.status_code == 201
+    gast = resp.get_json()['gast']
+    assert tuple(db.execute("SELECT vorn, nacn, ortb FROM GKT WHERE gast = ?", (gast,)).fetchone()) == (
+        "Clara", "Neu", "Wien")
+
+    resp = client.put(f'/guest/{gast}', json={"telefon": "+43 1 234567", "ort": "Graz"})
+    assert resp.status_code == 200
+    assert tuple(db.execute("SELECT teln, ortb FROM GKT WHERE gast = ?", (gast,)).fetchone()) == (
+        "+43 1 234567", "Graz")
+
+
+def test_guest_numbers_without_resync_for_own_inserts(bridge, client, db):
+    assert client.post('/guest', json={"nachname": "Erster"}).status_code == 201  # erster Abgleich
+    bridge.fingerprints.poll(['GKT'])
+    before = bridge.sequences.stats()['GKT']
+    numbers = []
+    for n in range(5):
+        resp = client.post('/guest', json={"nachname": f"Serie {n}"})
+        assert resp.status_code == 201
+        numbers.append(resp.get_json()['gast'])
+        bridge.fingerprints.poll(['GKT'])  # Hintergrund-Poll sieht die eigene Zeile
+    assert numbers == list(range(numbers[0], numbers[0] + 5))
+    assert bridge.sequences.stats()['GKT']['syncs'] == before['syncs']
+
+    # Nummer vom CapCorn-Client: naechster Poll zeigt sie, die Vergabe springt darueber
+    db.execute("INSERT INTO GKT (gast, nacn) VALUES (?, 'Fremd')", (numbers[-1] + 10,))
+    db.commit()
+    bridge.fingerprints.poll(['GKT'])
+    assert client.post('/guest', json={"nachname": "Danach"}).get_json()['gast'] == numbers[-1] + 11
+
+
+def test_service_posts_account_line(client, db, slot):
+    booking = book(client, slot)
+    resp = client.post('/service', json={"resn": booking['resn'], "artn": 19, "prei": 25.0,
+                                         "bez1": "E-Bike"})
+    assert resp.status_code == 201
+    aknr = resp.get_json()['aknr']
+    assert tuple(db.execute("SELECT resn, prei, bez1 FROM AKZ WHERE aknr = ?", (aknr,)).fetchone()) == (
+        booking['resn'], 25.0, "E-Bike")
+
+
+def test_checkin_and_checkout(client, db, slot):
+    resn = book(client, slot)['resn']
+    assert client.put(f'/checkin/{resn}').status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND ckin = 2", (resn,)) == 1
+    assert client.put(f'/checkout/{resn}').status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND ckin = 4", (resn,)) == 1
+
+
+def test_register_and_deregister(bridge, client, db, slot):
+    booking = book(client, slot)
+    bridge.sequences.invalidate()
+    resp = client.post(f"/register/{booking['resn']}", json={
+        "zimm": booking['zimm'], "vorname": "Dora", "nachname": "Melde", "geburtsdatum": "1980-05-01"
+    })
+    assert resp.status_code == 201
+    body = resp.get_json()
+    assert count(db, "SELECT COUNT(*) FROM GKI WHERE gkid = ? AND nacn = 'Melde'", (body['gast'],)) == 1
+    assert tuple(db.execute("SELECT resn, gast, stat FROM ANM WHERE annr = ?", (body['annr'],)).fetchone()) == (
+        booking['resn'], body['gast'], 6)
+
+    assert client.put(f"/deregister/{body['annr']}").status_code == 200
+    assert count(db, "SELECT COUNT(*) FROM ANM WHERE annr = ? AND stat = 4", (body['annr'],)) == 1
+
+
+def test_meal_day_and_bulk(client, db, slot):
+    booking = book(client, slot)
+    resn = booking['resn']
+    before = count(db, "SELECT COUNT(*) FROM AKZ WHERE resn = ?", (resn,))
+
+    resp = client.post('/meal-day', json={"resn": resn, "date": booking['von'], "person": 1, "price": 30.0})
+    assert resp.status_code == 201
+    aknr = resp.get_json()['aknr']
+    assert db.execute("SELECT prei FROM AKZ WHERE aknr = ?", (aknr,)).fetchone()[0] == 30.0
+
+    resp = client.post('/meal-bulk', json={"resn": resn, "price_per_day": 30.0, "bookings": [
+        {"date": booking['von'], "person": 2, "action": "add"},
+        {"date": booking['von'], "person": 1, "action": "remove"},
+        {"date": "kein-datum", "person": 1, "action": "add"},  # wird einzeln abgelehnt
+    ]})
+    assert resp.status_code == 200
+    results = resp.get_json()['results']
+    assert [r['success'] for r in results] == [True, True, False]
+    assert count(db, "SELECT COUNT(*) FROM AKZ WHERE resn = ?", (resn,)) == before + 3
+    assert db.execute("SELECT SUM(prei) FROM AKZ WHERE resn = ? AND prei IN (30, -30)",
+                      (resn,)).fetchone()[0] == 30.0
+
+
+def test_room_number_as_string_is_normalized(bridge, client, db, slot):
+    zimm, von, bis = slot()
+    resp = client.post('/option', json={"zimm": str(zimm), "von": von, "bis": bis})
+    assert resp.status_code == 201
+    resn = resp.get_json()['resn']
+    assert bridge.availability_index.conflicts(zimm, von, bis) == [resn]
+    assert count(db, "SELECT COUNT(*) FROM BUZ WHERE resn = ? AND zimm = ?", (resn, zimm)) == 1
+
+    assert client.post('/block', json={"zimm": zimm, "von": von, "bis": bis}).status_code == 409
+    assert client.post('/option', json={"zimm": "A1", "von": von, "bis": bis}).status_code == 400
+
+
+def test_fingerprints_see_swapped_rooms_and_moved_lines(bridge, client, db, slot):
+    first, second = book(client, slot), book(client, slot)
+    before = {table: bridge.fingerprints.compute(table) for table in ('BUZ', 'AKZ')}
+
+    # Wie der CapCorn-Client: Zimmer tauschen, Kontozeile umhaengen - Anzahl,
+    # MAX und einfache Summen bleiben gleich
+    db.execute("UPDATE BUZ SET zimm = ? WHERE resn = ?", (second['zimm'], first['resn']))
+    db.execute("UPDATE BUZ SET zimm = ? WHERE resn = ?", (first['zimm'], second['resn']))
+    aknr = db.execute("SELECT MIN(aknr) FROM AKZ WHERE resn = ?", (first['resn'],)).fetchone()[0]
+    db.execute("UPDATE AKZ SET resn = ? WHERE aknr = ?", (second['resn'], aknr))
+    db.commit()
+    try:
+        for table in ('BUZ', 'AKZ'):
+            assert bridge.fingerprints.compute(table) != before[table]
+    finally:
+        db.execute("UPDATE BUZ SET zimm = ? WHERE resn = ?", (first['zimm'], first['resn']))
+        db.execute("UPDATE BUZ SET zimm = ? WHERE resn = ?", (second['zimm'], second['resn']))
+        db.execute("UPDATE AKZ SET resn = ? WHERE aknr = ?", (first['resn'], aknr))
+        db.commit()